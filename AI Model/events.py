@@ -0,0 +1,186 @@
+import base64
+import json
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+import cv2
+import paho.mqtt.client as mqtt
+
+# --- EVENT LOG CONFIG ---
+EVENT_DB_PATH = "events.db"
+MAX_EVENTS = 5000            # Ring buffer size; oldest events are overwritten
+THUMBNAIL_SIZE = 96          # Square centre crop, pixels (0: no thumbnails)
+THUMBNAIL_QUALITY = 60
+UPLOAD_BATCH_EVENTS = 50     # Upload once this many events are waiting...
+UPLOAD_BATCH_BYTES = 64 * 1024   # ...or they add up to this many bytes...
+UPLOAD_INTERVAL = 60.0       # ...or the oldest has waited this many seconds
+PUBLISH_TIMEOUT = 10.0
+QUEUE_SIZE = 1000
+
+
+class EventLog:
+    """Durable log of classification decisions, uploaded in compressed batches.
+
+    `record` only puts the event on a queue, so the classification loop never
+    waits on disk or network. A background thread owns the SQLite file: it
+    stores each event (with an optional JPEG thumbnail) in a fixed-size ring,
+    and publishes what is not yet uploaded to `smartbin/<device>/events` as
+    zlib-compressed JSON batches of at most `batch_events` events and
+    `batch_bytes` bytes, once enough has piled up or the oldest event is old
+    enough. The upload cursor only moves after the broker acks the batch
+    (QoS 1), so events logged while offline go out when the connection is back.
+    """
+
+    def __init__(self, device_id, host, port=1883, path=EVENT_DB_PATH, max_events=MAX_EVENTS,
+                 thumbnail_size=THUMBNAIL_SIZE, batch_events=UPLOAD_BATCH_EVENTS,
+                 batch_bytes=UPLOAD_BATCH_BYTES, interval=UPLOAD_INTERVAL):
+        self.device_id = device_id
+        self.topic = f"smartbin/{device_id}/events"
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_events = max_events
+        self.thumbnail_size = thumbnail_size
+        self.batch_events = batch_events
+        self.batch_bytes = batch_bytes
+        self.interval = interval
+
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread = None
+        self._client = None
+        self.dropped = 0
+        self.uploaded = 0
+        self.batches = 0
+
+    # --- MAIN LOOP SIDE ---
+    def record(self, event, frame=None):
+        """Queue one decision; `frame` is only used for the thumbnail."""
+        event = dict(event, device_id=self.device_id, ts=event.get("ts", time.time()))
+        try:
+            self._queue.put_nowait((event, frame if self.thumbnail_size else None))
+        except queue.Full:
+            self.dropped += 1
+
+    # --- STORAGE ---
+    def _open(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS events ("
+                   "id INTEGER PRIMARY KEY, ts REAL, body TEXT, thumbnail BLOB)")
+        db.execute("CREATE TABLE IF NOT EXISTS upload_state (key TEXT PRIMARY KEY, value INTEGER)")
+        db.execute("INSERT OR IGNORE INTO upload_state VALUES ('uploaded_id', 0)")
+        db.commit()
+        return db
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        side = min(h, w)
+        top, left = (h - side) // 2, (w - side) // 2
+        crop = cv2.resize(frame[top:top + side, left:left + side], (self.thumbnail_size, self.thumbnail_size),
+                          interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", crop, [int(cv2.IMWRITE_JPEG_QUALITY), THUMBNAIL_QUALITY])
+        return jpeg.tobytes() if ok else None
+
+    def _store(self, db, items):
+        rows = []
+        for event, frame in items:
+            thumbnail = self._thumbnail(frame) if frame is not None else None
+            rows.append((event["ts"], json.dumps(event), thumbnail))
+        db.executemany("INSERT INTO events (ts, body, thumbnail) VALUES (?, ?, ?)", rows)
+        # Ring buffer: ids only grow, so everything below the newest max_events goes
+        db.execute("DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (self.max_events,))
+        db.commit()
+
+    def _pending(self, db):
+        uploaded_id = db.execute("SELECT value FROM upload_state WHERE key = 'uploaded_id'").fetchone()[0]
+        count, size, oldest = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(body) + COALESCE(LENGTH(thumbnail), 0)), 0), MIN(ts) "
+            "FROM events WHERE id > ?", (uploaded_id,)).fetchone()
+        return uploaded_id, count, size, oldest
+
+    # --- UPLOAD ---
+    def _connect(self):
+        self._client = mqtt.Client()
+        self._client.connect_async(self.host, self.port, 60)
+        self._client.loop_start()
+
+    def _upload(self, db, uploaded_id):
+        rows = db.execute("SELECT id, body, thumbnail FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                          (uploaded_id, self.batch_events)).fetchall()
+        if not rows or not self._client.is_connected():
+            return False
+        # Stop at batch_bytes (measured like _pending), but always send at least one event
+        size = 0
+        for n, (_, body, thumbnail) in enumerate(rows):
+            size += len(body) + (len(thumbnail) if thumbnail is not None else 0)
+            if size > self.batch_bytes and n:
+                rows = rows[:n]
+                break
+        events = []
+        for _, body, thumbnail in rows:
+            event = json.loads(body)
+            if thumbnail is not None:
+                event["thumbnail_jpeg"] = base64.b64encode(thumbnail).decode("ascii")
+            events.append(event)
+        payload = zlib.compress(json.dumps(events, separators=(",", ":")).encode("utf-8"))
+        info = self._client.publish(self.topic, payload, qos=1)
+        info.wait_for_publish(PUBLISH_TIMEOUT)
+        if not info.is_published():
+            return False
+        db.execute("UPDATE upload_state SET value = ? WHERE key = 'uploaded_id'", (rows[-1][0],))
+        db.commit()
+        self.uploaded += len(rows)
+        self.batches += 1
+        return True
+
+    def _run(self):
+        db = self._open()
+        self._connect()
+        while not self._stop.is_set():
+            try:
+                items = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                items = []
+            while len(items) < self.batch_events:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if items:
+                    self._store(db, items)
+                uploaded_id, count, size, oldest = self._pending(db)
+                if count and (count >= self.batch_events or size >= self.batch_bytes
+                              or time.time() - oldest >= self.interval or self._stop.is_set()):
+                    # Drain a backlog (e.g. after an outage) one batch at a time
+                    while self._upload(db, uploaded_id) and not self._stop.is_set():
+                        uploaded_id, count, size, oldest = self._pending(db)
+                        if count < self.batch_events and size < self.batch_bytes:
+                            break
+            except Exception as e:
+                print(f"Event log error: {e}")
+        # Whatever is still queued at shutdown is kept for the next run's upload
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        if items:
+            self._store(db, items)
+        db.close()
+        self._client.loop_stop()
+        self._client.disconnect()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+        print(f"Logging decisions to {self.path}, uploading to {self.topic}")
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -1,10 +1,15 @@
 import cv2
+import json
+import mmap
 import numpy as np
 import serial
 import time
 import RPi.GPIO as GPIO 
 from threading import Thread, Lock
 from collections import Counter 
+from concurrent.futures import ThreadPoolExecutor
+from events import EventLog
+from preview import PreviewServer, PREVIEW_PORT, PREVIEW_FPS
 
 # --- AI LIBRARY ---
 try:
@@ -23,40 +28,130 @@ CAMERA_HEIGHT = 480
 CAMERA_FPS = 30
 VERIFICATION_SAMPLES = 5 # Number of votes
 
+# --- PREVIEW CONFIG ---
+# No local window: the annotated camera view is served as MJPEG on PREVIEW_HOST:PREVIEW_PORT (set in preview.py)
+
+# --- EVENT LOG CONFIG ---
+# Every verification is logged locally (events.db) and uploaded in batches
+DEVICE_ID = "bin01"                # Same id as the ESP32 this Pi drives
+MQTT_HOST = "136.110.20.249"
+MQTT_PORT = 1883
+
 # --- ULTRASONIC CONFIG ---
 TRIG_PIN = 23
 ECHO_PIN = 24
 DISTANCE_THRESHOLD = 20 
 
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(TRIG_PIN, GPIO.OUT)
-GPIO.setup(ECHO_PIN, GPIO.IN)
+# --- STARTUP ---
+# The slow pieces (model, camera, serial) are independent, so they come up in
+# parallel and the interpreter is warmed up on a dummy tensor before we report
+# ready. Phase timings are printed and appended to STARTUP_LOG_PATH.
+STARTUP_LOG_PATH = "startup_log.jsonl"
+
+def timed(timings, name, fn):
+    t = time.perf_counter()
+    result = fn()
+    timings[name] = time.perf_counter() - t
+    return result
+
+def setup_gpio():
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(TRIG_PIN, GPIO.OUT)
+    GPIO.setup(ECHO_PIN, GPIO.IN)
 
 # --- SERIAL SETUP ---
-try:
-    ser = serial.Serial("/dev/serial0", 115200, timeout=1)
-    print("Serial Communication with Maker Feather Enabled")
-except:
-    print("Serial Error: Check if Serial is enabled in raspi-config")
-    ser = None
+def open_serial():
+    try:
+        port = serial.Serial("/dev/serial0", 115200, timeout=1)
+        print("Serial Communication with Maker Feather Enabled")
+        return port
+    except:
+        print("Serial Error: Check if Serial is enabled in raspi-config")
+        return None
 
 # --- LOAD AI MODEL ---
-interpreter = Interpreter(model_path=MODEL_PATH)
-interpreter.allocate_tensors()
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-height, width = input_details[0]['shape'][1], input_details[0]['shape'][2]
+def prefetch_model():
+    # TFLite maps the model file itself; asking the kernel to read it ahead
+    # means those pages are already cached by the time the interpreter loads
+    with open(MODEL_PATH, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                mm.madvise(mmap.MADV_WILLNEED)
 
-with open(LABELS_PATH, 'r') as f:
-    labels = [line.strip().split(' ', 1)[-1].lower() for line in f.readlines()]
+def load_interpreter(timings):
+    interp = timed(timings, "model_load", lambda: Interpreter(model_path=MODEL_PATH))
+    timed(timings, "allocate_tensors", interp.allocate_tensors)
+    inputs = interp.get_input_details()
+    outputs = interp.get_output_details()
+
+    # Warm-up: the first invoke() pays for lazy kernel/delegate setup, so do it
+    # now on a dummy tensor instead of on the first real item
+    def warm_up():
+        dummy = np.zeros(inputs[0]['shape'], dtype=inputs[0]['dtype'])
+        interp.set_tensor(inputs[0]['index'], dummy)
+        interp.invoke()
+        interp.get_tensor(outputs[0]['index'])
+    timed(timings, "warm_up_invoke", warm_up)
+    return interp, inputs, outputs
+
+def load_labels():
+    with open(LABELS_PATH, 'r') as f:
+        return [line.strip().split(' ', 1)[-1].lower() for line in f.readlines()]
 
 # --- CAMERA SETUP ---
-cap = cv2.VideoCapture(CAMERA_INDEX)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
-cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
-# BUFFERSIZE=1 helps, but manual flushing is safer
-cap.set(cv2.CAP_PROP_BUFFERSIZE, 1) 
+def open_camera(timings):
+    camera = timed(timings, "camera_open", lambda: cv2.VideoCapture(CAMERA_INDEX))
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+    camera.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+    # BUFFERSIZE=1 helps, but manual flushing is safer
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    # First frame is slow (sensor start / auto exposure); take it now
+    timed(timings, "camera_first_frame", camera.read)
+    return camera
+
+def system_uptime():
+    try:
+        with open("/proc/uptime", 'r') as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError):
+        return None
+
+def startup():
+    started = time.perf_counter()
+    timings = {}
+    with ThreadPoolExecutor(max_workers=5, thread_name_prefix="startup") as pool:
+        gpio_job = pool.submit(timed, timings, "gpio", setup_gpio)
+        serial_job = pool.submit(timed, timings, "serial", open_serial)
+        prefetch_job = pool.submit(timed, timings, "model_prefetch", prefetch_model)
+        labels_job = pool.submit(timed, timings, "labels", load_labels)
+        camera_job = pool.submit(timed, timings, "camera", lambda: open_camera(timings))
+        try:
+            prefetch_job.result()
+        except OSError as e:
+            print(f"Model prefetch skipped: {e}")
+        interp, inputs, outputs = timed(timings, "interpreter", lambda: load_interpreter(timings))
+        gpio_job.result()
+        port = serial_job.result()
+        label_list = labels_job.result()
+        camera = camera_job.result()
+
+    timings["time_to_ready"] = time.perf_counter() - started
+    record = {
+        "ready_at": time.time(),
+        "uptime_at_ready": system_uptime(),
+        "phases": {name: round(secs, 4) for name, secs in timings.items()},
+    }
+    print("Startup timings: " + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items()))
+    try:
+        with open(STARTUP_LOG_PATH, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not write {STARTUP_LOG_PATH}: {e}")
+    return port, interp, inputs, outputs, label_list, camera
+
+ser, interpreter, input_details, output_details, labels, cap = startup()
+height, width = input_details[0]['shape'][1], input_details[0]['shape'][2]
 
 print(f"System Ready. Waiting for object within {DISTANCE_THRESHOLD}cm...")
 
@@ -70,6 +165,19 @@ current_display_color = (255, 255, 255)
 sensor_status_text = "Checking..."
 sensor_status_color = (200, 200, 200)
 
+# --- PREVIEW OVERLAY ---
+# Drawn by the preview thread, only on the frames it actually encodes
+def draw_overlay(frame, overlay):
+    label, label_color, status_text, status_color = overlay
+    cv2.rectangle(frame, (0, 0), (640, 80), (0, 0, 0), -1) 
+    cv2.putText(frame, f"ITEM: {label}", (10, 50), 
+                cv2.FONT_HERSHEY_SIMPLEX, 1.2, label_color, 2)
+    cv2.putText(frame, status_text, (10, 450), 
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+
+preview = PreviewServer(draw_overlay, PREVIEW_PORT, PREVIEW_FPS).start()
+event_log = EventLog(DEVICE_ID, MQTT_HOST, MQTT_PORT).start()
+
 def trigger_bin_serial(label):
     if ser:
         print(f">>> SENDING TO ESP32: {label}")
@@ -114,8 +222,11 @@ def classify_frame(frame):
     return name, confidence
 
 # --- UPDATED FUNCTION: VERIFY ITEM (WITH BUFFER FLUSH) ---
-def verify_item_and_get_winner():
+def verify_item_and_get_winner(dist=None):
+    started = time.time()
     votes = []
+    samples = []
+    sample_frame = None
     print("--- Starting Verification Loop ---")
     
     # *** FIX: FLUSH THE BUFFER ***
@@ -128,7 +239,11 @@ def verify_item_and_get_winner():
         ret, frame = cap.read()
         if not ret: continue
         
+        t0 = time.perf_counter()
         name, confidence = classify_frame(frame)
+        samples.append({"label": name, "confidence": round(float(confidence), 4),
+                        "ms": round((time.perf_counter() - t0) * 1000, 1)})
+        sample_frame = frame
         
         # Log every vote
         print(f"  Sample {i+1}: {name.upper()} ({confidence*100:.1f}%)")
@@ -136,83 +251,89 @@ def verify_item_and_get_winner():
         if name != "background" and confidence >= THRESHOLD:
             votes.append(name)
             
-    if not votes:
-        return None 
-        
     # Count votes
     vote_counts = Counter(votes)
-    winner, count = vote_counts.most_common(1)[0]
+    winner, count = vote_counts.most_common(1)[0] if votes else (None, 0)
     
     # Require at least 2 or 3 matching votes to be sure
     if count >= 2:
         print(f"--- Winner: {winner.upper()} ({count}/{VERIFICATION_SAMPLES}) ---")
-        return winner
-    else:
+        outcome = "accepted"
+    elif votes:
         print(f"--- Winner: {winner.upper()} (REJECTED: Only {count} votes) ---")
-        return None
+        outcome = "rejected"
+    else:
+        outcome = "no_votes"
+
+    # Queued only; stored and uploaded by the event log thread
+    event_log.record({
+        "ts": started,
+        "outcome": outcome,
+        "winner": winner,
+        "votes": dict(vote_counts),
+        "samples": samples,
+        "threshold": THRESHOLD,
+        "distance_cm": None if dist is None else round(dist, 1),
+        "total_ms": round((time.time() - started) * 1000, 1),
+    }, sample_frame)
+    return winner if outcome == "accepted" else None
 
 # --- MAIN LOOP ---
-while True:
-    ret, frame = cap.read()
-    if not ret: 
-        continue
+try:
+    while True:
+        ret, frame = cap.read()
+        if not ret: 
+            continue
 
-    # 1. ULTRASONIC CHECK
-    try:
-        dist = get_distance()
-    except:
-        dist = 100
+        # 1. ULTRASONIC CHECK
+        try:
+            dist = get_distance()
+        except:
+            dist = 100
 
-    if dist < DISTANCE_THRESHOLD and dist > 2:
-        object_detected = True 
-        sensor_status_text = f"STATUS: DETECTED ({int(dist)}cm)"
-        sensor_status_color = (0, 0, 255) # Red
-    else:
-        object_detected = False
-        sensor_status_text = f"STATUS: CLEAR ({int(dist)}cm)"
-        sensor_status_color = (0, 255, 0) # Green
+        if dist < DISTANCE_THRESHOLD and dist > 2:
+            object_detected = True 
+            sensor_status_text = f"STATUS: DETECTED ({int(dist)}cm)"
+            sensor_status_color = (0, 0, 255) # Red
+        else:
+            object_detected = False
+            sensor_status_text = f"STATUS: CLEAR ({int(dist)}cm)"
+            sensor_status_color = (0, 255, 0) # Green
 
-    current_time = time.time()
-    
-    # 2. TRIGGER LOGIC (With Voting)
-    if object_detected and (current_time - last_classification_time > CLASSIFICATION_COOLDOWN):
+        current_time = time.time()
         
-        current_display_label = "VERIFYING..."
-        current_display_color = (0, 255, 255) # Yellow
-        
-        # Force UI update
-        cv2.putText(frame, f"ITEM: {current_display_label}", (10, 50), 
-                cv2.FONT_HERSHEY_SIMPLEX, 1.2, current_display_color, 2)
-        cv2.imshow("Smart Bin AI", frame)
-        cv2.waitKey(1) 
-        
-        # --- START VOTING PROCESS ---
-        final_decision = verify_item_and_get_winner()
-        
-        if final_decision:
-            current_display_label = final_decision.upper()
-            current_display_color = (0, 255, 0) # Green
+        # 2. TRIGGER LOGIC (With Voting)
+        if object_detected and (current_time - last_classification_time > CLASSIFICATION_COOLDOWN):
             
-            trigger_bin_serial(final_decision)
-            last_classification_time = time.time()
+            current_display_label = "VERIFYING..."
+            current_display_color = (0, 255, 255) # Yellow
             
-        else:
-            current_display_label = "UNCERTAIN"
-            current_display_color = (0, 0, 255)
-            last_classification_time = time.time()
-
-    # 3. VISUAL FEEDBACK
-    cv2.rectangle(frame, (0, 0), (640, 80), (0, 0, 0), -1) 
-    cv2.putText(frame, f"ITEM: {current_display_label}", (10, 50), 
-                cv2.FONT_HERSHEY_SIMPLEX, 1.2, current_display_color, 2)
-    
-    cv2.putText(frame, sensor_status_text, (10, 450), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, sensor_status_color, 2)
-
-    cv2.imshow("Smart Bin AI", frame)
-
-    if cv2.waitKey(1) == ord('q'): break
+            # Let the preview show VERIFYING while the votes are taken
+            preview.submit(frame, (current_display_label, current_display_color,
+                                   sensor_status_text, sensor_status_color))
+            
+            # --- START VOTING PROCESS ---
+            final_decision = verify_item_and_get_winner(dist)
+            
+            if final_decision:
+                current_display_label = final_decision.upper()
+                current_display_color = (0, 255, 0) # Green
+                
+                trigger_bin_serial(final_decision)
+                last_classification_time = time.time()
+                
+            else:
+                current_display_label = "UNCERTAIN"
+                current_display_color = (0, 0, 255)
+                last_classification_time = time.time()
 
-cap.release()
-cv2.destroyAllWindows()
-GPIO.cleanup()
+        # 3. VISUAL FEEDBACK (hand the frame to the preview thread; no drawing here)
+        preview.submit(frame, (current_display_label, current_display_color,
+                               sensor_status_text, sensor_status_color))
+except KeyboardInterrupt:
+    pass
+finally:
+    preview.stop()
+    event_log.stop()
+    cap.release()
+    GPIO.cleanup()
@@ -0,0 +1,168 @@
+"""Headless MJPEG preview of the annotated camera view, for a Pi with no display.
+
+`model.py` hands `PreviewServer` its latest frame and overlay state; browsers
+on `http://<PREVIEW_HOST>:PREVIEW_PORT/` get the annotated stream at PREVIEW_FPS.
+The stream has no authentication, so by default it is only served on the Pi's
+loopback interface; watch it through an SSH tunnel
+(`ssh -L 8080:localhost:8080 pi@<pi-address>`), or set PREVIEW_HOST to
+"0.0.0.0" to serve it to the whole network.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+# --- PREVIEW CONFIG ---
+PREVIEW_HOST = "127.0.0.1"   # "0.0.0.0" opts in to serving every interface, unauthenticated
+PREVIEW_PORT = 8080
+PREVIEW_FPS = 5
+JPEG_QUALITY = 70
+BOUNDARY = "frame"
+
+PAGE = b"""<html><head><title>Smart Bin Camera</title></head>
+<body style="margin:0;background:#111"><img src="/stream.mjpg" style="width:100%"></body></html>"""
+
+
+class PreviewServer:
+    """Serves the camera as MJPEG over HTTP without slowing the classification loop.
+
+    The main loop only hands over its latest frame and overlay state (`submit`),
+    which is a reference swap. A separate thread wakes PREVIEW_FPS times a second,
+    and only while someone is watching draws the overlay on a copy of the newest
+    frame and JPEG-encodes it; every viewer gets that same encoded frame. A new
+    viewer waits for a frame encoded after it connected, never a cached one.
+    """
+
+    def __init__(self, draw, port=PREVIEW_PORT, fps=PREVIEW_FPS, quality=JPEG_QUALITY, host=PREVIEW_HOST):
+        self.draw = draw
+        self.host = host
+        self.port = port
+        self.interval = 1.0 / fps
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self._overlay = None
+        self._seq = 0
+        self._encoded_seq = 0
+
+        self._jpeg_ready = threading.Condition()
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self.viewers = 0
+        self.encoded = 0
+        self._stop = threading.Event()
+        self._server = None
+
+    # --- MAIN LOOP SIDE ---
+    def submit(self, frame, overlay):
+        with self._lock:
+            self._frame = frame
+            self._overlay = overlay
+            self._seq += 1
+
+    # --- ENCODER ---
+    def _encode_loop(self):
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            next_at += self.interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_at = time.monotonic()  # Fell behind; don't try to catch up
+            if self.viewers == 0:
+                continue
+            with self._lock:
+                if self._frame is None or self._seq == self._encoded_seq:
+                    continue
+                frame, overlay, seq = self._frame, self._overlay, self._seq
+            # Draw on a copy so the main loop's frame is never touched
+            image = frame.copy()
+            self.draw(image, overlay)
+            ok, jpeg = cv2.imencode(".jpg", image, self.params)
+            if not ok:
+                continue
+            self._encoded_seq = seq
+            self.encoded += 1
+            with self._jpeg_ready:
+                self._jpeg = jpeg.tobytes()
+                self._jpeg_seq += 1
+                self._jpeg_ready.notify_all()
+
+    def next_jpeg(self, last_seq, timeout=5.0):
+        with self._jpeg_ready:
+            self._jpeg_ready.wait_for(lambda: self._jpeg_seq != last_seq or self._stop.is_set(), timeout)
+            return self._jpeg, self._jpeg_seq
+
+    # --- HTTP ---
+    def _add_viewer(self, delta):
+        """Sequence number of the newest JPEG, which a new viewer must not be sent."""
+        with self._lock:
+            self.viewers += delta
+            idle = self.viewers == 0
+            if idle:
+                self._encoded_seq = 0   # Encode the current frame again for the next viewer
+        with self._jpeg_ready:
+            if idle:
+                self._jpeg = None       # Drop the cached frame rather than serve it stale later
+            return self._jpeg_seq
+
+    def _handler(self):
+        preview = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(PAGE)))
+                    self.end_headers()
+                    self.wfile.write(PAGE)
+                elif self.path == "/stream.mjpg":
+                    self.stream()
+                else:
+                    self.send_error(404)
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache, private")
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.end_headers()
+                seq = preview._add_viewer(1)
+                try:
+                    while not preview._stop.is_set():
+                        jpeg, new_seq = preview.next_jpeg(seq)
+                        if jpeg is None or new_seq == seq:
+                            continue
+                        seq = new_seq
+                        self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    preview._add_viewer(-1)
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="preview-http", daemon=True).start()
+        threading.Thread(target=self._encode_loop, name="preview-encode", daemon=True).start()
+        host = "<pi-address>" if self.host in ("", "0.0.0.0") else self.host
+        print(f"Camera preview on http://{host}:{self.port}/ ({1 / self.interval:.0f} FPS)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._jpeg_ready:
+            self._jpeg_ready.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
@@ -4,6 +4,7 @@
 #include <WiFi.h>
 #include <PubSubClient.h>
 #include <ArduinoJson.h>
+#include <Preferences.h>
 
 // --- NETWORK CONFIG ---
 const char* ssid = "munir";           
@@ -12,12 +13,17 @@ const char* password = "munirmunir";
 // --- GCP VM CONFIG ---
 const char* mqtt_server = "136.110.20.249";
 const int mqtt_port = 1883;
+const char* device_id = "bin01";
 const char* mqtt_topic = "smartbin/bin01/data";
+const char* cmd_topic = "smartbin/bin01/cmd";       // Commands for this bin (see commands.py)
+const char* broadcast_topic = "smartbin/all/cmd";   // Commands for every bin
+const char* ack_topic = "smartbin/bin01/ack";
 
 // --- OBJECTS ---
 WiFiClient espClient;
 PubSubClient client(espClient);
 TinyGPSPlus gps;
+Preferences prefs;
 
 // ---------------- Servos ----------------
 Servo paperServo;
@@ -32,7 +38,7 @@ const int METAL_PIN = 8;
 const int LED_PIN = 14;
 const int TRIG_PIN = 4;
 const int ECHO_PIN = 5;
-const long DISTANCE_THRESHOLD_CM = 10;
+long DISTANCE_THRESHOLD_CM = 10;   // Changeable with set_threshold; kept in flash
 
 // ---------------- UARTs ----------------
 // UART1 for Raspberry Pi Communication (RX=16, TX=15)
@@ -52,6 +58,28 @@ long lastDistance = -1;
 String lastDetectedItem = "None";
 unsigned long lastMsgTime = 0;
 
+// Every telemetry message is numbered (boot, seq), so the cloud can tell a
+// redelivered message from a new one
+unsigned long bootId = 0;
+unsigned long msgSeq = 0;
+
+// Disposals waiting to be reported, oldest first. Each one rides on its own
+// telemetry message, so the cloud logs every servo action explicitly instead
+// of guessing from last_item changes. If the queue overflows the oldest is
+// dropped, which shows up as a gap in servo_seq.
+const int SERVO_QUEUE_LEN = 8;
+unsigned long servoSeq = 0;
+String servoQueueItem[SERVO_QUEUE_LEN];
+bool servoQueueOpened[SERVO_QUEUE_LEN];
+unsigned long servoQueueSeq[SERVO_QUEUE_LEN];
+int servoQueueHead = 0;
+int servoQueueCount = 0;
+
+// Downlink command waiting to run (set from the MQTT callback, run from loop())
+String pendingCmdId = "";
+String pendingCmd = "";
+String pendingArg = "";
+
 // --- WIFI SETUP ---
 void setup_wifi() {
   delay(10);
@@ -75,6 +103,8 @@ void reconnect() {
 
     if (client.connect(clientId.c_str())) {
       Serial.println("connected");
+      client.subscribe(cmd_topic, 1);
+      client.subscribe(broadcast_topic, 1);
     } else {
       Serial.print("failed, rc=");
       Serial.print(client.state());
@@ -97,12 +127,28 @@ long readDistanceCM() {
   return duration * 0.034 / 2;
 }
 
+// --- SERVO EVENT QUEUE ---
+void queueServoEvent(const String& item, bool opened) {
+  servoSeq++;
+  if (servoQueueCount == SERVO_QUEUE_LEN) {
+    servoQueueHead = (servoQueueHead + 1) % SERVO_QUEUE_LEN;
+    servoQueueCount--;
+  }
+  int tail = (servoQueueHead + servoQueueCount) % SERVO_QUEUE_LEN;
+  servoQueueItem[tail] = item;
+  servoQueueOpened[tail] = opened;
+  servoQueueSeq[tail] = servoSeq;
+  servoQueueCount++;
+}
+
 // --- SEND DATA TO GCP VM ---
 void sendTelemetry() {
   if (!client.connected()) reconnect();
   
-  StaticJsonDocument<256> doc;
-  doc["device_id"] = "bin01";
+  StaticJsonDocument<384> doc;
+  doc["device_id"] = device_id;
+  doc["boot_id"] = bootId;
+  doc["seq"] = ++msgSeq;
   doc["waste_level_cm"] = lastDistance;
   doc["is_full"] = paperBinFull;
   doc["last_item"] = lastDetectedItem;
@@ -115,12 +161,108 @@ void sendTelemetry() {
     doc["gps_lng"] = 0.0;
   }
 
-  char buffer[256];
+  if (servoQueueCount > 0) {
+    doc["servo_seq"] = servoQueueSeq[servoQueueHead];
+    doc["servo_item"] = servoQueueItem[servoQueueHead];
+    doc["servo_opened"] = servoQueueOpened[servoQueueHead];
+  } else {
+    doc["servo_seq"] = servoSeq;
+  }
+
+  char buffer[384];
   serializeJson(doc, buffer);
-  client.publish(mqtt_topic, buffer);
+  if (client.publish(mqtt_topic, buffer) && servoQueueCount > 0) {
+    // Kept for the next message if this one didn't go out
+    servoQueueHead = (servoQueueHead + 1) % SERVO_QUEUE_LEN;
+    servoQueueCount--;
+  }
   Serial.println("[MQTT SEND] " + String(buffer));
 }
 
+// --- DOWNLINK COMMANDS ---
+// Acks echo the command id so the bridge can match them and time the round trip
+void sendAck(const String &id, bool ok, const char* error) {
+  StaticJsonDocument<192> doc;
+  doc["id"] = id;
+  doc["device_id"] = device_id;
+  doc["ok"] = ok;
+  if (error != nullptr) doc["error"] = error;
+  doc["threshold_cm"] = DISTANCE_THRESHOLD_CM;
+
+  char buffer[192];
+  serializeJson(doc, buffer);
+  client.publish(ack_topic, buffer);
+  Serial.println("[MQTT ACK] " + String(buffer));
+}
+
+// Called from client.loop(), which also runs inside smartDelay() while a lid is
+// open, so commands are only queued here and executed from loop()
+void onMqttMessage(char* topic, byte* payload, unsigned int length) {
+  StaticJsonDocument<256> doc;
+  if (deserializeJson(doc, payload, length)) return;
+
+  String id = doc["id"] | "";
+  if (id.length() == 0) return;
+  if (pendingCmdId.length() > 0) {
+    sendAck(id, false, "busy");
+    return;
+  }
+  pendingCmdId = id;
+  pendingCmd = doc["cmd"] | "";
+  pendingArg = doc["args"]["bin"] | "";
+  if (doc["args"].containsKey("distance_cm")) {
+    pendingArg = String((long)doc["args"]["distance_cm"]);
+  }
+}
+
+void processCommand() {
+  if (pendingCmdId.length() == 0) return;
+  String id = pendingCmdId;
+  String cmd = pendingCmd;
+  String arg = pendingArg;
+  pendingCmdId = "";
+  Serial.println("[Cloud Command] " + cmd + " " + arg);
+
+  if (cmd == "ping") {
+    sendAck(id, true, nullptr);
+  }
+  else if (cmd == "send_telemetry") {
+    sendTelemetry();
+    sendAck(id, true, nullptr);
+  }
+  else if (cmd == "set_threshold") {
+    long value = arg.toInt();
+    if (value < 2 || value > 100) {
+      sendAck(id, false, "out of range");
+      return;
+    }
+    DISTANCE_THRESHOLD_CM = value;
+    prefs.putLong("threshold", value);
+    if (lastDistance > 0) {
+      paperBinFull = (lastDistance < DISTANCE_THRESHOLD_CM);
+      digitalWrite(LED_PIN, paperBinFull ? HIGH : LOW);
+    }
+    sendAck(id, true, nullptr);
+    sendTelemetry();
+  }
+  else if (cmd == "open_lid") {
+    // Maintenance unlock: opens even when the paper bin is full
+    Servo* servo = nullptr;
+    if (arg == "paper") servo = &paperServo;
+    else if (arg == "glass") servo = &glassServo;
+    else if (arg == "aluminium") servo = &metalServo;
+    if (servo == nullptr) {
+      sendAck(id, false, "unknown bin");
+      return;
+    }
+    sendAck(id, true, nullptr);   // Ack before the 4 s open so RTT measures the channel
+    openServo(*servo);
+  }
+  else {
+    sendAck(id, false, "unknown command");
+  }
+}
+
 // --- HELPER: SMART DELAY ---
 // Keeps MQTT alive and reads GPS while waiting for Servo
 void smartDelay(unsigned long ms) {
@@ -173,9 +315,17 @@ void setup() {
   pinMode(TRIG_PIN, OUTPUT);
   pinMode(ECHO_PIN, INPUT);
 
+  // Threshold set from the dashboard survives reboots
+  prefs.begin("smartbin", false);
+  DISTANCE_THRESHOLD_CM = prefs.getLong("threshold", DISTANCE_THRESHOLD_CM);
+  bootId = prefs.getULong("boot", 0) + 1;
+  prefs.putULong("boot", bootId);
+
   // Connection
   setup_wifi();
   client.setServer(mqtt_server, mqtt_port);
+  client.setBufferSize(512);
+  client.setCallback(onMqttMessage);
   
   Serial.println("=== ESP32 Smart Bin (GCP VM) System Ready ===");
 }
@@ -184,6 +334,7 @@ void setup() {
 void loop() {
   if (!client.connected()) reconnect();
   client.loop();
+  processCommand();
 
   // 1. Process GPS Data (Continuous)
   while (GPSSerial.available() > 0) {
@@ -222,9 +373,11 @@ void loop() {
       lastDetectedItem = command;
       Serial.println("[Pi Command] Detected: " + command);
 
+      bool opened = false;
       if (command == "paper") {
         if (!paperBinFull) {
           openServo(paperServo);
+          opened = true;
         } else {
           Serial.println("Paper bin FULL. Servo locked.");
           sendTelemetry(); 
@@ -232,9 +385,15 @@ void loop() {
       }
       else if (command == "glass") {
         openServo(glassServo);
+        opened = true;
       }
       else if (command == "aluminium") {
         openServo(metalServo);
+        opened = true;
+      }
+
+      if (command == "paper" || command == "glass" || command == "aluminium") {
+        queueServoEvent(command, opened);
       }
   
       // Send immediate update to Cloud after an item is dropped
@@ -244,4 +403,12 @@ void loop() {
       command += c;
     }
   }
+
+  // 4. Report disposals still queued (several in quick succession, or a failed publish)
+  static unsigned long lastServoRetry = 0;
+  if (servoQueueCount > 0 && millis() - lastServoRetry > 1000) {
+    lastServoRetry = millis();
+    sendTelemetry();
+    lastMsgTime = millis();
+  }
 }
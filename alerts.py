@@ -0,0 +1,345 @@
+"""Streaming alert engine: telemetry in, deduplicated alert events out.
+
+Runs next to `ingest.py` on its own subscription to `smartbin-readings` and keeps
+a small state per device, updated with every reading:
+
+- `full` / `warning` – distance thresholds, cleared only once the reading is
+  HYSTERESIS_CM back above the threshold so a bin sitting on the line doesn't flap;
+- `full_soon` – an exponentially weighted fill rate projects when the bin will be
+  full; raised under `full_soon_hours`, cleared above FULL_SOON_CLEAR_FACTOR times that;
+- `offline` – no reading for STALE_AFTER seconds, checked on a timer.
+
+Only state changes produce events. Each alert is one document in `alerts`, keyed
+by device, rule and the time it was raised, created when it is raised and
+updated when it clears, so redelivered messages and restarts never duplicate an
+alert. The dashboard just reads the active ones; a heartbeat in
+`engine_status/alerts` tells it the engine is up and which threshold and horizon
+it projects to, so the page only shows its "full soon" alerts when they match the
+sidebar's. The defaults are the sidebar's (see `analytics.FULL_CM`).
+
+    python alerts.py                  # run the engine
+    python alerts.py --full-cm 8      # different thresholds
+"""
+import argparse
+import math
+import os
+import threading
+import time
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import pubsub_v1
+
+import analytics
+import ingest
+import queries
+from forecast import EMPTY_DROP_CM
+
+
+# --- RULE CONFIG ---
+FULL_CM = analytics.FULL_CM   # Dashboard defaults for "Full" / "Warning" thresholds
+WARNING_CM = analytics.WARNING_CM
+HYSTERESIS_CM = 2
+RATE_TAU_S = 1800.0           # Time constant of the fill-rate average
+MIN_RATE_CM_PER_HOUR = 0.05
+FULL_SOON_HOURS = analytics.FORECAST_HORIZON_HOURS
+FULL_SOON_CLEAR_FACTOR = 1.5
+STALE_AFTER_S = 300.0         # Firmware reports at least every 10 s while powered
+
+SEVERITY = {"full": "critical", "warning": "warning", "full_soon": "warning", "offline": "warning"}
+
+# --- SERVICE CONFIG ---
+SUBSCRIPTION_ID = "smartbin-readings-alerts"
+COLLECTION = "alerts"
+STATUS_DOC = ("engine_status", "alerts")
+TICK_INTERVAL = 5.0
+FLUSH_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 30.0
+
+
+class DeviceState:
+    __slots__ = ("device_id", "timestamp", "distance", "rate", "active")
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.timestamp = None
+        self.distance = None
+        self.rate = 0.0       # cm/hour, positive while filling
+        self.active = {}      # rule -> raised_at
+
+
+def alert_id(device_id, rule, raised_at):
+    return f"{device_id}-{rule}-{int(raised_at * 1000)}"
+
+
+class AlertEngine:
+    """Per-device rule state; `observe()` and `tick()` return the events to write."""
+
+    def __init__(self, full_cm=FULL_CM, warning_cm=WARNING_CM, hysteresis_cm=HYSTERESIS_CM,
+                 stale_after=STALE_AFTER_S, full_soon_hours=FULL_SOON_HOURS):
+        self.full_cm = full_cm
+        self.warning_cm = warning_cm
+        self.hysteresis_cm = hysteresis_cm
+        self.full_soon_hours = full_soon_hours
+        self.stale_after = stale_after
+        self.devices = {}
+        self._lock = threading.Lock()
+        self.readings = 0
+        self.out_of_order = 0
+        self.events = 0
+
+    def restore(self, active_alerts):
+        """Pick up alerts that were active when the engine last stopped."""
+        with self._lock:
+            for alert in active_alerts:
+                state = self.devices.setdefault(alert["device_id"], DeviceState(alert["device_id"]))
+                state.active[alert["rule"]] = alert["raised_at"]
+
+    def observe(self, device_id, distance, timestamp):
+        with self._lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceState(device_id)
+            if state.timestamp is not None and timestamp <= state.timestamp:
+                self.out_of_order += 1
+                return []
+            self.readings += 1
+            events = []
+            if "offline" in state.active:
+                events.append(self._clear(state, "offline", timestamp))
+            if distance is None:
+                state.timestamp = timestamp
+            else:
+                self._update_rate(state, float(distance), timestamp)
+                events += self._evaluate(state, float(distance), timestamp)
+            self.events += len(events)
+            return events
+
+    def tick(self, now=None):
+        """Raise `offline` for devices that have gone quiet."""
+        now = time.time() if now is None else now
+        with self._lock:
+            events = []
+            for state in self.devices.values():
+                if state.timestamp is not None and "offline" not in state.active \
+                        and now - state.timestamp > self.stale_after:
+                    minutes = (now - state.timestamp) / 60
+                    events.append(self._raise(state, "offline", now, minutes,
+                                              f"no data for {minutes:.0f} min"))
+            self.events += len(events)
+            return events
+
+    # --- RULES ---
+    def _update_rate(self, state, distance, timestamp):
+        if state.timestamp is not None and state.distance is not None:
+            dt = timestamp - state.timestamp
+            if distance - state.distance > EMPTY_DROP_CM:
+                state.rate = 0.0  # Emptied
+            else:
+                instant = (state.distance - distance) / (dt / 3600)
+                alpha = 1 - math.exp(-dt / RATE_TAU_S)
+                state.rate += alpha * (instant - state.rate)
+        state.timestamp = timestamp
+        state.distance = distance
+
+    def _evaluate(self, state, distance, ts):
+        events = []
+        active = state.active
+        reading = f"{distance:g} cm"
+
+        full = distance <= self.full_cm if "full" not in active else distance <= self.full_cm + self.hysteresis_cm
+        warning = not full and (distance <= self.warning_cm if "warning" not in active
+                                else distance <= self.warning_cm + self.hysteresis_cm)
+
+        hours = math.inf
+        if state.rate > MIN_RATE_CM_PER_HOUR:
+            hours = max(distance - self.full_cm, 0) / state.rate
+        soon_limit = self.full_soon_hours * (FULL_SOON_CLEAR_FACTOR if "full_soon" in active else 1)
+        full_soon = not full and hours <= soon_limit
+
+        for rule, on, value, message in (
+            ("full", full, distance, reading),
+            ("warning", warning, distance, reading),
+            ("full_soon", full_soon, hours, f"full in {analytics.format_hours(hours)}"),
+        ):
+            if on and rule not in active:
+                events.append(self._raise(state, rule, ts, value, message))
+            elif not on and rule in active:
+                events.append(self._clear(state, rule, ts))
+        return events
+
+    def _raise(self, state, rule, ts, value, message):
+        state.active[rule] = ts
+        return {
+            "id": alert_id(state.device_id, rule, ts),
+            "device_id": state.device_id,
+            "rule": rule,
+            "severity": SEVERITY[rule],
+            "state": "active",
+            "value": None if math.isinf(value) else round(float(value), 2),
+            "message": message,
+            "raised_at": ts,
+        }
+
+    def _clear(self, state, rule, ts):
+        raised_at = state.active.pop(rule)
+        return {
+            "id": alert_id(state.device_id, rule, raised_at),
+            "device_id": state.device_id,
+            "rule": rule,
+            "state": "cleared",
+            "cleared_at": ts,
+        }
+
+    def active_count(self):
+        with self._lock:
+            return sum(len(s.active) for s in self.devices.values())
+
+
+class AlertWriter:
+    """Writes alert events to Firestore in small batches from a background thread."""
+
+    def __init__(self, db, engine, flush_interval=FLUSH_INTERVAL):
+        self.db = db
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_heartbeat = 0.0
+        self.written = 0
+
+    def add(self, events):
+        if not events:
+            return
+        with self._lock:
+            self._buffer.extend(events)
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="alerts-flush", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Alert write failed, retrying: {e}")
+
+    def flush(self):
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        now = time.time()
+        if not events and now - self._last_heartbeat < HEARTBEAT_INTERVAL:
+            return 0
+        batch = self.db.batch()
+        for event in events:
+            doc = {k: v for k, v in event.items() if k != "id"}
+            batch.set(self.db.collection(COLLECTION).document(event["id"]), doc, merge=True)
+        batch.set(self.db.collection(STATUS_DOC[0]).document(STATUS_DOC[1]), {
+            "heartbeat": now,
+            "devices": len(self.engine.devices),
+            "full_cm": self.engine.full_cm,
+            "full_soon_hours": self.engine.full_soon_hours,
+            "active": self.engine.active_count(),
+        })
+        try:
+            batch.commit()
+        except Exception:
+            with self._lock:
+                self._buffer[:0] = events  # Keep order; retried on the next flush
+            raise
+        self._last_heartbeat = now
+        self.written += len(events)
+        return len(events)
+
+
+def load_active(db):
+    docs = db.collection(COLLECTION).where("state", "==", "active").stream()
+    return [doc.to_dict() for doc in docs]
+
+
+def handle(engine, writer):
+    """Streaming-pull callback: evaluate one telemetry message."""
+    def callback(message):
+        if ingest.is_event(message):
+            message.ack()   # Pi classification events share the topic; nothing to evaluate
+            return
+        try:
+            device_id, status, _ = ingest.split_telemetry(message.data.decode("utf-8"),
+                                                          message.publish_time.timestamp())
+            distance = status["distance_cm"]
+            if distance is not None:
+                distance = float(distance)
+                if not math.isfinite(distance):
+                    raise ValueError(f"distance {distance}")
+        except (ValueError, TypeError, AttributeError, UnicodeDecodeError) as e:
+            print(f"Dropping malformed message {message.message_id}: {e}")
+        else:
+            writer.add(engine.observe(device_id, distance, status["timestamp"]))
+        message.ack()
+    return callback
+
+
+# --- COMMANDS ---
+def run(args):
+    if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ and not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "smart-bin-project-483011-4eaae0f99610.json"
+    db = queries.script_client()
+    engine = AlertEngine(args.full_cm, args.warning_cm, args.hysteresis_cm, args.stale_after, args.full_soon_hours)
+    engine.restore(load_active(db))
+    writer = AlertWriter(db, engine).start()
+
+    subscriber = pubsub_v1.SubscriberClient()
+    topic_path = subscriber.topic_path(args.project, ingest.TOPIC_ID)
+    subscription_path = subscriber.subscription_path(args.project, args.subscription)
+    try:
+        subscriber.create_subscription(request={"name": subscription_path, "topic": topic_path})
+    except AlreadyExists:
+        pass
+    future = subscriber.subscribe(subscription_path, callback=handle(engine, writer))
+    print(f"Evaluating alerts from {subscription_path} ({engine.active_count()} active)")
+
+    last_report = time.monotonic()
+    try:
+        while True:
+            time.sleep(TICK_INTERVAL)
+            writer.add(engine.tick())
+            if time.monotonic() - last_report >= args.report_every:
+                last_report = time.monotonic()
+                print(f"{engine.readings} readings · {len(engine.devices)} devices · "
+                      f"{engine.active_count()} active · {writer.written} events written")
+    except KeyboardInterrupt:
+        future.cancel()
+        future.result()
+        writer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate alert rules on the live telemetry stream.")
+    parser.add_argument("--project", default=queries.PROJECT_ID)
+    parser.add_argument("--subscription", default=SUBSCRIPTION_ID)
+    parser.add_argument("--full-cm", type=float, default=FULL_CM)
+    parser.add_argument("--warning-cm", type=float, default=WARNING_CM)
+    parser.add_argument("--hysteresis-cm", type=float, default=HYSTERESIS_CM)
+    parser.add_argument("--stale-after", type=float, default=STALE_AFTER_S, help="Seconds without data before 'offline'")
+    parser.add_argument("--full-soon-hours", type=float, default=FULL_SOON_HOURS,
+                        help="Raise 'full_soon' when the bin is projected full within this many hours")
+    parser.add_argument("--report-every", type=float, default=60.0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
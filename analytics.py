@@ -0,0 +1,213 @@
+"""Pure, vectorized data transforms behind the dashboard panels.
+
+Every function takes plain arrays / DataFrames and returns new objects without
+mutating its inputs, so the results can be cached and shared between sessions.
+Status, bin type and priority columns use categorical dtypes; nothing here loops
+over rows in Python. `tests/test_analytics_bench.py` times these on large synthetic fleets.
+"""
+import numpy as np
+import pandas as pd
+
+
+# --- DTYPES ---
+BIN_TYPES = ("paper", "aluminium", "glass")
+BIN_TYPE = pd.CategoricalDtype(BIN_TYPES)
+# Spellings of each bin type found in `servo_actions` (older writers didn't lowercase).
+# Firestore counts, the scan fallback and the local mirror all match exactly these.
+BIN_TYPE_SPELLINGS = {s: t for t in BIN_TYPES for s in (t, t.capitalize(), t.upper())}
+SPELLINGS_OF = {t: [s for s, u in BIN_TYPE_SPELLINGS.items() if u == t] for t in BIN_TYPES}
+STATUS = pd.CategoricalDtype(["ok", "warning", "full"], ordered=True)
+PRIORITY = pd.CategoricalDtype(["🟢 LOW", "🟡 MEDIUM", "🔴 HIGH"], ordered=True)
+
+STATUS_LABELS = {"ok": "OK", "warning": "WARNING", "full": "FULL"}
+STATUS_ICONS = {"ok": "🟢", "warning": "🟡", "full": "🔴"}
+MINUTES_PER_COLLECTION = 15
+COLLECT_ABOVE_PCT = 50
+
+# Defaults shared by the dashboard sidebar and the alert engine (alerts.py)
+FULL_CM = 10
+WARNING_CM = 15
+FORECAST_HORIZON_HOURS = 6
+
+
+def to_datetime(seconds):
+    """Epoch seconds -> datetime64[ns]; much faster than pd.to_datetime(..., unit='s') on floats."""
+    seconds = np.asarray(seconds, dtype=float)
+    ns = np.where(np.isfinite(seconds), np.round(seconds * 1e9), 0).astype(np.int64)
+    ns[~np.isfinite(seconds)] = np.iinfo(np.int64).min  # NaT
+    return pd.DatetimeIndex(ns.view('datetime64[ns]'))
+
+
+# --- BIN STATUS ---
+def status(distance, full_thresh, warn_thresh):
+    """Categorical ok/warning/full for each distance reading (cm to the waste)."""
+    distance = np.asarray(distance, dtype=float)
+    codes = np.select([distance <= full_thresh, distance <= warn_thresh], [2, 1], default=0)
+    return pd.Categorical.from_codes(np.atleast_1d(codes), dtype=STATUS)
+
+
+def fill_pct(distance, height):
+    distance = np.asarray(distance, dtype=float)
+    height = np.asarray(height, dtype=float)
+    return np.clip((height - distance) / height * 100, 0, 100)
+
+
+def format_hours(hours):
+    if not np.isfinite(hours):
+        return "not soon"
+    if hours < 1:
+        return f"~{hours * 60:.0f} min"
+    if hours < 48:
+        return f"~{hours:.1f} h"
+    return f"~{hours / 24:.1f} days"
+
+
+def bin_overview(bins, full_thresh, warn_thresh, horizon_hours):
+    """Status, fill and collection priority for each bin.
+
+    `bins` has `name`, `distance_cm` and `height_cm`, plus optional forecast
+    columns `hours_to_full` and `fill_pct_at_horizon` (NaN where unknown).
+    """
+    out = pd.DataFrame({
+        'name': bins['name'].to_numpy(),
+        'distance_cm': bins['distance_cm'].to_numpy(dtype=float),
+        'height_cm': bins['height_cm'].to_numpy(dtype=float),
+    })
+    hours_to_full = bins['hours_to_full'].to_numpy(dtype=float) if 'hours_to_full' in bins else np.full(len(out), np.nan)
+    ahead = bins['fill_pct_at_horizon'].to_numpy(dtype=float) if 'fill_pct_at_horizon' in bins else np.full(len(out), np.nan)
+
+    out['status'] = status(out['distance_cm'], full_thresh, warn_thresh)
+    out['fill_pct'] = fill_pct(out['distance_cm'], out['height_cm'])
+    out['hours_to_full'] = hours_to_full
+    out['predicted_fill_pct'] = np.fmax(out['fill_pct'].to_numpy(), ahead)
+    out['full_soon'] = (out['status'] == "ok").to_numpy() & (hours_to_full <= horizon_hours)
+
+    codes = out['status'].cat.codes.to_numpy()
+    out['priority'] = pd.Categorical.from_codes(np.where(out['full_soon'], 1, codes), dtype=PRIORITY)
+    return out
+
+
+def alert_lists(overview, full_soon=True):
+    """Texts for the "collection required" and "approaching capacity" banners.
+
+    `full_soon=False` leaves the forecast warnings out, for when the alert
+    engine supplies them.
+    """
+    reading = overview['name'] + " (" + overview['distance_cm'].map('{:g}'.format) + " cm)"
+    full_bins = reading[overview['status'] == "full"].tolist()
+    warning_bins = reading[overview['status'] == "warning"].tolist()
+    if full_soon:
+        soon = overview[overview['full_soon']]
+        warning_bins += [f"{name} (full in {format_hours(h)})" for name, h in zip(soon['name'], soon['hours_to_full'])]
+    return full_bins, warning_bins
+
+
+def engine_alert_lists(alerts, names=None):
+    """Full-soon and offline banner texts from the alert engine's active alerts.
+
+    Threshold alerts are skipped: the engine runs with its own thresholds, while
+    the banners follow the sidebar ones like the bin cards (see `alert_lists`).
+    `names` maps device ids to the bin names shown on the page.
+    """
+    if not alerts:
+        return [], []
+    df = pd.DataFrame(alerts)
+    df = df[df['rule'].isin(["full_soon", "offline"])].sort_values(['raised_at'], ascending=False, kind='stable')
+    label = df['device_id'].map(names or {}).fillna(df['device_id']).astype(str)
+    text = label + " (" + df['message'].astype(str) + ")"
+    offline = (df['rule'] == "offline").to_numpy()
+    return text[~offline].tolist(), text[offline].tolist()
+
+
+def route_plan(overview):
+    """Bins ordered by priority, then predicted fill, plus the estimated collection time in minutes."""
+    order = np.lexsort((-overview['predicted_fill_pct'].to_numpy(dtype=float),
+                        -overview['priority'].cat.codes.to_numpy()))
+    plan = overview.iloc[order].reset_index(drop=True)
+    to_collect = int((plan['predicted_fill_pct'] > COLLECT_ABOVE_PCT).sum())
+    return plan, to_collect, to_collect * MINUTES_PER_COLLECTION
+
+
+# --- HISTORY & ACTIVITY ---
+def typed_history(df):
+    """`bin_status` rows with compact dtypes and a `datetime` column."""
+    if df.empty:
+        return pd.DataFrame(columns=['timestamp', 'datetime', 'device_id', 'distance_cm'])
+    ts = pd.to_numeric(df['timestamp'], errors='coerce').to_numpy(dtype=float)
+    out = pd.DataFrame({
+        'timestamp': ts,
+        'datetime': to_datetime(ts),
+        'device_id': pd.Categorical(df['device_id'] if 'device_id' in df else np.full(len(df), None)),
+        'distance_cm': pd.to_numeric(df['distance_cm'], errors='coerce').to_numpy(dtype=np.float32),
+    })
+    return out
+
+
+def typed_servo_actions(df):
+    """`servo_actions` rows with a categorical `bin_type` and boolean `opened`."""
+    if df.empty:
+        return pd.DataFrame({'timestamp': pd.Series(dtype=float),
+                             'bin_type': pd.Series(dtype=BIN_TYPE),
+                             'opened': pd.Series(dtype=bool)})
+    if 'bin_type' in df:
+        # Normalise spelling once per distinct value, not once per row
+        codes, uniques = pd.factorize(df['bin_type'])
+        lookup = BIN_TYPE.categories.get_indexer(pd.Index(uniques, dtype=object).map(BIN_TYPE_SPELLINGS))
+        type_codes = np.append(lookup, -1)[codes]   # Missing values (code -1) hit the trailing -1
+    else:
+        type_codes = np.full(len(df), -1)
+    return pd.DataFrame({
+        'timestamp': pd.to_numeric(df['timestamp'], errors='coerce').to_numpy(dtype=float),
+        'bin_type': pd.Categorical.from_codes(type_codes, dtype=BIN_TYPE),
+        'opened': df['opened'].fillna(False).to_numpy(dtype=bool) if 'opened' in df else np.zeros(len(df), dtype=bool),
+    })
+
+
+def servo_kpis(actions):
+    """Total / accepted / rejected counts and items per bin type."""
+    if 'bin_type' not in actions or not isinstance(actions['bin_type'].dtype, pd.CategoricalDtype):
+        actions = typed_servo_actions(actions)
+    total = len(actions)
+    accepted = int(actions['opened'].sum())
+    counts = np.bincount(actions['bin_type'].cat.codes.to_numpy() + 1, minlength=len(BIN_TYPES) + 1)[1:]
+    return {
+        'total': total,
+        'accepted': accepted,
+        'rejected': total - accepted,
+        'by_type': {t: int(c) for t, c in zip(BIN_TYPES, counts) if c},
+    }
+
+
+def hourly_activity(timestamps):
+    """Items per hour of day (UTC) for the hours that saw any activity."""
+    ts = np.asarray(timestamps, dtype=float)
+    ts = ts[np.isfinite(ts)]
+    hours = (np.floor(ts / 3600).astype(np.int64) % 24)
+    counts = np.bincount(hours, minlength=24)
+    active = np.flatnonzero(counts)
+    return pd.DataFrame({'hour': active, 'count': counts[active]})
+
+
+def activity_log(actions, limit=None):
+    """Newest-first display rows (Time, Type, Status) for the activity log."""
+    if actions.empty:
+        return pd.DataFrame(columns=['Time', 'Type', 'Status'])
+    ts = pd.to_numeric(actions['timestamp'], errors='coerce').to_numpy(dtype=float)
+    ts = np.where(np.isnan(ts), -np.inf, ts)
+    # Pick the newest rows before typing/formatting anything
+    if limit is not None and limit < len(ts):
+        newest = np.argpartition(-ts, limit - 1)[:limit]
+        order = newest[np.argsort(-ts[newest], kind='stable')]
+    else:
+        order = np.argsort(-ts, kind='stable')
+    recent = typed_servo_actions(actions.iloc[order])
+    types = recent['bin_type'].cat.rename_categories([t.title() for t in BIN_TYPES]).to_numpy(dtype=object)
+    if 'bin_type' in actions:
+        # Types outside BIN_TYPES are shown as stored, title-cased
+        raw = actions['bin_type'].iloc[order].astype('string').str.title().fillna('').to_numpy(dtype=object)
+        types = np.where(recent['bin_type'].cat.codes.to_numpy() >= 0, types, raw)
+    return pd.DataFrame({
+        'Time': to_datetime(recent['timestamp'].to_numpy()).strftime('%Y-%m-%d %H:%M:%S'),
+        'Type': types,
+        'Status': np.where(recent['opened'].to_numpy(), '✅ Accepted', '⛔ Rejected'),
+    })
@@ -0,0 +1,376 @@
+"""Local columnar mirror of `bin_status` and `servo_actions` for long-range views.
+
+Documents are appended incrementally to day-partitioned Parquet files
+(`analytics_cache/<collection>/date=YYYY-MM-DD/*.parquet`) and queried with
+DuckDB, so 30/90/365-day dashboard ranges run locally instead of re-reading
+Firestore on every view.
+
+The state file records, per collection, a watermark for topping up and how far
+back the mirror reaches (`covered_from`); until that includes the start of a
+requested range, `covers()` is False and the dashboard reads Firestore instead.
+
+Backfill or top up the mirror from the command line (set FIRESTORE_EMULATOR_HOST
+to sync from the emulator):
+
+    python analytics_store.py sync --days 365
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    duckdb = pa = pq = None
+
+import analytics
+
+
+# --- CONFIG ---
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analytics_cache")
+PAGE_SIZE = 5000
+BACKFILL_DAYS = 365           # Longest dashboard range; how far back a sync fills the mirror
+SYNC_INTERVAL = 60            # Seconds between background top-ups from the dashboard
+MAX_FILES_PER_PARTITION = 32  # Small appended files get merged beyond this
+
+COLUMNS = {
+    'bin_status': {
+        'timestamp': 'float64',
+        'device_id': 'string',
+        'distance_cm': 'float64',
+        'is_full': 'boolean',
+        'last_item': 'string',
+    },
+    'servo_actions': {
+        'timestamp': 'float64',
+        'device_id': 'string',
+        'bin_type': 'string',
+        'opened': 'boolean',
+    },
+}
+
+
+def available():
+    return duckdb is not None
+
+
+class _SharedLock:
+    """Any number of readers, or one writer that waits for them to finish."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    def acquire_read(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writing)
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writing)
+            self._writing = True  # Blocks new readers while the current ones drain
+            self._cond.wait_for(lambda: self._readers == 0)
+
+    def release_write(self):
+        with self._cond:
+            self._writing = False
+            self._cond.notify_all()
+
+
+class AnalyticsStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._sync_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._files_lock = _SharedLock()   # Compaction deletes files DuckDB may be reading
+        self._sync_thread = None
+        self.last_sync = 0.0
+        self.last_sync_rows = {}
+        self.last_error = None
+
+    # --- LAYOUT ---
+    def _collection_dir(self, collection):
+        return os.path.join(self.path, collection)
+
+    def _files(self, collection):
+        return glob.glob(os.path.join(self._collection_dir(collection), "date=*", "*.parquet"))
+
+    def _state_path(self):
+        return os.path.join(self.path, "_state.json")
+
+    def _load_state(self):
+        try:
+            with open(self._state_path(), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self._state_path())
+
+    def _entry(self, state, collection):
+        entry = state.get(collection)
+        if entry is not None and not isinstance(entry, dict):
+            # Older mirrors kept only a watermark and can't tell how far back they reach; rebuild
+            shutil.rmtree(self._collection_dir(collection), ignore_errors=True)
+            entry = state[collection] = None
+        return entry
+
+    def watermark(self, collection):
+        entry = self._load_state().get(collection)
+        return entry.get('watermark') if isinstance(entry, dict) else None
+
+    def covered_from(self, collection):
+        """Timestamp the mirror is complete back to, or None while the first backfill runs."""
+        entry = self._load_state().get(collection)
+        return entry.get('covered_from') if isinstance(entry, dict) else None
+
+    def covers(self, start_ts):
+        state = self._load_state()
+        for collection in COLUMNS:
+            entry = state.get(collection)
+            if not isinstance(entry, dict) or entry.get('covered_from') is None \
+                    or entry['covered_from'] > start_ts:
+                return False
+        return True
+
+    # --- WRITING ---
+    def _normalize(self, collection, rows):
+        df = pd.DataFrame(rows)
+        for column, dtype in COLUMNS[collection].items():
+            if column not in df:
+                df[column] = None
+            df[column] = df[column].astype(dtype)
+        return df[list(COLUMNS[collection])]
+
+    def append(self, collection, rows):
+        """Write `rows` (dicts) into their day partitions. Returns rows written."""
+        if not rows:
+            return 0
+        df = self._normalize(collection, rows)
+        df = df[df['timestamp'].notna()]
+        days = pd.to_datetime(df['timestamp'], unit='s').dt.strftime('%Y-%m-%d')
+        with self._write_lock:
+            for day, part in df.groupby(days):
+                part_dir = os.path.join(self._collection_dir(collection), f"date={day}")
+                os.makedirs(part_dir, exist_ok=True)
+                name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+                # Write next to the target and rename, so readers never see a partial file
+                tmp = os.path.join(part_dir, "." + name + ".tmp")
+                pq.write_table(pa.Table.from_pandas(part, preserve_index=False), tmp)
+                os.replace(tmp, os.path.join(part_dir, name))
+                self._compact(part_dir)
+        return len(df)
+
+    def _compact(self, part_dir):
+        files = sorted(glob.glob(os.path.join(part_dir, "*.parquet")))
+        if len(files) <= MAX_FILES_PER_PARTITION:
+            return
+        merged = pa.concat_tables([pq.read_table(f, memory_map=True) for f in files]).sort_by('timestamp')
+        name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp = os.path.join(part_dir, "." + name + ".tmp")
+        pq.write_table(merged, tmp)
+        self._files_lock.acquire_write()
+        try:
+            os.replace(tmp, os.path.join(part_dir, name))
+            for f in files:
+                os.remove(f)
+        finally:
+            self._files_lock.release_write()
+
+    # --- SYNC ---
+    def _page(self, collection, query, state, entry, bound_key, ids_key):
+        """Append every document `query` returns, saving progress after each page.
+
+        entry[bound_key] is the timestamp of the last document stored and
+        entry[ids_key] the ids stored at exactly that timestamp, so a query that
+        resumes from the bound inclusively skips them instead of storing twice.
+        """
+        skip = set(entry.get(ids_key) or ())
+        total = 0
+        last_snapshot = None
+        while True:
+            page = query.limit(PAGE_SIZE)
+            if last_snapshot is not None:
+                page = page.start_after(last_snapshot)
+            snapshots = list(page.stream())
+            if not snapshots:
+                break
+            total += self.append(collection, [s.to_dict() for s in snapshots if s.id not in skip])
+            last_snapshot = snapshots[-1]
+            bound = last_snapshot.get('timestamp')
+            at_bound = {s.id for s in snapshots if s.get('timestamp') == bound}
+            if bound == entry.get(bound_key):
+                at_bound |= set(entry.get(ids_key) or ())
+            entry[bound_key], entry[ids_key] = bound, sorted(at_bound)
+            self._save_state(state)
+            if len(snapshots) < PAGE_SIZE:
+                break
+        return total
+
+    def sync(self, db, backfill_days=BACKFILL_DAYS):
+        """Pull new documents, and older ones until the mirror reaches `backfill_days` back."""
+        with self._sync_lock:
+            state = self._load_state()
+            want_from = time.time() - backfill_days * 86400
+            written = {}
+            for collection in COLUMNS:
+                entry = self._entry(state, collection)
+                if entry is None:
+                    entry = state[collection] = {
+                        'watermark': want_from, 'watermark_ids': [],
+                        'covered_from': None, 'backfill_from': want_from,
+                    }
+                ref = db.collection(collection)
+
+                query = ref.where('timestamp', '>=', entry['watermark']).order_by('timestamp')
+                total = self._page(collection, query, state, entry, 'watermark', 'watermark_ids')
+                if entry['covered_from'] is None:
+                    entry['covered_from'] = entry.pop('backfill_from')
+
+                # Asked for more history than the mirror has: fill backwards from covered_from
+                if want_from < entry['covered_from']:
+                    query = ref.where('timestamp', '>=', want_from)
+                    if entry.get('gap_floor') is None:
+                        query = query.where('timestamp', '<', entry['covered_from'])
+                    else:
+                        query = query.where('timestamp', '<=', entry['gap_floor'])  # Resuming
+                    query = query.order_by('timestamp', direction='DESCENDING')
+                    total += self._page(collection, query, state, entry, 'gap_floor', 'gap_ids')
+                    entry['covered_from'] = want_from
+                    entry.pop('gap_floor', None)
+                    entry.pop('gap_ids', None)
+                self._save_state(state)
+                written[collection] = total
+            self.last_sync = time.time()
+            self.last_sync_rows = written
+            return written
+
+    def sync_in_background(self, db, min_interval=SYNC_INTERVAL):
+        """Start a top-up sync unless one is running or ran recently."""
+        if time.time() - self.last_sync < min_interval:
+            return False
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return False
+
+        def run():
+            try:
+                self.sync(db)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                self.last_sync = time.time()
+
+        self._sync_thread = threading.Thread(target=run, name="analytics-sync", daemon=True)
+        self._sync_thread.start()
+        return True
+
+    # --- QUERIES ---
+    def _query(self, collection, sql, params):
+        self._files_lock.acquire_read()
+        try:
+            if not self._files(collection):
+                return None
+            con = duckdb.connect()
+            try:
+                con.execute("SET threads TO 4")
+                source = f"read_parquet({self._glob_literal(collection)}, hive_partitioning = true)"
+                spellings = ", ".join("'" + s + "'" for s in analytics.BIN_TYPE_SPELLINGS)
+                return con.execute(sql.format(source=source, spellings=spellings), params).df()
+            finally:
+                con.close()
+        finally:
+            self._files_lock.release_read()
+
+    def _glob_literal(self, collection):
+        pattern = os.path.join(self._collection_dir(collection), "date=*", "*.parquet")
+        return "'" + pattern.replace("'", "''") + "'"
+
+    @staticmethod
+    def _day(ts):
+        return pd.Timestamp(ts, unit='s').strftime('%Y-%m-%d')
+
+    def bin_history(self, start_ts):
+        df = self._query('bin_status', """
+            SELECT timestamp, device_id, distance_cm, is_full, last_item
+            FROM {source}
+            WHERE date >= ? AND timestamp >= ?
+            ORDER BY timestamp
+        """, [self._day(start_ts), start_ts])
+        return df if df is not None else pd.DataFrame()
+
+    def servo_kpis(self, start_ts):
+        df = self._query('servo_actions', """
+            SELECT CASE WHEN bin_type IN ({spellings}) THEN lower(bin_type) END AS bin_type,
+                   count(*) AS total,
+                   count(*) FILTER (WHERE opened) AS accepted
+            FROM {source}
+            WHERE date >= ? AND timestamp >= ?
+            GROUP BY 1
+        """, [self._day(start_ts), start_ts])
+        if df is None or df.empty:
+            return {'total': 0, 'accepted': 0, 'rejected': 0, 'by_type': {}}
+        total, accepted = int(df['total'].sum()), int(df['accepted'].sum())
+        typed = df[df['bin_type'].notna()]
+        return {
+            'total': total,
+            'accepted': accepted,
+            'rejected': total - accepted,
+            'by_type': dict(zip(typed['bin_type'], typed['total'].astype(int))),
+        }
+
+    def hourly_activity(self, start_ts):
+        df = self._query('servo_actions', """
+            SELECT CAST(floor(timestamp / 3600) AS BIGINT) % 24 AS hour, count(*) AS count
+            FROM {source}
+            WHERE date >= ? AND timestamp >= ?
+            GROUP BY 1
+            ORDER BY 1
+        """, [self._day(start_ts), start_ts])
+        return df if df is not None else pd.DataFrame(columns=['hour', 'count'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local Parquet mirror of the dashboard collections.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync_cmd = sub.add_parser("sync", help="Backfill / top up the mirror from Firestore or the emulator")
+    sync_cmd.add_argument("--days", type=int, default=BACKFILL_DAYS,
+                          help="How far back the mirror should reach (older history is filled in backwards)")
+    sync_cmd.add_argument("--path", default=STORE_PATH)
+    args = parser.parse_args()
+
+    if not available():
+        parser.error("duckdb and pyarrow are required: pip install duckdb pyarrow")
+
+    import queries
+    store = AnalyticsStore(args.path)
+    started = time.perf_counter()
+    written = store.sync(queries.script_client(), backfill_days=args.days)
+    for collection, rows in written.items():
+        print(f"{collection}: {rows} new rows (watermark {store.watermark(collection)}, "
+              f"covered from {store.covered_from(collection)})")
+    print(f"Sync finished in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
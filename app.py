@@ -1,20 +1,40 @@
+import time
+_run_started = time.perf_counter()
+
+import os
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime, timedelta
-import firebase_admin
-from firebase_admin import credentials, firestore
-import time
 import numpy as np
+import analytics
+import analytics_store
+import data_access
+import fleet_map
+import queries
+from forecast import FillForecaster
+from perf import RunHistory, RunTimer
+
+# plotly, pydeck, commands (paho/Pub/Sub) and firebase_admin are imported where they are first needed, so a cold
+# start only pays for them once the page actually uses them
+
+MAP_WIDTH_PX, MAP_HEIGHT_PX = 800, 450
+ALERT_ENGINE_STALE = 120   # Seconds since the alert engine's last heartbeat
+FORECAST_HISTORY = 7 * 86400   # Seconds of history the shared forecaster starts from, whatever the selected range
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "dashboard.css")
+timer = RunTimer(_run_started)
 
 
 # Initialize Firebase
 @st.cache_resource
 def init_firebase():
+    # Local testing: talk to the Firestore emulator without a service account key
+    if queries.emulator_host():
+        return queries.emulator_client()
+    import firebase_admin
+    from firebase_admin import credentials, firestore
     try:
         if not firebase_admin._apps:
-            cred = credentials.Certificate('smart-bin-project-483011-firebase-adminsdk-fbsvc-1a85500baa.json')
+            cred = credentials.Certificate(queries.FIREBASE_KEY_PATH)
             firebase_admin.initialize_app(cred)
     except ValueError:
         pass
@@ -24,9 +44,6 @@ def init_firebase():
     return firestore.client()
 
 
-db = init_firebase()
-
-
 # Page Config
 st.set_page_config(
     page_title="Smart Recycle Bin Dashboard",
@@ -36,245 +53,24 @@ st.set_page_config(
 )
 
 
-# Enhanced Custom CSS
-st.markdown("""
-    <style>
-    /* Global Styles */
-    .stApp {
-        background: linear-gradient(135deg, #f5f7fa 0%, #e8f5e9 100%);
-    }
-   
-    /* Typography */
-    .dashboard-title {
-        font-size: 42px;
-        font-weight: 700;
-        background: linear-gradient(135deg, #2d5016 0%, #4CAF50 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        margin-bottom: 0;
-    }
-   
-    .section-header {
-        font-size: 20px;
-        font-weight: 600;
-        color: #2d5016;
-        margin: 20px 0 15px 0;
-        padding-bottom: 10px;
-        border-bottom: 2px solid #4CAF50;
-    }
-   
-    /* Metric Cards */
-    .metric-card {
-        background: white;
-        border-radius: 16px;
-        padding: 24px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.07);
-        border-left: 4px solid #4CAF50;
-        transition: transform 0.2s, box-shadow 0.2s;
-        margin-bottom: 20px;
-    }
-   
-    .metric-card:hover {
-        transform: translateY(-4px);
-        box-shadow: 0 8px 16px rgba(0,0,0,0.12);
-    }
-   
-    .metric-value {
-        font-size: 36px;
-        font-weight: 700;
-        color: #2d5016;
-        margin: 8px 0;
-    }
-   
-    .metric-label {
-        font-size: 14px;
-        color: #5a7c4a;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-        font-weight: 600;
-    }
-   
-    .metric-delta {
-        font-size: 13px;
-        margin-top: 8px;
-    }
-   
-    /* Bin Status Cards */
-    .bin-card {
-        background: white;
-        border-radius: 16px;
-        padding: 20px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.07);
-        margin-bottom: 16px;
-        position: relative;
-        overflow: hidden;
-    }
-   
-    .bin-card::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 4px;
-    }
-   
-    .bin-card.status-ok::before { background: #4CAF50; }
-    .bin-card.status-warning::before { background: #FF9800; }
-    .bin-card.status-full::before { background: #f44336; }
-   
-    .bin-header {
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        margin-bottom: 12px;
-    }
-   
-    .bin-name {
-        font-size: 18px;
-        font-weight: 600;
-        color: #2d5016;
-    }
-   
-    .bin-distance {
-        font-size: 28px;
-        font-weight: 700;
-        color: #2d5016;
-    }
-   
-    .status-badge {
-        padding: 6px 14px;
-        border-radius: 20px;
-        font-size: 11px;
-        font-weight: 700;
-        letter-spacing: 0.5px;
-    }
-   
-    .status-badge.ok {
-        background: #e8f5e9;
-        color: #2e7d32;
-    }
-   
-    .status-badge.warning {
-        background: #fff3e0;
-        color: #e65100;
-    }
-   
-    .status-badge.full {
-        background: #ffebee;
-        color: #c62828;
-    }
-   
-    /* Alerts */
-    .alert-banner {
-        padding: 20px 24px;
-        border-radius: 12px;
-        margin-bottom: 24px;
-        border-left: 5px solid;
-        display: flex;
-        align-items: center;
-        gap: 16px;
-        animation: slideIn 0.3s ease-out;
-    }
-   
-    @keyframes slideIn {
-        from { transform: translateX(-100%); opacity: 0; }
-        to { transform: translateX(0); opacity: 1; }
-    }
-   
-    .alert-critical {
-        background: linear-gradient(135deg, #ffebee 0%, #ffcdd2 100%);
-        border-color: #f44336;
-        color: #c62828;
-    }
-   
-    .alert-warning {
-        background: linear-gradient(135deg, #fff3e0 0%, #ffe0b2 100%);
-        border-color: #FF9800;
-        color: #e65100;
-    }
-   
-    .alert-icon {
-        font-size: 32px;
-    }
-   
-    .alert-content {
-        flex: 1;
-    }
-   
-    .alert-title {
-        font-weight: 700;
-        font-size: 16px;
-        margin-bottom: 4px;
-    }
-   
-    .alert-message {
-        font-size: 14px;
-    }
-   
-    /* Info Cards */
-    .info-card {
-        background: white;
-        border-radius: 12px;
-        padding: 16px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.06);
-        margin-bottom: 12px;
-    }
-   
-    /* Route Planning */
-    .route-card {
-        background: white;
-        border-radius: 12px;
-        padding: 20px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.07);
-        margin-bottom: 16px;
-        border-left: 4px solid #4CAF50;
-    }
-   
-    .route-step {
-        padding: 12px;
-        margin: 8px 0;
-        background: #f5f5f5;
-        border-radius: 8px;
-        display: flex;
-        align-items: center;
-        gap: 12px;
-    }
-   
-    .route-number {
-        background: #4CAF50;
-        color: white;
-        width: 32px;
-        height: 32px;
-        border-radius: 50%;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-weight: 700;
-        flex-shrink: 0;
-    }
-   
-    /* Sidebar Enhancements */
-    .sidebar .element-container {
-        margin-bottom: 16px;
-    }
-   
-    /* Custom Progress Bar */
-    .stProgress > div > div > div > div {
-        background: linear-gradient(90deg, #4CAF50 0%, #81C784 100%);
-    }
-   
-    /* Data Table Styling */
-    .dataframe {
-        border-radius: 8px;
-        overflow: hidden;
-    }
-   
-    /* Hide Streamlit Branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    </style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def run_history():
+    return RunHistory()
+
+
+with timer.phase("firebase init"):
+    db = init_firebase()
+
+
+# Enhanced Custom CSS (read from disk once per process)
+@st.cache_resource
+def load_css():
+    with open(CSS_PATH, 'r') as f:
+        return f"<style>{f.read()}</style>"
+
+
+with timer.phase("css"):
+    st.markdown(load_css(), unsafe_allow_html=True)
 
 
 # --- Sidebar Settings ---
@@ -285,13 +81,14 @@ with st.sidebar:
     refresh_rate = st.slider("Interval (seconds)", 5, 60, 10)
    
     st.markdown("#### 📅 Time Period")
-    time_range = st.selectbox("Select range", ["Last 1 Hour", "Last 6 Hours", "Last 24 Hours", "Last 7 Days"])
+    time_range = st.selectbox("Select range", ["Last 1 Hour", "Last 6 Hours", "Last 24 Hours", "Last 7 Days", "Last 30 Days", "Last 90 Days", "Last 365 Days"], on_change=lambda: st.session_state.update(log_cursors=[None]))
    
     st.divider()
    
     st.markdown("#### 🎯 Alert Thresholds")
-    full_threshold = st.number_input("Full threshold (cm)", 5, 50, 10, help="Distance below which bin is considered full")
-    warning_threshold = st.number_input("Warning threshold (cm)", 5, 100, 15, help="Distance below which bin shows warning")
+    full_threshold = st.number_input("Full threshold (cm)", 5, 50, analytics.FULL_CM, help="Distance below which bin is considered full")
+    warning_threshold = st.number_input("Warning threshold (cm)", 5, 100, analytics.WARNING_CM, help="Distance below which bin shows warning")
+    forecast_horizon = st.number_input("Forecast horizon (hours)", 1, 72, analytics.FORECAST_HORIZON_HOURS, help="Alert and plan routes on the fill level predicted this far ahead")
    
     # Fixed bin heights (not configurable)
     paper_bin_height = 20
@@ -300,14 +97,12 @@ with st.sidebar:
    
     st.divider()
    
-    if st.button("🔄 Refresh Now", use_container_width=True, type="primary"):
-        st.cache_data.clear()
-        st.rerun()
+    refresh_now = st.button("🔄 Refresh Now", use_container_width=True, type="primary")
    
     st.markdown("---")
     st.markdown("### 📊 Quick Stats")
     st.markdown("**Dashboard Version:** v2.0")
-    st.markdown(f"**Last Updated:** {datetime.now().strftime('%H:%M:%S')}")
+    cache_stats_slot = st.empty()
 
 
 # Calculate time window
@@ -315,276 +110,397 @@ time_ranges = {
     "Last 1 Hour": timedelta(hours=1),
     "Last 6 Hours": timedelta(hours=6),
     "Last 24 Hours": timedelta(days=1),
-    "Last 7 Days": timedelta(days=7)
+    "Last 7 Days": timedelta(days=7),
+    "Last 30 Days": timedelta(days=30),
+    "Last 90 Days": timedelta(days=90),
+    "Last 365 Days": timedelta(days=365)
 }
-start_time = datetime.now() - time_ranges.get(time_range, timedelta(days=1))
-start_timestamp = start_time.timestamp()
+range_length = time_ranges.get(time_range, timedelta(days=1))
+
+# Ranges longer than a week are answered from the local Parquet mirror, once it reaches back far enough
+REMOTE_MAX_RANGE = timedelta(days=7)
+long_range = range_length > REMOTE_MAX_RANGE
+
+# Set once the whole script has run; fragment reruns after that see it as True
+page_done = False
+
+
+# Local columnar mirror, topped up (and backfilled) from Firestore in the background
+@st.cache_resource
+def get_analytics_store():
+    return analytics_store.AnalyticsStore()
+
+
+def current_window():
+    """(start timestamp, read from the local store?, timer) for a run of the page or of one fragment.
+
+    Live fragments rerun without the rest of the script, so each run calls this
+    instead of reading module-level values: the window moves forward, the mirror
+    keeps being topped up, and reruns after the page has loaded time themselves.
+    """
+    start_ts = (datetime.now() - range_length).timestamp()
+    local = False
+    if analytics_store.available():
+        get_analytics_store().sync_in_background(db)
+        local = long_range and get_analytics_store().covers(start_ts)
+    return start_ts, local, timer if not page_done else RunTimer()
+
+
+if analytics_store.available():
+    if long_range and not current_window()[1]:
+        st.sidebar.info("The local history mirror is still backfilling this range; reading from Firestore meanwhile.")
+elif long_range:
+    st.sidebar.warning("Install duckdb and pyarrow to serve long ranges locally; reading from Firestore instead.")
+
+
+LOG_PAGE_SIZE = 15
+LOG_TYPE_FILTERS = {"All types": None, "Paper": "paper", "Aluminium": "aluminium", "Glass": "glass"}
+LOG_STATUS_FILTERS = {"All actions": None, "Accepted": True, "Rejected": False}
+
+
+def log_filters():
+    return (LOG_TYPE_FILTERS[st.session_state.get('log_type', "All types")],
+            LOG_STATUS_FILTERS[st.session_state.get('log_status', "All actions")])
+
+
+# Refresh Now only drops the cache entries this view reads, not everyone's
+if refresh_now:
+    data_access.invalidate_view(current_window()[0], LOG_PAGE_SIZE, *log_filters())
+    st.session_state['log_cursors'] = [None]
 
 
 # --- Data Fetching ---
-@st.cache_data(ttl=refresh_rate)
+# Reads go through the process-wide cache in data_access, shared by every session
 def fetch_bin_status():
-    docs = db.collection('bin_status').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1).stream()
-    for doc in docs:
-        return doc.to_dict()
-    return None
+    try:
+        return data_access.latest_bin_status(db)
+    except Exception as e:
+        return None
 
 
-@st.cache_data(ttl=refresh_rate)
 def fetch_gps_location():
-    docs = db.collection('gps').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1).stream()
-    for doc in docs:
-        return doc.to_dict()
-    return None
+    try:
+        return data_access.latest_gps(db)
+    except Exception as e:
+        return None
 
 
-@st.cache_data(ttl=refresh_rate)
-def fetch_servo_actions(start_ts):
+def fetch_fleet_index():
     try:
-        docs = db.collection('servo_actions').where('timestamp', '>=', start_ts).order_by('timestamp').stream()
-        data = [doc.to_dict() for doc in docs]
-        return pd.DataFrame(data) if data else pd.DataFrame()
+        return data_access.fleet_index(db, full_threshold, warning_threshold, paper_bin_height)
     except Exception as e:
-        return pd.DataFrame()
+        return None
 
 
-@st.cache_data(ttl=refresh_rate)
-def fetch_bin_history(start_ts):
+def fetch_active_alerts():
+    """(engine status, active alerts) from the alert engine, or None when it isn't running."""
     try:
-        docs = db.collection('bin_status').where('timestamp', '>=', start_ts).order_by('timestamp').stream()
-        data = [doc.to_dict() for doc in docs]
-        return pd.DataFrame(data) if data else pd.DataFrame()
+        status, alerts = data_access.active_alerts(db)
     except Exception as e:
-        return pd.DataFrame()
-
+        return None
+    if status is None or time.time() - status.get('heartbeat', 0) > ALERT_ENGINE_STALE:
+        return None
+    return status, alerts
 
-# Load Data
-current_bin_status = fetch_bin_status()
-current_gps = fetch_gps_location()
-servo_actions_df = fetch_servo_actions(start_timestamp)
-bin_history_df = fetch_bin_history(start_timestamp)
 
+def fetch_recent_commands():
+    try:
+        return data_access.recent_commands(db)
+    except Exception as e:
+        return []
 
-# --- Header ---
-col_title, col_status = st.columns([3, 1])
-with col_title:
-    st.markdown("<h1 class='dashboard-title'>♻️ Smart Recycle Bin Dashboard</h1>", unsafe_allow_html=True)
-    st.caption(f"Real-time monitoring and analytics · {time_range}")
 
+# Publisher for downlink commands, created on first use and shared by every session
+@st.cache_resource
+def get_command_sender():
+    import commands
+    publisher, topic_path = commands.make_publisher(queries.PROJECT_ID, queries.FIREBASE_KEY_PATH)
+    return commands.CommandSender(db, publisher, topic_path)
 
-with col_status:
-    device_id = current_bin_status.get('device_id', 'Unknown') if current_bin_status else 'Unknown'
-    st.markdown(f"""
-        <div class='info-card'>
-            <div style='font-size: 12px; color: #666;'>DEVICE ID</div>
-            <div style='font-size: 18px; font-weight: 700; color: #2d5016;'>{device_id}</div>
-            <div style='font-size: 11px; color: #4CAF50; margin-top: 4px;'>● Active</div>
-        </div>
-    """, unsafe_allow_html=True)
 
+def fetch_servo_kpis(start_ts, local=False):
+    try:
+        if local:
+            return get_analytics_store().servo_kpis(start_ts)
+        return data_access.servo_kpis(db, start_ts)
+    except Exception as e:
+        return {'total': 0, 'accepted': 0, 'rejected': 0, 'by_type': {}}
 
-st.markdown("<br>", unsafe_allow_html=True)
 
+def fetch_hourly_activity(start_ts, local=False):
+    try:
+        if local:
+            return get_analytics_store().hourly_activity(start_ts)
+        return analytics.hourly_activity(data_access.servo_timestamps(db, start_ts))
+    except Exception as e:
+        return pd.DataFrame(columns=['hour', 'count'])
 
-# --- Calculate Bin Status ---
-paper_distance = current_bin_status.get('distance_cm', paper_bin_height) if current_bin_status else paper_bin_height
-aluminium_distance = 12
-glass_distance = 21
 
+def fetch_servo_log_page(start_ts, page_size, bin_type=None, opened=None, cursor=None):
+    try:
+        return data_access.servo_log_page(db, start_ts, page_size, bin_type, opened, cursor)
+    except Exception as e:
+        return pd.DataFrame(), None
 
-def get_status(distance, full_thresh, warn_thresh):
-    if distance <= full_thresh:
-        return "full", "FULL", "🔴"
-    elif distance <= warn_thresh:
-        return "warning", "WARNING", "🟡"
-    else:
-        return "ok", "OK", "🟢"
 
+def fetch_bin_history(start_ts, local=False):
+    try:
+        if local:
+            return get_analytics_store().bin_history(start_ts)
+        return data_access.bin_history(db, start_ts)
+    except Exception as e:
+        return pd.DataFrame()
 
-paper_status = get_status(paper_distance, full_threshold, warning_threshold)
-aluminium_status = get_status(aluminium_distance, full_threshold, warning_threshold)
-glass_status = get_status(glass_distance, full_threshold, warning_threshold)
 
+# Shared across sessions so each rerun only folds in readings it has not seen yet
+@st.cache_resource
+def get_forecaster(bin_height):
+    return FillForecaster(bin_height=bin_height)
 
-# --- Alerts System ---
-full_bins = []
-warning_bins = []
 
+def device_of(bin_status):
+    return bin_status.get('device_id', 'Unknown') if bin_status else 'Unknown'
 
-if paper_status[0] == "full":
-    full_bins.append(f"Paper ({paper_distance} cm)")
-elif paper_status[0] == "warning":
-    warning_bins.append(f"Paper ({paper_distance} cm)")
 
+def forecast_value(forecast, column):
+    return forecast[column] if forecast is not None else np.nan
 
-if aluminium_status[0] == "full":
-    full_bins.append(f"Aluminium ({aluminium_distance} cm)")
-elif aluminium_status[0] == "warning":
-    warning_bins.append(f"Aluminium ({aluminium_distance} cm)")
 
+aluminium_distance = 12
+glass_distance = 21
 
-if glass_status[0] == "full":
-    full_bins.append(f"Glass ({glass_distance} cm)")
-elif glass_status[0] == "warning":
-    warning_bins.append(f"Glass ({glass_distance} cm)")
 
+def load_bin_overview():
+    """(device id, per-compartment forecasts, bin overview) from the latest readings.
+
+    Cheap enough for every live view to call: reads go through the shared cache
+    and the forecaster only folds in readings it has not seen yet.
+    """
+    current_bin_status = fetch_bin_status()
+    device_id = device_of(current_bin_status)
+    # Fed from a fixed window, then only from its newest reading on, never from the
+    # selected range, so forecasts don't depend on which session loaded first
+    forecaster = get_forecaster(paper_bin_height)
+    newest = forecaster.newest()
+    forecaster.update(fetch_bin_history(newest if newest is not None else time.time() - FORECAST_HISTORY))
+    forecast_df = forecaster.predict(full_threshold, horizon_hours=forecast_horizon)
+
+    # Only the paper compartment has a distance sensor; the aluminium and glass levels
+    # are fixed placeholders, so there is no history to forecast them from
+    paper_distance = current_bin_status.get('distance_cm', paper_bin_height) if current_bin_status else paper_bin_height
+    paper_forecast = forecast_df.loc[device_id] if device_id in forecast_df.index else None
+    bin_forecasts = [paper_forecast, None, None]
+
+    bins_df = pd.DataFrame({
+        'name': ["Paper", "Aluminium", "Glass"],
+        'distance_cm': [paper_distance, aluminium_distance, glass_distance],
+        'height_cm': [paper_bin_height, aluminium_bin_height, glass_bin_height],
+        'hours_to_full': [forecast_value(f, 'hours_to_full') for f in bin_forecasts],
+        'fill_pct_at_horizon': [forecast_value(f, 'fill_pct_at_horizon') for f in bin_forecasts],
+    })
+    return device_id, bin_forecasts, analytics.bin_overview(bins_df, full_threshold, warning_threshold, forecast_horizon)
+
+
+# Header, alerts, KPIs and bin cards rerun on their own every refresh interval
+@st.fragment(run_every=refresh_rate)
+def render_live_status():
+    start_ts, local, run_timer = current_window()
+    with run_timer.phase("data load"):
+        current_gps = fetch_gps_location()
+        servo_kpis = fetch_servo_kpis(start_ts, local)
+    with run_timer.phase("forecast"):
+        device_id, bin_forecasts, bin_overview = load_bin_overview()
+
+    # --- Header ---
+    col_title, col_status = st.columns([3, 1])
+    with col_title:
+        st.markdown("<h1 class='dashboard-title'>♻️ Smart Recycle Bin Dashboard</h1>", unsafe_allow_html=True)
+        st.caption(f"Real-time monitoring and analytics · {time_range} · updated {datetime.now().strftime('%H:%M:%S')}")
+
+    with col_status:
+        st.markdown(f"""
+            <div class='info-card'>
+                <div style='font-size: 12px; color: #666;'>DEVICE ID</div>
+                <div style='font-size: 18px; font-weight: 700; color: #2d5016;'>{device_id}</div>
+                <div style='font-size: 11px; color: #4CAF50; margin-top: 4px;'>● Active</div>
+            </div>
+        """, unsafe_allow_html=True)
 
-if full_bins:
-    bins_text = ", ".join(full_bins)
-    st.markdown(f"""
-        <div class='alert-banner alert-critical'>
-            <div class='alert-icon'>🚨</div>
-            <div class='alert-content'>
-                <div class='alert-title'>URGENT: Collection Required</div>
-                <div class='alert-message'>{bins_text} - Immediate attention needed</div>
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # --- Alerts System ---
+    # Full / warning banners use the sidebar thresholds, like the bin cards. When alerts.py
+    # is running, it reports bins that have gone offline, and its streaming fill-rate
+    # projections replace this run's forecast if it projects to the sidebar's threshold
+    # and horizon.
+    engine = fetch_active_alerts()
+    engine_soon = engine is not None and (engine[0].get('full_cm'), engine[0].get('full_soon_hours')) \
+        == (full_threshold, forecast_horizon)
+    full_bins, warning_bins = analytics.alert_lists(bin_overview, full_soon=not engine_soon)
+    offline_bins = []
+    if engine is not None:
+        soon_bins, offline_bins = analytics.engine_alert_lists(engine[1], {device_id: "Paper"})
+        if engine_soon:
+            warning_bins += soon_bins
+
+    if full_bins:
+        bins_text = ", ".join(full_bins)
+        st.markdown(f"""
+            <div class='alert-banner alert-critical'>
+                <div class='alert-icon'>🚨</div>
+                <div class='alert-content'>
+                    <div class='alert-title'>URGENT: Collection Required</div>
+                    <div class='alert-message'>{bins_text} - Immediate attention needed</div>
+                </div>
             </div>
-        </div>
-    """, unsafe_allow_html=True)
-elif warning_bins:
-    bins_text = ", ".join(warning_bins)
-    st.markdown(f"""
-        <div class='alert-banner alert-warning'>
-            <div class='alert-icon'>⚠️</div>
-            <div class='alert-content'>
-                <div class='alert-title'>Warning: Approaching Capacity</div>
-                <div class='alert-message'>{bins_text} - Schedule collection soon</div>
+        """, unsafe_allow_html=True)
+    elif warning_bins:
+        bins_text = ", ".join(warning_bins)
+        st.markdown(f"""
+            <div class='alert-banner alert-warning'>
+                <div class='alert-icon'>⚠️</div>
+                <div class='alert-content'>
+                    <div class='alert-title'>Warning: Approaching Capacity</div>
+                    <div class='alert-message'>{bins_text} - Schedule collection soon</div>
+                </div>
             </div>
-        </div>
-    """, unsafe_allow_html=True)
-
-
-# --- Main Metrics ---
-st.markdown("<div class='section-header'>📊 Key Performance Indicators</div>", unsafe_allow_html=True)
-
-
-col1, col2, col3, col4 = st.columns(4)
+        """, unsafe_allow_html=True)
 
+    if offline_bins:
+        bins_text = ", ".join(offline_bins)
+        st.markdown(f"""
+            <div class='alert-banner alert-offline'>
+                <div class='alert-icon'>📴</div>
+                <div class='alert-content'>
+                    <div class='alert-title'>Offline: No Recent Data</div>
+                    <div class='alert-message'>{bins_text} - Check power and connectivity</div>
+                </div>
+            </div>
+        """, unsafe_allow_html=True)
 
-with col1:
-    total_disposals = len(servo_actions_df) if not servo_actions_df.empty else 0
-    st.markdown(f"""
-        <div class='metric-card'>
-            <div class='metric-label'>Total Items Processed</div>
-            <div class='metric-value'>{total_disposals}</div>
-            <div class='metric-delta' style='color: #4CAF50;'>↗ {time_range.lower()}</div>
-        </div>
-    """, unsafe_allow_html=True)
+    # --- Main Metrics ---
+    st.markdown("<div class='section-header'>📊 Key Performance Indicators</div>", unsafe_allow_html=True)
 
+    col1, col2, col3, col4 = st.columns(4)
 
-with col2:
-    if not servo_actions_df.empty:
-        successful = len(servo_actions_df[servo_actions_df['opened'] == True])
-        success_rate = (successful / len(servo_actions_df) * 100)
+    with col1:
+        total_disposals = servo_kpis['total']
         st.markdown(f"""
             <div class='metric-card'>
-                <div class='metric-label'>Acceptance Rate</div>
-                <div class='metric-value'>{success_rate:.1f}%</div>
-                <div class='metric-delta' style='color: #4CAF50;'>✓ {successful} accepted</div>
+                <div class='metric-label'>Total Items Processed</div>
+                <div class='metric-value'>{total_disposals}</div>
+                <div class='metric-delta' style='color: #4CAF50;'>↗ {time_range.lower()}</div>
             </div>
         """, unsafe_allow_html=True)
-    else:
+
+    with col2:
+        if servo_kpis['total']:
+            successful = servo_kpis['accepted']
+            success_rate = (successful / servo_kpis['total'] * 100)
+            st.markdown(f"""
+                <div class='metric-card'>
+                    <div class='metric-label'>Acceptance Rate</div>
+                    <div class='metric-value'>{success_rate:.1f}%</div>
+                    <div class='metric-delta' style='color: #4CAF50;'>✓ {successful} accepted</div>
+                </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown(f"""
+                <div class='metric-card'>
+                    <div class='metric-label'>Acceptance Rate</div>
+                    <div class='metric-value'>—</div>
+                    <div class='metric-delta'>No data</div>
+                </div>
+            """, unsafe_allow_html=True)
+
+    with col3:
+        avg_fill = bin_overview['fill_pct'].mean()
         st.markdown(f"""
             <div class='metric-card'>
-                <div class='metric-label'>Acceptance Rate</div>
-                <div class='metric-value'>—</div>
-                <div class='metric-delta'>No data</div>
+                <div class='metric-label'>Average Fill Level</div>
+                <div class='metric-value'>{avg_fill:.0f}%</div>
+                <div class='metric-delta' style='color: #FF9800;'>⚡ Across all bins</div>
             </div>
         """, unsafe_allow_html=True)
 
-
-with col3:
-    avg_fill = (
-        ((paper_bin_height - paper_distance) / paper_bin_height * 100) +
-        ((aluminium_bin_height - aluminium_distance) / aluminium_bin_height * 100) +
-        ((glass_bin_height - glass_distance) / glass_bin_height * 100)
-    ) / 3
-    st.markdown(f"""
-        <div class='metric-card'>
-            <div class='metric-label'>Average Fill Level</div>
-            <div class='metric-value'>{avg_fill:.0f}%</div>
-            <div class='metric-delta' style='color: #FF9800;'>⚡ Across all bins</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-
-with col4:
-    if current_gps and current_gps.get('latitude', 0) != 0.0:
-        gps_status = "🟢 Online"
-        gps_delta = "Signal OK"
-        gps_color = "#4CAF50"
-    elif current_gps:
-        gps_status = "🟡 Initializing"
-        gps_delta = "Acquiring fix"
-        gps_color = "#FF9800"
-    else:
-        gps_status = "🔴 Offline"
-        gps_delta = "No data"
-        gps_color = "#f44336"
+    with col4:
+        if current_gps and current_gps.get('latitude', 0) != 0.0:
+            gps_status = "🟢 Online"
+            gps_delta = "Signal OK"
+            gps_color = "#4CAF50"
+        elif current_gps:
+            gps_status = "🟡 Initializing"
+            gps_delta = "Acquiring fix"
+            gps_color = "#FF9800"
+        else:
+            gps_status = "🔴 Offline"
+            gps_delta = "No data"
+            gps_color = "#f44336"
    
-    st.markdown(f"""
-        <div class='metric-card'>
-            <div class='metric-label'>GPS Status</div>
-            <div class='metric-value' style='font-size: 24px;'>{gps_status}</div>
-            <div class='metric-delta' style='color: {gps_color};'>{gps_delta}</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-
-st.markdown("<br>", unsafe_allow_html=True)
-
-
-# --- Bin Status Cards ---
-st.markdown("<div class='section-header'>🗑️ Bin Status Overview</div>", unsafe_allow_html=True)
-
-
-col1, col2, col3 = st.columns(3)
+        st.markdown(f"""
+            <div class='metric-card'>
+                <div class='metric-label'>GPS Status</div>
+                <div class='metric-value' style='font-size: 24px;'>{gps_status}</div>
+                <div class='metric-delta' style='color: {gps_color};'>{gps_delta}</div>
+            </div>
+        """, unsafe_allow_html=True)
 
+    st.markdown("<br>", unsafe_allow_html=True)
 
-bins_data = [
-    ("Paper", paper_distance, paper_status, paper_bin_height, col1),
-    ("Aluminium", aluminium_distance, aluminium_status, aluminium_bin_height, col2),
-    ("Glass", glass_distance, glass_status, glass_bin_height, col3)
-]
+    # --- Bin Status Cards ---
+    st.markdown("<div class='section-header'>🗑️ Bin Status Overview</div>", unsafe_allow_html=True)
 
+    col1, col2, col3 = st.columns(3)
 
-for bin_name, distance, status, height, col in bins_data:
-    with col:
-        fill_pct = max(0, min(100, (height - distance) / height * 100))
-        st.markdown(f"""
-            <div class='bin-card status-{status[0]}'>
-                <div class='bin-header'>
-                    <div class='bin-name'>{status[2]} {bin_name}</div>
-                    <span class='status-badge {status[0]}'>{status[1]}</span>
+    for bin_row, col, forecast in zip(bin_overview.itertuples(), (col1, col2, col3), bin_forecasts):
+        with col:
+            status, fill_pct = bin_row.status, bin_row.fill_pct
+            if forecast is not None:
+                forecast_text = f"Full in: {analytics.format_hours(forecast['hours_to_full'])} · {forecast['rate_cm_per_hour']:.2f} cm/h"
+            else:
+                forecast_text = "Full in: no forecast"
+            st.markdown(f"""
+                <div class='bin-card status-{status}'>
+                    <div class='bin-header'>
+                        <div class='bin-name'>{analytics.STATUS_ICONS[status]} {bin_row.name}</div>
+                        <span class='status-badge {status}'>{analytics.STATUS_LABELS[status]}</span>
+                    </div>
+                    <div class='bin-distance'>{bin_row.distance_cm:g} cm</div>
+                    <div style='font-size: 13px; color: #666; margin-top: 4px;'>Fill: {fill_pct:.0f}%</div>
+                    <div style='font-size: 12px; color: #999; margin-top: 2px;'>{forecast_text}</div>
                 </div>
-                <div class='bin-distance'>{distance} cm</div>
-                <div style='font-size: 13px; color: #666; margin-top: 4px;'>Fill: {fill_pct:.0f}%</div>
-            </div>
-        """, unsafe_allow_html=True)
-        st.progress(fill_pct / 100)
+            """, unsafe_allow_html=True)
+            st.progress(fill_pct / 100)
+
+    st.markdown("<br>", unsafe_allow_html=True)
 
 
-st.markdown("<br>", unsafe_allow_html=True)
+render_live_status()
 
 
 # --- Analytics Section ---
 st.markdown("<div class='section-header'>📈 Analytics & Insights</div>", unsafe_allow_html=True)
 
 
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Trends", "🎯 Composition", "📝 Activity Log", "🗺️ Route Planning"])
-
+# Only the selected view is computed and rendered; each one is a fragment so
+# interacting with it reruns just that view instead of the whole page, and it
+# re-reads its data on its own every refresh interval
+@st.fragment(run_every=refresh_rate)
+def render_trends():
+    import plotly.graph_objects as go
 
-with tab1:
+    start_ts, local, _ = current_window()
     col1, col2 = st.columns([2, 1])
    
     with col1:
         st.markdown("#### Fill Level Trend")
-        if not bin_history_df.empty:
-            bin_history_df['datetime'] = pd.to_datetime(bin_history_df['timestamp'], unit='s')
+        history = analytics.typed_history(fetch_bin_history(start_ts, local))
+        if not history.empty:
            
             fig = go.Figure()
             fig.add_trace(go.Scatter(
-                x=bin_history_df['datetime'],
-                y=bin_history_df['distance_cm'],
+                x=history['datetime'],
+                y=history['distance_cm'],
                 mode='lines+markers',
                 name='Distance',
                 line=dict(color='#4CAF50', width=3),
@@ -615,9 +531,8 @@ with tab1:
    
     with col2:
         st.markdown("#### Hourly Activity")
-        if not servo_actions_df.empty:
-            servo_actions_df['hour'] = pd.to_datetime(servo_actions_df['timestamp'], unit='s').dt.hour
-            hourly = servo_actions_df.groupby('hour').size().reset_index(name='count')
+        hourly = fetch_hourly_activity(start_ts, local)
+        if not hourly.empty:
            
             # Add hardcoded values if data is sparse
             if len(hourly) < 5:
@@ -669,13 +584,18 @@ with tab1:
             st.plotly_chart(fig, use_container_width=True)
 
 
-with tab2:
+@st.fragment(run_every=refresh_rate)
+def render_composition():
+    import plotly.graph_objects as go
+
+    start_ts, local, _ = current_window()
+    servo_kpis = fetch_servo_kpis(start_ts, local)
     col1, col2 = st.columns(2)
    
     with col1:
         st.markdown("#### Waste Type Distribution")
-        if not servo_actions_df.empty:
-            counts = servo_actions_df['bin_type'].value_counts()
+        if servo_kpis['by_type']:
+            counts = pd.Series(servo_kpis['by_type']).sort_values(ascending=False)
            
             colors = {'paper': '#4CAF50', 'aluminium': '#66BB6A', 'glass': '#81C784'}
             color_list = [colors.get(x.lower(), '#4CAF50') for x in counts.index]
@@ -701,8 +621,8 @@ with tab2:
    
     with col2:
         st.markdown("#### Acceptance vs Rejection")
-        if not servo_actions_df.empty:
-            acceptance = servo_actions_df['opened'].value_counts()
+        if servo_kpis['total']:
+            acceptance = {True: servo_kpis['accepted'], False: servo_kpis['rejected']}
            
             fig = go.Figure(data=[go.Bar(
                 x=['Accepted', 'Rejected'],
@@ -724,16 +644,41 @@ with tab2:
             st.info("📊 No acceptance data")
 
 
-with tab3:
+@st.fragment(run_every=refresh_rate)
+def render_activity_log():
     st.markdown("#### Recent Activity Log")
-    if not servo_actions_df.empty:
-        recent = servo_actions_df.tail(15).copy()
-        recent['Time'] = pd.to_datetime(recent['timestamp'], unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
-        recent['Type'] = recent['bin_type'].str.title()
-        recent['Status'] = recent['opened'].apply(lambda x: '✅ Accepted' if x else '⛔ Rejected')
-       
-        display_df = recent[['Time', 'Type', 'Status']].sort_values('Time', ascending=False)
-       
+
+    # Changing a filter goes back to the newest page
+    def reset_log_pages():
+        st.session_state['log_cursors'] = [None]
+
+    col_type, col_status, col_prev, col_page, col_next = st.columns([2, 2, 1, 1, 1])
+    with col_type:
+        st.selectbox("Waste type", list(LOG_TYPE_FILTERS), key="log_type",
+                     on_change=reset_log_pages, label_visibility="collapsed")
+    with col_status:
+        st.selectbox("Action", list(LOG_STATUS_FILTERS), key="log_status",
+                     on_change=reset_log_pages, label_visibility="collapsed")
+    bin_type, opened = log_filters()
+
+    # Stack of start_after cursors: entry i is where page i starts (None = newest)
+    cursors = st.session_state.setdefault('log_cursors', [None])
+    start_ts, _, _ = current_window()
+    page, next_cursor = fetch_servo_log_page(start_ts, LOG_PAGE_SIZE, bin_type, opened, cursors[-1])
+
+    with col_prev:
+        if st.button("◀ Newer", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun(scope="fragment")
+    with col_page:
+        st.markdown(f"<div style='text-align: center; padding-top: 8px;'>Page {len(cursors)}</div>", unsafe_allow_html=True)
+    with col_next:
+        if st.button("Older ▶", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun(scope="fragment")
+
+    display_df = analytics.activity_log(page)
+    if not display_df.empty:
         st.dataframe(
             display_df,
             use_container_width=True,
@@ -749,14 +694,53 @@ with tab3:
         st.info("📝 No recent activity logs found")
 
 
-with tab4:
+def render_fleet_map(index):
+    import pydeck as pdk
+
+    focus = st.selectbox("Focus", ["Whole fleet"] + sorted(index.device_id), key="map_focus")
+    fit_lat, fit_lon, fit_zoom = index.fit(MAP_WIDTH_PX, MAP_HEIGHT_PX)
+    if focus == "Whole fleet":
+        lat, lon, default_zoom = fit_lat, fit_lon, fit_zoom
+    else:
+        (lat, lon), default_zoom = index.position(focus), 17
+    zoom = st.slider("Zoom", 1, fleet_map.MAX_ZOOM, int(round(default_zoom)), key=f"map_zoom_{focus}")
+
+    # Clusters for this zoom come from the shared index; only those in view are sent to the browser
+    bbox = fleet_map.viewport(lat, lon, zoom, MAP_WIDTH_PX, MAP_HEIGHT_PX)
+    visible = fleet_map.layer_data(index.query(bbox, zoom))
+    layers = [
+        pdk.Layer("ScatterplotLayer", visible, get_position=["longitude", "latitude"],
+                  get_fill_color="color", get_radius="radius", radius_units="pixels",
+                  opacity=0.85, stroked=True, get_line_color=[255, 255, 255], line_width_min_pixels=1,
+                  pickable=True),
+        pdk.Layer("TextLayer", visible[visible['count'] > 1], get_position=["longitude", "latitude"],
+                  get_text="label", get_size=12, get_color=[255, 255, 255]),
+    ]
+    st.pydeck_chart(pdk.Deck(
+        layers=layers,
+        initial_view_state=pdk.ViewState(latitude=lat, longitude=lon, zoom=zoom),
+        tooltip={"html": "<b>{title}</b><br/>{detail}"},
+        map_style=None,
+    ), use_container_width=True, height=MAP_HEIGHT_PX)
+
+    in_view = int(visible['count'].sum()) if not visible.empty else 0
+    st.caption(f"📍 {in_view} of {len(index)} bins in view · {len(visible)} markers")
+
+
+@st.fragment(run_every=refresh_rate)
+def render_route_planning():
     st.markdown("#### 🗺️ Collection Route Planning")
+    current_gps = fetch_gps_location()
+    _, _, bin_overview = load_bin_overview()
    
     col1, col2 = st.columns([2, 1])
    
     with col1:
-        # Map display
-        if current_gps and current_gps.get('latitude', 0) != 0.0:
+        # Map display: the whole fleet when ingest has populated `fleet`, else this bin's GPS
+        fleet_index = fetch_fleet_index()
+        if fleet_index is not None and len(fleet_index):
+            render_fleet_map(fleet_index)
+        elif current_gps and current_gps.get('latitude', 0) != 0.0:
             lat = current_gps.get('latitude')
             lon = current_gps.get('longitude')
            
@@ -775,42 +759,134 @@ with tab4:
     with col2:
         st.markdown("#### Optimized Route")
        
-        # Calculate priority based on fill levels
-        bins_priority = []
-        for bin_name, distance, status, height, _ in bins_data:
-            fill_pct = (height - distance) / height * 100
-            priority = "🔴 HIGH" if status[0] == "full" else ("🟡 MEDIUM" if status[0] == "warning" else "🟢 LOW")
-            bins_priority.append((bin_name, fill_pct, priority, distance))
-       
-        # Sort by fill percentage (highest first)
-        bins_priority.sort(key=lambda x: x[1], reverse=True)
+        # Priority and order come from the fill levels predicted at the forecast horizon
+        route, total_bins, est_time = analytics.route_plan(bin_overview)
        
         st.markdown("""
             <div class='route-card'>
                 <div style='font-weight: 700; margin-bottom: 12px; color: #2d5016;'>Collection Priority</div>
         """, unsafe_allow_html=True)
        
-        for idx, (name, fill, priority, dist) in enumerate(bins_priority, 1):
+        for idx, stop in enumerate(route.itertuples(), 1):
             st.markdown(f"""
                 <div class='route-step'>
                     <div class='route-number'>{idx}</div>
                     <div style='flex: 1;'>
-                        <div style='font-weight: 600; color: #2d5016;'>{name} Bin</div>
-                        <div style='font-size: 12px; color: #666;'>Fill: {fill:.0f}% · {dist} cm</div>
+                        <div style='font-weight: 600; color: #2d5016;'>{stop.name} Bin</div>
+                        <div style='font-size: 12px; color: #666;'>Fill in {forecast_horizon}h: {stop.predicted_fill_pct:.0f}% · {stop.distance_cm:g} cm</div>
                     </div>
-                    <div style='font-size: 12px; font-weight: 700;'>{priority}</div>
+                    <div style='font-size: 12px; font-weight: 700;'>{stop.priority}</div>
                 </div>
             """, unsafe_allow_html=True)
        
         st.markdown("</div>", unsafe_allow_html=True)
        
-        # Estimated collection time
-        total_bins = len([b for b in bins_priority if b[1] > 50])
-        est_time = total_bins * 15  # 15 minutes per bin
-       
+        # Estimated collection time (15 minutes per bin above 50%)
         st.info(f"⏱️ Estimated collection time: {est_time} minutes ({total_bins} bins)")
 
 
-# Auto-refresh
-time.sleep(refresh_rate)
-st.rerun()
\ No newline at end of file
+COMMAND_LABELS = {
+    "ping": "Ping",
+    "send_telemetry": "Force telemetry",
+    "open_lid": "Unlock / open lid",
+    "set_threshold": "Set full threshold",
+}
+
+
+@st.fragment(run_every=refresh_rate)
+def render_commands():
+    import commands
+
+    st.markdown("#### 📡 Bin Commands")
+    fleet_index = fetch_fleet_index()
+    if fleet_index is not None and len(fleet_index):
+        devices = sorted(fleet_index.device_id)
+    else:
+        device_id = device_of(fetch_bin_status())
+        devices = [device_id] if device_id != 'Unknown' else []
+
+    with st.form("command_form"):
+        col_target, col_cmd, col_arg = st.columns([2, 1, 1])
+        with col_target:
+            targets = st.multiselect("Bins", devices, default=devices[:1])
+            broadcast = st.checkbox("All bins (one broadcast)")
+        with col_cmd:
+            cmd = st.selectbox("Command", list(commands.COMMANDS), format_func=COMMAND_LABELS.get)
+        with col_arg:
+            lid = st.selectbox("Lid", commands.LIDS, help="For Unlock / open lid")
+            threshold = st.number_input("Full threshold (cm)", 2, 100, int(full_threshold), help="For Set full threshold")
+        submitted = st.form_submit_button("Send", type="primary")
+
+    if submitted:
+        args = {"open_lid": {"bin": lid}, "set_threshold": {"distance_cm": threshold}}.get(cmd, {})
+        try:
+            command_id = get_command_sender().send(commands.BROADCAST if broadcast else targets, cmd, args)
+        except Exception as e:
+            st.error(f"❌ Could not send command: {e}")
+        else:
+            data_access.cache().invalidate(('commands', 'recent'))
+            st.success(f"Sent {COMMAND_LABELS[cmd]} · {command_id}")
+
+    # Acks arrive through the bridge; RTT is dashboard issue -> ack back at the bridge
+    recent = pd.DataFrame([commands.command_summary(doc) for doc in fetch_recent_commands()])
+    if recent.empty:
+        st.info("📝 No commands sent yet")
+        return
+    st.dataframe(
+        pd.DataFrame({
+            'Time': analytics.to_datetime(recent['issued_at'].to_numpy(dtype=float)).strftime('%H:%M:%S'),
+            'Command': recent['cmd'].map(COMMAND_LABELS).fillna(recent['cmd']),
+            'Bins': recent['devices'],
+            'Acked': [f"{a}/{e:.0f}" if pd.notna(e) else str(a) for a, e in zip(recent['acked'], recent['expected'])],
+            'Failed': recent['failed'],
+            'RTT p50 (ms)': recent['rtt_p50_ms'],
+            'RTT max (ms)': recent['rtt_max_ms'],
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "RTT p50 (ms)": st.column_config.NumberColumn(format="%.0f"),
+            "RTT max (ms)": st.column_config.NumberColumn(format="%.0f"),
+        }
+    )
+
+
+views = {
+    "📊 Trends": render_trends,
+    "🎯 Composition": render_composition,
+    "📝 Activity Log": render_activity_log,
+    "🗺️ Route Planning": render_route_planning,
+    "📡 Commands": render_commands,
+}
+selected_view = st.radio("View", list(views), horizontal=True, label_visibility="collapsed", key="analytics_view")
+with timer.phase(f"view: {selected_view}"):
+    views[selected_view]()
+
+
+# Cache stats are filled in last so they include this run's lookups
+with cache_stats_slot.container():
+    cache_stats = data_access.cache().stats()
+    st.markdown("### 🗄️ Data Cache")
+    st.markdown(f"**Hit rate:** {cache_stats['hit_rate'] * 100:.0f}% "
+                f"({cache_stats['hits']} hits · {cache_stats['coalesced']} shared · {cache_stats['misses']} misses)")
+    st.markdown(f"**Entries:** {cache_stats['entries']} · {cache_stats['bytes'] / 1024 / 1024:.1f} MB "
+                f"· {cache_stats['evictions']} evicted")
+
+    # Timing panel: this run's phases plus process-wide cold start and rerun times
+    history = run_history()
+    history.record(timer.elapsed())
+    run_summary = history.summary()
+    with st.expander("⏱️ Timing", expanded=False):
+        st.markdown(f"**Cold start:** {run_summary['cold_start'] * 1000:.0f} ms")
+        st.markdown(f"**This run:** {timer.elapsed() * 1000:.0f} ms")
+        st.markdown(f"**Median rerun:** {run_summary['median'] * 1000:.0f} ms over {run_summary['runs']} runs")
+        st.dataframe(
+            pd.DataFrame([(name, secs * 1000) for name, secs in timer.phases], columns=['Phase', 'ms']),
+            use_container_width=True,
+            hide_index=True,
+            column_config={"ms": st.column_config.NumberColumn("ms", format="%.1f")}
+        )
+
+
+# Fragment reruns from here on time themselves (see current_window)
+page_done = True
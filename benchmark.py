@@ -0,0 +1,240 @@
+"""End-to-end latency benchmark: simulator -> MQTT -> bridge -> Pub/Sub -> dashboard.
+
+Runs `simulator.py` and `bridge.py` as separate processes against a local MQTT
+broker (e.g. `mosquitto -p 1883`). The bridge publishes into a fake Pub/Sub
+client that hands messages to this harness, which measures:
+
+- throughput and bridge latency (simulator publish -> Pub/Sub publish call);
+- with FIRESTORE_EMULATOR_HOST set, ingest-to-visible latency: messages are
+  written by `ingest.TelemetryWriter` into the emulator and timed until the
+  dashboard's `queries.fetch_bin_history()` returns them;
+- CPU and peak RSS of the simulator, bridge and harness processes (needs psutil).
+
+    python benchmark.py --bins 500 --interval 5 --duration 60 --max-p99-ms 250
+
+Exits non-zero when a `--max-*`/`--min-*` gate is missed, so it can run as a
+regression check before rolling out to more bins.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+TOPIC_PATH = "projects/benchmark/topics/smartbin-readings"
+POLL_INTERVAL = 0.5
+SAMPLE_INTERVAL = 1.0
+DRAIN_TIMEOUT = 10.0
+
+
+# --- FAKE PUB/SUB ---
+class QueuePublisher:
+    """Stands in for `pubsub_v1.PublisherClient` inside the bridge process."""
+
+    def __init__(self, out):
+        self.out = out
+
+    def topic_path(self, project, topic):
+        return TOPIC_PATH
+
+    def publish(self, topic, data, **attrs):
+        self.out.put((time.time(), data))
+
+
+class FakeMessage:
+    """Just enough of a Pub/Sub message for `ingest.TelemetryWriter`."""
+
+    def __init__(self, message_id, data, published):
+        self.message_id = message_id
+        self.data = data
+        self.publish_time = datetime.datetime.fromtimestamp(published, tz=datetime.timezone.utc)
+
+    def ack(self):
+        pass
+
+    def nack(self):
+        pass
+
+
+# --- COMPONENT PROCESSES ---
+def _bridge_process(out, host, port):
+    import bridge
+    bridge.run(QueuePublisher(out), TOPIC_PATH, host, port, verbose=False)
+
+
+def _simulator_process(args, done):
+    import simulator
+    done.value = simulator.run(args.bins, args.interval, args.duration, args.host, args.port, seed=args.seed)
+
+
+class ResourceSampler(threading.Thread):
+    def __init__(self, pids):
+        super().__init__(daemon=True)
+        self.procs = {name: psutil.Process(pid) for name, pid in pids.items()}
+        self.cpu = {name: [] for name in pids}
+        self.rss = {name: 0 for name in pids}
+        self.stopped = threading.Event()
+
+    def run(self):
+        for proc in self.procs.values():
+            proc.cpu_percent(None)
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            for name, proc in self.procs.items():
+                try:
+                    self.cpu[name].append(proc.cpu_percent(None))
+                    self.rss[name] = max(self.rss[name], proc.memory_info().rss)
+                except psutil.Error:
+                    pass
+
+
+class VisibilityPoller(threading.Thread):
+    """Polls the dashboard's history query and times when each reading shows up."""
+
+    def __init__(self, db, since, sent_at):
+        super().__init__(daemon=True)
+        self.db = db
+        self.since = since
+        self.sent_at = sent_at
+        self.seen = set()
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def poll(self):
+        import queries
+        df = queries.fetch_bin_history(self.db, self.since)
+        now = time.time()
+        if df.empty:
+            return
+        for ts in df['timestamp'].round(6):
+            if ts in self.seen or ts not in self.sent_at:
+                continue
+            self.seen.add(ts)
+            self.latencies.append(now - self.sent_at[ts])
+        self.since = float(df['timestamp'].max())
+
+    def run(self):
+        while not self.stopped.wait(POLL_INTERVAL):
+            self.poll()
+
+
+def percentiles(values):
+    if not values:
+        return None, None
+    arr = np.asarray(values) * 1000
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the telemetry chain for a given fleet size.")
+    parser.add_argument("--bins", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between reports per bin")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if p99 latency exceeds this")
+    parser.add_argument("--min-throughput", type=float, help="Fail if delivered msgs/s falls below this")
+    args = parser.parse_args()
+
+    use_firestore = bool(os.environ.get("FIRESTORE_EMULATOR_HOST"))
+    forwarded = mp.Queue()
+    sim_done = mp.Value('i', -1)
+
+    bridge_proc = mp.Process(target=_bridge_process, args=(forwarded, args.host, args.port), name="bridge")
+    bridge_proc.start()
+    time.sleep(1.0)  # Let the bridge subscribe before traffic starts
+    started = time.time()
+    sim_proc = mp.Process(target=_simulator_process, args=(args, sim_done), name="simulator")
+    sim_proc.start()
+
+    sampler = None
+    if psutil is not None:
+        sampler = ResourceSampler({"simulator": sim_proc.pid, "bridge": bridge_proc.pid, "harness": os.getpid()})
+        sampler.start()
+
+    writer = poller = None
+    sent_at = {}
+    if use_firestore:
+        import ingest
+        import queries
+        db = queries.script_client()
+        writer = ingest.TelemetryWriter(db).start()
+        poller = VisibilityPoller(db, started, sent_at)
+        poller.start()
+
+    bridge_latencies = []
+    received = 0
+    last_received = time.time()
+    while True:
+        try:
+            published, data = forwarded.get(timeout=0.2)
+        except queue.Empty:
+            if not sim_proc.is_alive() and time.time() - last_received > DRAIN_TIMEOUT / 5:
+                break
+            continue
+        last_received = time.time()
+        received += 1
+        payload = json.loads(data)
+        bridge_latencies.append(published - payload["sim_sent"])
+        if writer is not None:
+            message = FakeMessage(str(received), data, published)
+            sent_at[round(message.publish_time.timestamp(), 6)] = payload["sim_sent"]
+            writer(message)
+    elapsed = last_received - started
+
+    if writer is not None:
+        writer.stop()
+        deadline = time.time() + DRAIN_TIMEOUT
+        while len(poller.seen) < received and time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+        poller.stopped.set()
+    if sampler is not None:
+        sampler.stopped.set()
+    bridge_proc.terminate()
+    sim_proc.join()
+    bridge_proc.join()
+
+    # --- REPORT ---
+    throughput = received / elapsed if elapsed > 0 else 0.0
+    print(f"Fleet: {args.bins} bins every {args.interval:.0f}s for {args.duration:.0f}s")
+    print(f"Sent {max(sim_done.value, 0)} · delivered {received} · {throughput:.1f} msg/s")
+    p50, p99 = percentiles(bridge_latencies)
+    if p50 is not None:
+        print(f"Bridge latency: p50 {p50:.1f} ms · p99 {p99:.1f} ms")
+    gate_p99 = p99
+    if poller is not None:
+        v50, v99 = percentiles(poller.latencies)
+        if v50 is not None:
+            print(f"Ingest-to-visible latency: p50 {v50:.1f} ms · p99 {v99:.1f} ms "
+                  f"({len(poller.seen)}/{received} visible)")
+            gate_p99 = v99
+    if sampler is not None:
+        for name in sampler.procs:
+            cpu = sampler.cpu[name]
+            print(f"{name:>9}: CPU avg {np.mean(cpu) if cpu else 0:.1f}% · "
+                  f"peak {max(cpu) if cpu else 0:.1f}% · RSS {sampler.rss[name] / 1024 / 1024:.0f} MB")
+    else:
+        print("Install psutil for per-component CPU/RSS")
+
+    failures = []
+    if args.max_p99_ms is not None and (gate_p99 is None or gate_p99 > args.max_p99_ms):
+        failures.append(f"p99 latency {gate_p99} ms > {args.max_p99_ms} ms")
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        failures.append(f"throughput {throughput:.1f} msg/s < {args.min_throughput}")
+    if failures:
+        raise SystemExit("FAILED: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
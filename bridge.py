@@ -1,22 +1,178 @@
+import argparse
+import json
 import os
+import zlib
 import paho.mqtt.client as mqtt
-from google.cloud import pubsub_v1
+
+import commands
+import ratelimit
+import sinks
 
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "smart-bin-project-483011-4eaae0f99610.json"
 project_id = "smart-bin-project-483011"
 topic_id = "smartbin-readings"
 
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(project_id, topic_id)
+MQTT_HOST = "localhost"
+MQTT_PORT = 1883
+MQTT_TOPIC = "smartbin/+/data"
+EVENTS_TOPIC = "smartbin/+/events"   # Batched classification events from the Pis
+PUBSUB_WORKERS = 4
+
+
+def make_publisher():
+    from google.cloud import pubsub_v1
+    # Ordering keys (the device id) keep each bin's readings in order through the client's batching
+    options = pubsub_v1.types.PublisherOptions(enable_message_ordering=True)
+    publisher = pubsub_v1.PublisherClient(publisher_options=options)
+    return publisher, publisher.topic_path(project_id, topic_id)
+
+
+# Pub/Sub is always a sink; the local file, second broker and command acks are opt-in
+# ordered: publish with ordering keys (needs a publisher from make_publisher())
+def make_sinks(publisher, topic_path, file_dir=None, mirror_host=None, mirror_port=MQTT_PORT,
+               mirror_devices=None, ack_db=None, ordered=False):
+    # Pi classification events go to the cloud with the readings; ingest writes them to `events`
+    readings = sinks.Route(topics=[MQTT_TOPIC, EVENTS_TOPIC])
+    runners = [sinks.SinkRunner(sinks.PubSubSink(publisher, topic_path, ordered), route=readings,
+                                workers=PUBSUB_WORKERS)]
+    if file_dir:
+        route = sinks.Route(topics=[MQTT_TOPIC])
+        runners.append(sinks.SinkRunner(sinks.FileSink(file_dir), route=route, batch_size=500, batch_interval=1.0))
+        route = sinks.Route(topics=[EVENTS_TOPIC])
+        runners.append(sinks.SinkRunner(sinks.EventFileSink(file_dir), route=route, batch_size=500,
+                                        batch_interval=1.0))
+    if mirror_host:
+        route = sinks.Route(devices=mirror_devices, topics=[MQTT_TOPIC])
+        runners.append(sinks.SinkRunner(sinks.MqttSink(mirror_host, mirror_port), route=route))
+    if ack_db is not None:
+        route = sinks.Route(topics=[commands.ACK_TOPIC])
+        runners.append(sinks.SinkRunner(commands.AckSink(ack_db), route=route, batch_interval=0.5))
+    return sinks.FanOut(runners)
+
+
+def unpack_events(payload):
+    """A zlib-compressed JSON batch from `AI Model/events.py` -> one JSON string per event."""
+    return [json.dumps(event) for event in json.loads(zlib.decompress(payload))]
+
+
+# limiter: a ratelimit.RateLimiter applied to readings before they reach any sink
+def make_client(fanout, verbose=True, downlink=None, limiter=None):
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe([(MQTT_TOPIC, 0), (commands.ACK_TOPIC, commands.QOS), (EVENTS_TOPIC, 1)])
+
+    def on_message(client, userdata, msg):
+        if mqtt.topic_matches_sub(EVENTS_TOPIC, msg.topic):
+            try:
+                events = unpack_events(msg.payload)
+            except (zlib.error, ValueError) as e:
+                print(f"Dropping malformed event batch on {msg.topic}: {e}")
+                return
+            if verbose:
+                print(f"Received {len(events)} classification events on {msg.topic}")
+            for event in events:
+                fanout(msg.topic, event)
+            return
+        payload = msg.payload.decode("utf-8")
+        if verbose:
+            print(f"Received: {payload}")
+        if mqtt.topic_matches_sub(commands.ACK_TOPIC, msg.topic):
+            if downlink is not None:
+                try:
+                    payload = downlink.on_ack(msg.topic, payload)
+                except ValueError as e:
+                    print(f"Dropping malformed ack on {msg.topic}: {e}")
+                    return
+        elif limiter is not None and not limiter.admit(sinks.device_from_topic(msg.topic), msg.topic, payload):
+            return  # Over the limit: dropped, or held back to be coalesced
+        fanout(msg.topic, payload)
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    if downlink is not None:
+        downlink.client = client   # Commands go out over the same persistent connection
+    return client
+
+
+def subscribe_commands(downlink):
+    from google.cloud import pubsub_v1
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(project_id, commands.SUBSCRIPTION_ID)
+    return subscriber.subscribe(subscription_path, callback=downlink.on_pubsub_message)
+
+
+# publisher/topic_path can be swapped for a fake (see benchmark.py)
+# downlink: a commands.Downlink to also forward dashboard commands to the bins
+def run(publisher=None, topic_path=None, host=MQTT_HOST, port=MQTT_PORT, verbose=True,
+        fanout=None, report_every=None, downlink=None, limiter=None):
+    if fanout is None:
+        if publisher is None:
+            publisher, topic_path = make_publisher()
+            fanout = make_sinks(publisher, topic_path, ordered=True)
+        else:
+            fanout = make_sinks(publisher, topic_path)
+    fanout.start()
+    client = make_client(fanout, verbose, downlink, limiter)
+    if limiter is not None and limiter.policy == "coalesce":
+        limiter.release_every(ratelimit.RELEASE_INTERVAL, fanout)
+    client.connect(host, port, 60)
+    command_pull = subscribe_commands(downlink) if downlink is not None else None
+
+    def report(text):
+        if limiter is not None:
+            text += "\n" + ratelimit.format_stats(limiter.stats(), limiter.throttled_devices())
+        if downlink is not None:
+            text += "\n" + commands.format_stats(downlink.stats())
+        print(text)
+
+    if report_every:
+        fanout.report_every(report_every, report)
+    try:
+        client.loop_forever()
+    finally:
+        if command_pull is not None:
+            command_pull.cancel()
+        client.disconnect()
+        fanout.stop(timeout=10)
+        report(sinks.format_stats(fanout.received, fanout.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forward smart bin telemetry from MQTT to Pub/Sub and other sinks.")
+    parser.add_argument("--host", default=MQTT_HOST)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--file-dir", help="Also append readings and Pi classification events to daily JSONL files here")
+    parser.add_argument("--mirror-host", help="Also republish readings to this MQTT broker")
+    parser.add_argument("--mirror-port", type=int, default=MQTT_PORT)
+    parser.add_argument("--mirror-devices", help="Comma-separated device ids to mirror (default: all)")
+    parser.add_argument("--report-every", type=float, default=60.0, help="Seconds between per-sink stats")
+    parser.add_argument("--quiet", action="store_true", help="Don't print every message")
+    parser.add_argument("--no-downlink", action="store_true", help="Don't forward dashboard commands to the bins")
+    parser.add_argument("--device-rate", type=float, default=ratelimit.DEVICE_RATE, help="Readings/s allowed per bin")
+    parser.add_argument("--device-burst", type=float, default=ratelimit.DEVICE_BURST)
+    parser.add_argument("--global-rate", type=float, default=ratelimit.GLOBAL_RATE, help="Readings/s allowed in total")
+    parser.add_argument("--global-burst", type=float, default=ratelimit.GLOBAL_BURST)
+    parser.add_argument("--overflow", choices=ratelimit.POLICIES, default="drop",
+                        help="What to do with readings over the limit")
+    parser.add_argument("--no-rate-limit", action="store_true")
+    args = parser.parse_args()
+
+    publisher, topic_path = make_publisher()
+    devices = args.mirror_devices.split(",") if args.mirror_devices else None
+    downlink = ack_db = None
+    if not args.no_downlink:
+        import queries
+        downlink = commands.Downlink()
+        ack_db = queries.script_client()
+    limiter = None
+    if not args.no_rate_limit:
+        limiter = ratelimit.RateLimiter(args.device_rate, args.device_burst, args.global_rate, args.global_burst,
+                                        args.overflow)
+    fanout = make_sinks(publisher, topic_path, args.file_dir, args.mirror_host, args.mirror_port, devices, ack_db,
+                        ordered=True)
+    run(host=args.host, port=args.port, verbose=not args.quiet, fanout=fanout,
+        report_every=args.report_every, downlink=downlink, limiter=limiter)
 
-def on_message(client, userdata, msg):
-    payload = msg.payload.decode("utf-8")
-    print(f"Received: {payload}")
-    publisher.publish(topic_path, payload.encode("utf-8"))
-    print("Forwarded to Pub/Sub")
 
-client = mqtt.Client()
-client.on_connect = lambda c,u,f,rc: c.subscribe("smartbin/+/data")
-client.on_message = on_message
-client.connect("localhost", 1883, 60)
-client.loop_forever()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Downlink commands: dashboard -> Pub/Sub -> bridge -> MQTT -> bins, with acks.
+
+    dashboard / CLI ── smartbin-commands (Pub/Sub) ──> bridge.py
+    bridge.py ── smartbin/<id>/cmd or smartbin/all/cmd (MQTT, QoS 1) ──> ESP32
+    ESP32 ── smartbin/<id>/ack ──> bridge.py ── commands/<id> (Firestore) ──> dashboard
+
+Every command carries a correlation id (`id`) that the bin echoes in its ack.
+The bridge times each ack against when the command was issued (end-to-end
+round trip) and when it forwarded it (bridge <-> bin round trip), and writes both
+into the command's Firestore document in batches. A command for the whole fleet
+is a single publish on the broadcast topic; one for a list of bins is a single
+Pub/Sub message that the bridge fans out to each bin's topic.
+
+    python commands.py setup                        # create topic + bridge subscription
+    python commands.py send bin01 ping --wait 10    # send and print acks/RTT
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+
+import sinks
+
+
+# --- CONFIG ---
+TOPIC_ID = "smartbin-commands"
+SUBSCRIPTION_ID = "smartbin-commands-bridge"
+COLLECTION = "commands"
+
+CMD_TOPIC = "smartbin/{device_id}/cmd"
+BROADCAST_TOPIC = "smartbin/all/cmd"
+ACK_TOPIC = "smartbin/+/ack"
+BROADCAST = "all"
+QOS = 1
+
+COMMAND_TTL = 300.0        # Commands older than this are dropped, not delivered late
+PUBLISH_TIMEOUT = 10.0     # Also how long the bridge waits for the broker's PUBACKs
+RTT_WINDOW = 1000
+
+# Command -> required args (validated before anything is published)
+COMMANDS = {
+    "ping": (),
+    "send_telemetry": (),
+    "open_lid": ("bin",),                 # paper / glass / aluminium, even when full
+    "set_threshold": ("distance_cm",),    # DISTANCE_THRESHOLD_CM on the bin
+}
+LIDS = ("paper", "glass", "aluminium")
+
+
+# --- PROTOCOL ---
+def make_command(devices, cmd, args=None, issued_at=None):
+    """Validated command message; `devices` is a list of device ids or BROADCAST."""
+    args = dict(args or {})
+    if cmd not in COMMANDS:
+        raise ValueError(f"unknown command {cmd!r}; expected one of {', '.join(COMMANDS)}")
+    missing = [a for a in COMMANDS[cmd] if a not in args]
+    if missing:
+        raise ValueError(f"{cmd} needs {', '.join(missing)}")
+    if cmd == "open_lid" and args["bin"] not in LIDS:
+        raise ValueError(f"bin must be one of {', '.join(LIDS)}")
+    if cmd == "set_threshold":
+        args["distance_cm"] = int(args["distance_cm"])
+        if not 2 <= args["distance_cm"] <= 100:
+            raise ValueError("distance_cm must be between 2 and 100")
+    if devices != BROADCAST:
+        devices = sorted({str(d) for d in devices})
+        if not devices:
+            raise ValueError("no devices given")
+    return {
+        "id": uuid.uuid4().hex[:16],
+        "cmd": cmd,
+        "args": args,
+        "devices": devices,
+        "issued_at": time.time() if issued_at is None else issued_at,
+    }
+
+
+def device_payload(command):
+    """What a bin receives: just enough to act and to correlate its ack."""
+    return json.dumps({"id": command["id"], "cmd": command["cmd"], "args": command["args"]}, separators=(",", ":"))
+
+
+def device_topics(command):
+    if command["devices"] == BROADCAST:
+        return [BROADCAST_TOPIC]
+    return [CMD_TOPIC.format(device_id=d) for d in command["devices"]]
+
+
+# --- BRIDGE SIDE ---
+class ForwardError(Exception):
+    """The broker did not confirm a command on some of its topics."""
+
+    def __init__(self, failed):
+        super().__init__(f"not published to {', '.join(failed)}")
+        self.failed = failed
+
+
+class Downlink:
+    """Forwards commands from Pub/Sub to the bridge's MQTT connection and times the acks."""
+
+    def __init__(self, client=None, qos=QOS):
+        self.client = client
+        self.qos = qos
+        self._lock = threading.Lock()
+        self._pending = {}   # command id -> (issued_at, forwarded_at)
+        self.forwarded = 0
+        self.expired = 0
+        self.failed = 0
+        self.acks = 0
+        self.unmatched = 0
+        self.rtts = deque(maxlen=RTT_WINDOW)
+        self.device_rtts = deque(maxlen=RTT_WINDOW)
+
+    def on_pubsub_message(self, message):
+        """Streaming-pull callback for the `smartbin-commands` subscription."""
+        try:
+            command = json.loads(message.data.decode("utf-8"))
+            self.forward(command)
+        except (ValueError, KeyError, UnicodeDecodeError) as e:
+            print(f"Dropping malformed command {message.message_id}: {e}")
+        except ForwardError as e:
+            # Redelivered by Pub/Sub; bins that already got it ack the same id twice
+            print(f"Command {message.message_id} {e}; will retry")
+            message.nack()
+            return
+        message.ack()
+
+    def forward(self, command):
+        now = time.time()
+        if now - command["issued_at"] > COMMAND_TTL:
+            with self._lock:
+                self.expired += 1
+            return 0
+        payload = device_payload(command)
+        with self._lock:
+            self._pending[command["id"]] = (command["issued_at"], now)
+            self._expire(now)
+        # One publish for a broadcast, else one per bin in a single pass over the list
+        topics = device_topics(command)
+        infos = [(topic, self.client.publish(topic, payload, qos=self.qos)) for topic in topics]
+        # Then wait for the broker to take them all, within one shared deadline
+        deadline = time.monotonic() + PUBLISH_TIMEOUT
+        failed = []
+        for topic, info in infos:
+            try:
+                info.wait_for_publish(max(deadline - time.monotonic(), 0))
+            except (ValueError, RuntimeError):
+                pass   # Not queued, or no connection; is_published() is False
+            if not info.is_published():
+                failed.append(topic)
+        with self._lock:
+            self.forwarded += len(topics) - len(failed)
+            self.failed += len(failed)
+        if failed:
+            raise ForwardError(failed)
+        return len(topics)
+
+    def _expire(self, now):
+        stale = [cid for cid, (issued, _) in self._pending.items() if now - issued > 2 * COMMAND_TTL]
+        for cid in stale:
+            del self._pending[cid]
+
+    def on_ack(self, topic, payload):
+        """Adds the bridge's timings to an ack; returns the JSON the ack sinks receive."""
+        now = time.time()
+        ack = json.loads(payload)
+        ack.setdefault("device_id", sinks.device_from_topic(topic))
+        ack["acked_at"] = now
+        with self._lock:
+            self.acks += 1
+            timing = self._pending.get(ack.get("id"))
+            if timing is None:
+                self.unmatched += 1
+            else:
+                issued_at, forwarded_at = timing
+                ack["rtt_ms"] = round((now - issued_at) * 1000, 1)
+                ack["device_rtt_ms"] = round((now - forwarded_at) * 1000, 1)
+                self.rtts.append(ack["rtt_ms"])
+                self.device_rtts.append(ack["device_rtt_ms"])
+        return json.dumps(ack)
+
+    def stats(self):
+        with self._lock:
+            rtts = np.array(self.rtts) if self.rtts else np.zeros(1)
+            device_rtts = np.array(self.device_rtts) if self.device_rtts else np.zeros(1)
+            return {
+                "forwarded": self.forwarded,
+                "expired": self.expired,
+                "failed": self.failed,
+                "acks": self.acks,
+                "unmatched": self.unmatched,
+                "rtt_p50_ms": float(np.percentile(rtts, 50)),
+                "rtt_p99_ms": float(np.percentile(rtts, 99)),
+                "device_rtt_p50_ms": float(np.percentile(device_rtts, 50)),
+            }
+
+
+def format_stats(stats):
+    return (f"commands: {stats['forwarded']} forwarded, {stats['failed']} failed, {stats['expired']} expired, "
+            f"{stats['acks']} acks ({stats['unmatched']} unmatched), "
+            f"RTT p50 {stats['rtt_p50_ms']:.0f} ms / p99 {stats['rtt_p99_ms']:.0f} ms, "
+            f"bridge<->bin p50 {stats['device_rtt_p50_ms']:.0f} ms")
+
+
+class AckSink(sinks.Sink):
+    """Merges acks into their `commands/<id>` documents, one write per command per batch."""
+
+    name = "acks"
+
+    def __init__(self, db):
+        self.db = db
+
+    def write(self, readings):
+        by_command = {}
+        for r in readings:
+            try:
+                ack = json.loads(r.payload)
+                command_id = ack.pop("id")
+            except (ValueError, KeyError):
+                continue
+            device_id = ack.pop("device_id", None) or r.device_id
+            by_command.setdefault(command_id, {})[device_id] = ack
+        if not by_command:
+            return
+        batch = self.db.batch()
+        for command_id, acks in by_command.items():
+            ref = self.db.collection(COLLECTION).document(command_id)
+            batch.set(ref, {"acks": acks}, merge=True)
+        batch.commit()
+
+
+# --- DASHBOARD SIDE ---
+class CommandSender:
+    """Records a command in Firestore, then publishes it for the bridge."""
+
+    def __init__(self, db, publisher, topic_path):
+        self.db = db
+        self.publisher = publisher
+        self.topic_path = topic_path
+
+    def send(self, devices, cmd, args=None):
+        command = make_command(devices, cmd, args)
+        self.db.collection(COLLECTION).document(command["id"]).set({
+            **command,
+            "expected": None if command["devices"] == BROADCAST else len(command["devices"]),
+        })
+        self.publisher.publish(self.topic_path, json.dumps(command).encode("utf-8")).result(timeout=PUBLISH_TIMEOUT)
+        return command["id"]
+
+
+def make_publisher(project_id, key_path=None):
+    """Pub/Sub publisher and command topic path; uses PUBSUB_EMULATOR_HOST when set."""
+    from google.cloud import pubsub_v1
+    if key_path and not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        publisher = pubsub_v1.PublisherClient.from_service_account_file(key_path)
+    else:
+        publisher = pubsub_v1.PublisherClient()
+    return publisher, publisher.topic_path(project_id, TOPIC_ID)
+
+
+def command_summary(doc):
+    """Status line fields for one `commands` document."""
+    acks = doc.get("acks") or {}
+    rtts = [a["rtt_ms"] for a in acks.values() if "rtt_ms" in a]
+    failed = sum(1 for a in acks.values() if not a.get("ok", True))
+    return {
+        "id": doc.get("id"),
+        "issued_at": doc.get("issued_at"),
+        "cmd": doc.get("cmd"),
+        "devices": "all bins" if doc.get("devices") == BROADCAST else ", ".join(doc.get("devices") or []),
+        "acked": len(acks),
+        "expected": doc.get("expected"),
+        "failed": failed,
+        "rtt_p50_ms": float(np.median(rtts)) if rtts else None,
+        "rtt_max_ms": max(rtts) if rtts else None,
+    }
+
+
+# --- COMMANDS ---
+def setup(args):
+    import ingest
+    _, _, topic_path, subscription_path = ingest.ensure_subscription(args.project, TOPIC_ID, SUBSCRIPTION_ID)
+    print(f"Topic {topic_path}\nSubscription {subscription_path}")
+
+
+def send(args):
+    import queries
+    db = queries.script_client()
+    publisher, topic_path = make_publisher(args.project, queries.FIREBASE_KEY_PATH)
+    command_args = dict(kv.split("=", 1) for kv in args.args)
+    devices = BROADCAST if args.devices == BROADCAST else args.devices.split(",")
+    command_id = CommandSender(db, publisher, topic_path).send(devices, args.cmd, command_args)
+    print(f"Sent {args.cmd} as {command_id}")
+
+    deadline = time.time() + args.wait
+    summary = None
+    while time.time() < deadline:
+        time.sleep(0.5)
+        summary = command_summary(db.collection(COLLECTION).document(command_id).get().to_dict() or {})
+        if summary["expected"] and summary["acked"] >= summary["expected"]:
+            break
+    if summary is not None:
+        print(f"Acked {summary['acked']}/{summary['expected'] or '?'} ({summary['failed']} failed), "
+              f"RTT p50 {summary['rtt_p50_ms']} ms, max {summary['rtt_max_ms']} ms")
+
+
+def main():
+    import queries
+    parser = argparse.ArgumentParser(description="Send downlink commands to smart bins.")
+    parser.add_argument("--project", default=queries.PROJECT_ID)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("setup", help="Create the command topic and the bridge's subscription")
+    send_cmd = sub.add_parser("send", help="Send a command and wait for acks")
+    send_cmd.add_argument("devices", help=f"Comma-separated device ids, or '{BROADCAST}'")
+    send_cmd.add_argument("cmd", choices=list(COMMANDS))
+    send_cmd.add_argument("args", nargs="*", help="key=value command arguments, e.g. distance_cm=8")
+    send_cmd.add_argument("--wait", type=float, default=10.0, help="Seconds to wait for acks")
+    args = parser.parse_args()
+    if args.command == "setup":
+        setup(args)
+    else:
+        send(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Process-wide data access layer for the dashboard.
+
+Every Streamlit session reads through one shared `DataCache`, so a page full of
+viewers costs the same Firestore reads as a single viewer:
+
+- window queries are keyed on `start_ts` rounded down to a time bucket, so
+  sessions opened a few seconds apart share the same entry;
+- entries expire on a fixed per-dataset TTL rather than each viewer's refresh
+  slider, and are evicted least-recently-used once the cache exceeds its
+  memory budget;
+- concurrent misses for the same key are coalesced into a single load;
+- "Refresh Now" invalidates only the entries the requesting view uses.
+
+Cached values are shared between sessions and must be treated as read-only.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import fleet_map
+import queries
+
+
+# --- CACHE CONFIG ---
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+BUCKET_SECONDS = 60      # start_ts values within the same minute share an entry
+LATEST_TTL = 5           # Latest status / GPS fix
+WINDOW_TTL = 30          # Aggregations and history over a time window
+RECENT_COMMANDS = 20
+
+
+def bucket(start_ts, seconds=BUCKET_SECONDS):
+    return float(int(start_ts // seconds) * seconds)
+
+
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (np.ndarray, fleet_map.FleetIndex)):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires")
+
+    def __init__(self, value, size, expires):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class DataCache:
+    """Thread-safe TTL + size-bounded LRU cache with single-flight loading."""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader, ttl):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            self._store(key, value, ttl)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _store(self, key, value, ttl):
+        size = estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            if size > self.max_bytes:
+                return
+            self._entries[key] = _Entry(value, size, time.monotonic() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+            return entry is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+_cache = DataCache()
+
+
+def cache():
+    return _cache
+
+
+# --- DATASETS ---
+def latest_bin_status(db):
+    return _cache.get_or_load(('bin_status', 'latest'),
+                              lambda: queries.fetch_latest(db, 'bin_status'), LATEST_TTL)
+
+
+def latest_gps(db):
+    return _cache.get_or_load(('gps', 'latest'),
+                              lambda: queries.fetch_latest(db, 'gps'), LATEST_TTL)
+
+
+def fleet(db):
+    """(loaded_at, DataFrame) of the latest `fleet` documents."""
+    return _cache.get_or_load(('fleet', 'latest'),
+                              lambda: (time.time(), queries.fetch_fleet(db)), WINDOW_TTL)
+
+
+def fleet_index(db, full_thresh, warn_thresh, bin_height):
+    """Grid index over the current fleet snapshot, shared until the snapshot is reloaded."""
+    loaded_at, df = fleet(db)
+    return _cache.get_or_load(
+        ('fleet_index', loaded_at, full_thresh, warn_thresh, bin_height),
+        lambda: fleet_map.FleetIndex(fleet_map.fleet_frame(df, full_thresh, warn_thresh, bin_height)),
+        WINDOW_TTL)
+
+
+def recent_commands(db):
+    return _cache.get_or_load(('commands', 'recent'),
+                              lambda: queries.fetch_recent_commands(db, RECENT_COMMANDS), LATEST_TTL)
+
+
+def active_alerts(db):
+    return _cache.get_or_load(('alerts', 'active'),
+                              lambda: queries.fetch_active_alerts(db), LATEST_TTL)
+
+
+def bin_history(db, start_ts):
+    start = bucket(start_ts)
+    return _cache.get_or_load(('bin_history', start),
+                              lambda: queries.fetch_bin_history(db, start), WINDOW_TTL)
+
+
+def servo_kpis(db, start_ts):
+    start = bucket(start_ts)
+    return _cache.get_or_load(('servo_kpis', start),
+                              lambda: queries.fetch_servo_kpis(db, start), WINDOW_TTL)
+
+
+def servo_timestamps(db, start_ts):
+    start = bucket(start_ts)
+    return _cache.get_or_load(('servo_timestamps', start),
+                              lambda: queries.fetch_servo_timestamps(db, start), WINDOW_TTL)
+
+
+def servo_log_page(db, start_ts, page_size=15, bin_type=None, opened=None, cursor=None):
+    """Activity log page; only the first (newest) page of each filter combination is cached."""
+    start = bucket(start_ts)
+    if cursor is not None:
+        return queries.fetch_servo_log_page(db, start, page_size, bin_type, opened, cursor)
+    return _cache.get_or_load(('servo_log', start, page_size, bin_type, opened),
+                              lambda: queries.fetch_servo_log_page(db, start, page_size, bin_type, opened),
+                              LATEST_TTL)
+
+
+def view_keys(start_ts, page_size=15, bin_type=None, opened=None):
+    """Cache keys read by one dashboard view over the window starting at `start_ts`."""
+    start = bucket(start_ts)
+    return [
+        ('bin_status', 'latest'),
+        ('gps', 'latest'),
+        ('fleet', 'latest'),
+        ('commands', 'recent'),
+        ('alerts', 'active'),
+        ('bin_history', start),
+        ('servo_kpis', start),
+        ('servo_timestamps', start),
+        ('servo_log', start, page_size, bin_type, opened),
+    ]
+
+
+def invalidate_view(start_ts, page_size=15, bin_type=None, opened=None):
+    return sum(_cache.invalidate(key) for key in view_keys(start_ts, page_size, bin_type, opened))
@@ -0,0 +1,228 @@
+"""Grid index, per-zoom clustering and viewport queries for the fleet map.
+
+Bins are keyed by a Morton (Z-order) code of their position on a 2^26 x 2^26
+lat/lon grid, the integer form of a geohash: dropping the last 2k bits of a key
+gives the key of the enclosing cell k levels up, and the bins of any cell are a
+contiguous run of the sorted keys. So
+
+- clustering at a zoom level is a `reduceat` over runs of truncated keys, done
+  once per level and reused by every redraw at that zoom;
+- a viewport query covers the bounding box with a few cells and binary-searches
+  each cell's key range instead of scanning the fleet.
+
+Only the clusters inside the (padded) viewport are handed to pydeck.
+"""
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+import analytics
+
+
+# --- GRID CONFIG ---
+MAX_LEVEL = 26              # Finest grid: 2^26 cells per axis (~0.3 m of latitude)
+TILE_PX = 256               # Web Mercator tile size
+CLUSTER_PX = 48             # Bins closer than roughly this on screen share a marker
+MAX_QUERY_CELLS = 64        # Cells used to cover a viewport
+VIEWPORT_PADDING = 0.5      # Extra fraction of the view loaded on each side, for panning
+MAX_ZOOM = 20
+
+STATUS_COLORS = {"ok": [76, 175, 80], "warning": [255, 152, 0], "full": [244, 67, 54]}
+FLEET_COLUMNS = ['device_id', 'latitude', 'longitude', 'status', 'fill_pct']
+
+
+# --- KEYS ---
+def _spread_bits(v):
+    """Insert a zero bit after each of the low 32 bits of `v` (uint64)."""
+    v = v & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def cell_xy(lat, lon, level=MAX_LEVEL):
+    """Column (lon) and row (lat) of the grid cell holding each point at `level`."""
+    cells = 1 << level
+    x = np.floor((np.asarray(lon, dtype=float) + 180.0) / 360.0 * cells)
+    y = np.floor((np.asarray(lat, dtype=float) + 90.0) / 180.0 * cells)
+    return (np.clip(x, 0, cells - 1).astype(np.uint64),
+            np.clip(y, 0, cells - 1).astype(np.uint64))
+
+
+def interleave(x, y):
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+
+def geokey(lat, lon):
+    """Morton key of each point on the finest grid."""
+    return interleave(*cell_xy(lat, lon))
+
+
+def truncate(keys, level):
+    """Keys of the enclosing cells at `level`."""
+    return keys >> np.uint64(2 * (MAX_LEVEL - level))
+
+
+def zoom_level(zoom):
+    """Grid level whose cells are about CLUSTER_PX wide at map zoom `zoom`."""
+    return int(np.clip(round(zoom + math.log2(TILE_PX / CLUSTER_PX)), 0, MAX_LEVEL))
+
+
+# --- VIEWPORT ---
+def viewport(lat, lon, zoom, width_px, height_px, padding=VIEWPORT_PADDING):
+    """(south, west, north, east) seen by a `width_px` x `height_px` map centred on lat/lon."""
+    deg_per_px = 360.0 / (TILE_PX * 2 ** zoom)
+    half_w = width_px / 2 * deg_per_px * (1 + 2 * padding)
+    half_h = height_px / 2 * deg_per_px * math.cos(math.radians(lat)) * (1 + 2 * padding)
+    return (max(lat - half_h, -90.0), max(lon - half_w, -180.0),
+            min(lat + half_h, 90.0), min(lon + half_w, 180.0))
+
+
+def fit_view(lat, lon, width_px, height_px, max_zoom=16):
+    """Centre and zoom that show every given point."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if lat.size == 0:
+        return None
+    south, north, west, east = lat.min(), lat.max(), lon.min(), lon.max()
+    center_lat, center_lon = (south + north) / 2, (west + east) / 2
+    lon_span = max(east - west, 1e-6) * 1.2
+    lat_span = max(north - south, 1e-6) * 1.2 / math.cos(math.radians(center_lat))
+    zoom = min(math.log2(360.0 * width_px / (TILE_PX * lon_span)),
+               math.log2(360.0 * height_px / (TILE_PX * lat_span)), max_zoom)
+    return float(center_lat), float(center_lon), max(float(zoom), 1.0)
+
+
+def _covering_ranges(bbox, level):
+    """[lo, hi) key ranges, at `level`, of at most MAX_QUERY_CELLS cells covering `bbox`."""
+    south, west, north, east = bbox
+    coarse = level
+    while True:
+        x0, y0 = cell_xy(south, west, coarse)
+        x1, y1 = cell_xy(north, east, coarse)
+        if coarse == 0 or (int(x1) - int(x0) + 1) * (int(y1) - int(y0) + 1) <= MAX_QUERY_CELLS:
+            break
+        coarse -= 1
+    xs, ys = np.meshgrid(np.arange(int(x0), int(x1) + 1, dtype=np.uint64),
+                         np.arange(int(y0), int(y1) + 1, dtype=np.uint64))
+    cells = np.sort(interleave(xs.ravel(), ys.ravel()))
+    shift = np.uint64(2 * (level - coarse))
+    return cells << shift, (cells + np.uint64(1)) << shift
+
+
+# --- INDEX ---
+def fleet_frame(fleet, full_thresh, warn_thresh, bin_height):
+    """Latest `fleet` documents -> one row per located bin with its status and fill."""
+    if fleet.empty:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in FLEET_COLUMNS})
+    lat = pd.to_numeric(fleet['latitude'], errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(fleet['longitude'], errors='coerce').to_numpy(dtype=float)
+    distance = pd.to_numeric(fleet['distance_cm'], errors='coerce').fillna(bin_height).to_numpy(dtype=float)
+    # (0, 0) is what the firmware reports before the first GPS fix
+    located = np.isfinite(lat) & np.isfinite(lon) & ~((lat == 0) & (lon == 0))
+    return pd.DataFrame({
+        'device_id': fleet['device_id'].astype(str).to_numpy()[located],
+        'latitude': lat[located],
+        'longitude': lon[located],
+        'status': analytics.status(distance[located], full_thresh, warn_thresh),
+        'fill_pct': analytics.fill_pct(distance[located], bin_height),
+    })
+
+
+class FleetIndex:
+    """Immutable, grid-indexed snapshot of the fleet; clusters are built lazily per level."""
+
+    def __init__(self, fleet):
+        keys = geokey(fleet['latitude'], fleet['longitude'])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.device_id = fleet['device_id'].to_numpy(dtype=object)[order]
+        self.lat = fleet['latitude'].to_numpy(dtype=float)[order]
+        self.lon = fleet['longitude'].to_numpy(dtype=float)[order]
+        self.status = np.asarray(pd.Categorical(fleet['status'], dtype=analytics.STATUS).codes)[order]
+        self.fill_pct = fleet['fill_pct'].to_numpy(dtype=float)[order]
+        self._positions = None
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        arrays = (self.keys, self.lat, self.lon, self.status, self.fill_pct)
+        return sum(a.nbytes for a in arrays) + 64 * len(self.device_id)
+
+    def fit(self, width_px, height_px):
+        return fit_view(self.lat, self.lon, width_px, height_px)
+
+    def position(self, device_id):
+        if self._positions is None:
+            self._positions = {d: i for i, d in enumerate(self.device_id)}
+        i = self._positions.get(device_id)
+        return None if i is None else (float(self.lat[i]), float(self.lon[i]))
+
+    def clusters(self, level):
+        """One row per non-empty cell at `level`, sorted by cell key."""
+        with self._lock:
+            if level not in self._levels:
+                self._levels[level] = self._cluster(level)
+            return self._levels[level]
+
+    def _cluster(self, level):
+        cell = truncate(self.keys, level)
+        if not len(cell):
+            return pd.DataFrame({'key': cell, 'latitude': [], 'longitude': [], 'count': [], 'full': [],
+                                 'status': pd.Categorical([], dtype=analytics.STATUS),
+                                 'fill_pct': [], 'device_id': []})
+        starts = np.concatenate([[0], np.flatnonzero(cell[1:] != cell[:-1]) + 1])
+        count = np.diff(np.append(starts, len(cell)))
+        return pd.DataFrame({
+            'key': cell[starts],
+            'latitude': np.add.reduceat(self.lat, starts) / count,
+            'longitude': np.add.reduceat(self.lon, starts) / count,
+            'count': count,
+            'full': np.add.reduceat((self.status == 2).astype(np.int64), starts),
+            # A cluster shows the worst status among its bins
+            'status': pd.Categorical.from_codes(np.maximum.reduceat(self.status, starts), dtype=analytics.STATUS),
+            'fill_pct': np.add.reduceat(self.fill_pct, starts) / count,
+            'device_id': np.where(count == 1, self.device_id[starts], None),
+        })
+
+    def query(self, bbox, zoom):
+        """Clusters for map zoom `zoom` whose centre lies inside `bbox` (south, west, north, east)."""
+        level = zoom_level(zoom)
+        clusters = self.clusters(level)
+        keys = clusters['key'].to_numpy()
+        lo, hi = _covering_ranges(bbox, level)
+        starts = np.searchsorted(keys, lo, side='left')
+        ends = np.searchsorted(keys, hi, side='left')
+        hits = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s] or [np.zeros(0, dtype=np.int64)])
+        found = clusters.iloc[hits]
+        south, west, north, east = bbox
+        inside = (found['latitude'].between(south, north) & found['longitude'].between(west, east)).to_numpy()
+        return found[inside].reset_index(drop=True)
+
+
+def layer_data(clusters):
+    """Cluster rows with the colour, radius and labels the pydeck layers read."""
+    out = clusters.drop(columns=['key', 'status']).copy()
+    codes = clusters['status'].cat.codes.to_numpy()
+    palette = np.array([STATUS_COLORS[s] for s in analytics.STATUS.categories])
+    out['color'] = palette[codes].tolist()
+    out['radius'] = 6 + 4 * np.sqrt(out['count'].to_numpy(dtype=float))
+    out['label'] = np.where(out['count'] > 1, out['count'].astype(str), "")
+    single = out['count'].to_numpy() == 1
+    names = np.asarray(clusters['status'].astype(str).map(analytics.STATUS_LABELS))
+    out['title'] = np.where(single, out['device_id'].astype(str), out['count'].astype(str) + " bins")
+    out['detail'] = np.where(
+        single,
+        names + " · " + out['fill_pct'].round().astype(int).astype(str) + "% full",
+        out['full'].astype(str) + " full · avg " + out['fill_pct'].round().astype(int).astype(str) + "% full",
+    )
+    return out
@@ -0,0 +1,278 @@
+"""Fill-rate forecasting for the smart bin fleet.
+
+Fits a robust, exponentially-windowed linear trend of fill level per bin plus an
+hour-of-day seasonal profile, and projects each bin forward to estimate when it
+will cross the "full" distance. All bins are handled together with numpy, and the
+fitted state is kept between calls so only rows newer than the last seen reading
+of each bin are processed.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# --- MODEL CONFIG ---
+HALF_LIFE_HOURS = 24.0        # Readings older than this count half as much in the fit
+HUBER_K = 1.345               # Residuals beyond K robust sigmas get down-weighted
+EMPTY_DROP_CM = 3.0           # A fill drop larger than this means the bin was emptied
+MIN_PROFILE_WEIGHT = 2.0      # Hour slots with less evidence than this stay neutral
+MAX_HORIZON_HOURS = 24 * 14   # Bins not full within two weeks report "inf"
+DEFAULT_DEVICE_ID = "bin01"
+
+HOURS_PER_DAY = 24
+_N_STATS = 5  # sum(w), sum(w*t), sum(w*y), sum(w*t*t), sum(w*t*y)
+
+
+class FillForecaster:
+    """Incrementally fitted fill-rate model for many bins at once.
+
+    `update()` consumes rows shaped like the `bin_status` collection
+    (`timestamp`, `distance_cm` and optionally `device_id`); `predict()` returns
+    one row per bin with its current fill, fill rate and hours until full.
+    """
+
+    def __init__(self, bin_height, bin_heights=None, half_life_hours=HALF_LIFE_HOURS):
+        self.bin_height = float(bin_height)
+        self.bin_heights = dict(bin_heights or {})
+        self.decay = np.log(2) / half_life_hours
+
+        self._lock = threading.Lock()
+        self._index = {}
+        self._devices = []
+        self._t0 = None      # Epoch hours used as the time origin of the fit
+        self._t_ref = None   # Time (relative hours) all decayed sums are expressed at
+
+        self._heights = np.zeros(0)
+        self._stats = np.zeros((0, _N_STATS))
+        self._abs_sum = np.zeros(0)
+        self._abs_w = np.zeros(0)
+        self._hour_sum = np.zeros((0, HOURS_PER_DAY))
+        self._hour_w = np.zeros((0, HOURS_PER_DAY))
+        self._last_t = np.zeros(0)
+        self._last_fill = np.zeros(0)
+
+    @property
+    def devices(self):
+        return list(self._devices)
+
+    def newest(self):
+        """Epoch seconds of the newest reading folded in so far, or None before the first."""
+        with self._lock:
+            if self._t0 is None or not np.isfinite(self._last_t).any():
+                return None
+            return float((self._last_t[np.isfinite(self._last_t)].max() + self._t0) * 3600.0)
+
+    # --- STATE MANAGEMENT ---
+    def _slots_for(self, device_ids):
+        new = [d for d in device_ids if d not in self._index]
+        if new:
+            for d in new:
+                self._index[d] = len(self._devices)
+                self._devices.append(d)
+            k = len(new)
+            heights = [float(self.bin_heights.get(d, self.bin_height)) for d in new]
+            self._heights = np.concatenate([self._heights, heights])
+            self._stats = np.vstack([self._stats, np.zeros((k, _N_STATS))])
+            self._abs_sum = np.concatenate([self._abs_sum, np.zeros(k)])
+            self._abs_w = np.concatenate([self._abs_w, np.zeros(k)])
+            self._hour_sum = np.vstack([self._hour_sum, np.zeros((k, HOURS_PER_DAY))])
+            self._hour_w = np.vstack([self._hour_w, np.zeros((k, HOURS_PER_DAY))])
+            self._last_t = np.concatenate([self._last_t, np.full(k, -np.inf)])
+            self._last_fill = np.concatenate([self._last_fill, np.full(k, np.nan)])
+        return np.array([self._index[d] for d in device_ids], dtype=np.int64)
+
+    def _params(self):
+        sw, st, sy, stt, sty = self._stats.T
+        denom = sw * stt - st * st
+        ok = denom > 1e-9 * np.maximum(sw * sw, 1.0)
+        slope = np.divide(sw * sty - st * sy, denom, out=np.zeros_like(sw), where=ok)
+        intercept = np.divide(sy - slope * st, sw, out=np.full_like(sw, np.nan), where=sw > 0)
+        return intercept, slope
+
+    def _profile(self):
+        hourly = np.divide(self._hour_sum, self._hour_w,
+                           out=np.full_like(self._hour_sum, np.nan),
+                           where=self._hour_w >= MIN_PROFILE_WEIGHT)
+        counted = np.isfinite(hourly)
+        total = np.where(counted, hourly, 0.0).sum(axis=1)
+        mean = np.divide(total, counted.sum(axis=1), out=np.zeros(len(total)),
+                         where=counted.any(axis=1))
+        mean = np.where(mean > 0, mean, np.nan)
+        profile = hourly / mean[:, None]
+        profile = np.where(np.isfinite(profile), profile, 1.0)
+        return profile / profile.mean(axis=1, keepdims=True)
+
+    # --- FITTING ---
+    def update(self, df):
+        """Fold rows newer than each bin's last seen reading into the fit.
+
+        Returns the number of rows that were used.
+        """
+        if df is None or df.empty or 'timestamp' not in df or 'distance_cm' not in df:
+            return 0
+
+        ts = pd.to_numeric(df['timestamp'], errors='coerce').to_numpy(dtype=float)
+        dist = pd.to_numeric(df['distance_cm'], errors='coerce').to_numpy(dtype=float)
+        if 'device_id' in df:
+            devices = df['device_id'].fillna(DEFAULT_DEVICE_ID).astype(str).to_numpy()
+        else:
+            devices = np.full(len(df), DEFAULT_DEVICE_ID, dtype=object)
+
+        valid = np.isfinite(ts) & np.isfinite(dist) & (dist >= 0)
+        if not valid.any():
+            return 0
+        ts, dist, devices = ts[valid], dist[valid], devices[valid]
+
+        with self._lock:
+            if self._t0 is None:
+                self._t0 = np.floor(ts.min() / 3600.0)
+                self._t_ref = 0.0
+
+            codes, uniques = pd.factorize(devices)
+            slot = self._slots_for(list(uniques))[codes]
+            t = ts / 3600.0 - self._t0
+
+            fresh = t > self._last_t[slot]
+            if not fresh.any():
+                return 0
+            slot, t, dist = slot[fresh], t[fresh], dist[fresh]
+
+            order = np.lexsort((t, slot))
+            slot, t, dist = slot[order], t[order], dist[order]
+            fill = np.clip(self._heights[slot] - dist, 0.0, None)
+            n = len(self._devices)
+            pos = np.arange(len(slot))
+
+            # Previous reading of the same bin (from this batch or the stored state)
+            first = np.r_[True, slot[1:] != slot[:-1]]
+            prev_fill = np.where(first, self._last_fill[slot], np.r_[np.nan, fill[:-1]])
+            prev_t = np.where(first, self._last_t[slot], np.r_[-np.inf, t[:-1]])
+            delta = fill - prev_fill
+            emptied = delta < -EMPTY_DROP_CM
+
+            # A collection starts a new fill cycle: forget everything before it
+            last_reset = np.full(n, -1)
+            np.maximum.at(last_reset, slot, np.where(emptied, pos, -1))
+            reset_slots = np.flatnonzero(last_reset >= 0)
+            if reset_slots.size:
+                self._stats[reset_slots] = 0.0
+                self._abs_sum[reset_slots] = 0.0
+                self._abs_w[reset_slots] = 0.0
+            keep = pos >= last_reset[slot]
+
+            # Bring the decayed sums forward to the newest reading
+            t_new = max(self._t_ref, float(t.max()))
+            shrink = np.exp(-self.decay * (t_new - self._t_ref))
+            self._stats *= shrink
+            self._abs_sum *= shrink
+            self._abs_w *= shrink
+            self._hour_sum *= shrink
+            self._hour_w *= shrink
+            self._t_ref = t_new
+            w_time = np.exp(-self.decay * (t_new - t))
+
+            # Huber weights against the fit as it stood before this batch
+            intercept, slope = self._params()
+            resid = fill - (intercept[slot] + slope[slot] * t)
+            scale = 1.2533 * np.divide(self._abs_sum, self._abs_w,
+                                       out=np.zeros(n), where=self._abs_w > 0)
+            has_fit = np.isfinite(resid) & (scale[slot] > 0) & ~np.isin(slot, reset_slots)
+            u = np.divide(np.abs(resid), HUBER_K * scale[slot],
+                          out=np.zeros_like(resid), where=has_fit)
+            w = np.where(keep, w_time * np.where(u > 1.0, 1.0 / np.maximum(u, 1.0), 1.0), 0.0)
+
+            self._stats[:, 0] += np.bincount(slot, w, n)
+            self._stats[:, 1] += np.bincount(slot, w * t, n)
+            self._stats[:, 2] += np.bincount(slot, w * fill, n)
+            self._stats[:, 3] += np.bincount(slot, w * t * t, n)
+            self._stats[:, 4] += np.bincount(slot, w * t * fill, n)
+
+            scored = keep & has_fit
+            self._abs_sum += np.bincount(slot[scored], (w_time * np.abs(resid))[scored], n)
+            self._abs_w += np.bincount(slot[scored], w_time[scored], n)
+            seeded = keep & ~has_fit & np.isfinite(delta) & ~emptied
+            self._abs_sum += np.bincount(slot[seeded], (w_time * np.abs(delta))[seeded], n)
+            self._abs_w += np.bincount(slot[seeded], w_time[seeded], n)
+
+            # Hour-of-day profile from consecutive fill increments
+            dt = t - prev_t
+            rated = keep & ~emptied & np.isfinite(delta) & (dt > 0)
+            rate = np.clip(np.divide(delta, dt, out=np.zeros_like(delta), where=rated), 0.0, None)
+            hour = (np.floor(t + self._t0) % HOURS_PER_DAY).astype(np.int64)
+            cell = slot * HOURS_PER_DAY + hour
+            self._hour_sum += np.bincount(cell[rated], (w_time * rate)[rated],
+                                          n * HOURS_PER_DAY).reshape(n, HOURS_PER_DAY)
+            self._hour_w += np.bincount(cell[rated], w_time[rated],
+                                        n * HOURS_PER_DAY).reshape(n, HOURS_PER_DAY)
+
+            last = np.r_[slot[1:] != slot[:-1], True]
+            self._last_t[slot[last]] = t[last]
+            self._last_fill[slot[last]] = fill[last]
+            return int(keep.sum())
+
+    # --- PREDICTION ---
+    def predict(self, full_distance_cm, horizon_hours=0.0, now=None):
+        """Project every bin forward from `now` (epoch seconds).
+
+        Returns a DataFrame indexed by `device_id` with the current fill, the
+        fitted fill rate, hours until the bin reaches `full_distance_cm`, the
+        expected time it becomes full and the fill percentage `horizon_hours`
+        from now.
+        """
+        columns = ['fill_cm', 'fill_pct', 'rate_cm_per_hour', 'hours_to_full',
+                   'full_at', 'fill_pct_at_horizon']
+        with self._lock:
+            if not self._devices:
+                return pd.DataFrame(columns=columns).rename_axis('device_id')
+
+            now = time.time() if now is None else now
+            now_h = now / 3600.0 - self._t0
+            heights = self._heights
+            rate = np.clip(self._params()[1], 0.0, None)
+            profile = self._profile()
+
+            elapsed = np.clip(now_h - self._last_t, 0.0, None)
+            fill_now = np.clip(self._last_fill + rate * elapsed, 0.0, heights)
+            fill_now = np.where(np.isfinite(fill_now), fill_now, 0.0)
+            remaining = (heights - float(full_distance_cm)) - fill_now
+
+            # The profile repeats daily and sums to 24 over a day, so the fill added after k
+            # hours is rate * (24 * whole days + the profile summed over the rest of the day):
+            # solve for the crossing in closed form instead of expanding the whole horizon
+            horizon = int(max(MAX_HORIZON_HOURS, np.ceil(horizon_hours)))
+            hours = (np.floor(now_h + self._t0).astype(np.int64) + np.arange(HOURS_PER_DAY)) % HOURS_PER_DAY
+            day = profile[:, hours]            # Profile from the current hour on, one day
+            day_cum = np.cumsum(day, axis=1)
+            rows = np.arange(len(rate))
+
+            units = np.divide(remaining, rate, out=np.full_like(remaining, np.inf), where=rate > 0)
+            days = np.where(np.isfinite(units), np.maximum(np.ceil(units / HOURS_PER_DAY) - 1, 0), 0)
+            rest = units - days * HOURS_PER_DAY   # In (0, 24]: profile units into the crossing day
+            idx = np.minimum((day_cum < rest[:, None]).sum(axis=1), HOURS_PER_DAY - 1)
+            before = np.where(idx > 0, day_cum[rows, np.maximum(idx - 1, 0)], 0.0)
+            frac = np.divide(rest - before, day[rows, idx],
+                             out=np.zeros_like(remaining), where=day[rows, idx] > 0)
+            crossing = days * HOURS_PER_DAY + idx
+            hours_to_full = np.where(remaining <= 0, 0.0,
+                                     np.where(np.isfinite(units) & (crossing < horizon), crossing + frac, np.inf))
+
+            h = int(np.floor(horizon_hours))
+            whole_days, h_rest = divmod(h, HOURS_PER_DAY)
+            ahead = rate * (whole_days * HOURS_PER_DAY + (day_cum[:, h_rest - 1] if h_rest > 0 else 0.0))
+            if horizon_hours > h:
+                ahead = ahead + rate * day[:, h_rest] * (horizon_hours - h)
+            fill_ahead = np.clip(fill_now + ahead, 0.0, heights)
+
+            full_at = pd.to_datetime(
+                np.where(np.isfinite(hours_to_full), now + hours_to_full * 3600.0, np.nan),
+                unit='s')
+            return pd.DataFrame({
+                'fill_cm': fill_now,
+                'fill_pct': fill_now / heights * 100,
+                'rate_cm_per_hour': rate,
+                'hours_to_full': hours_to_full,
+                'full_at': full_at,
+                'fill_pct_at_horizon': fill_ahead / heights * 100,
+            }, index=pd.Index(self._devices, name='device_id'))
@@ -0,0 +1,447 @@
+"""Pub/Sub -> Firestore ingest writer for the dashboard collections.
+
+Pulls `smartbin-readings` (what `bridge.py` publishes) with streaming pull and
+flow control, splits every `sendTelemetry` payload from the ESP32 into the
+`bin_status`, `gps` and `servo_actions` documents that `app.py` reads (plus one
+`fleet` document per device with its latest position and reading), writes the
+Pis' classification events (`kind=events`) to `events`, and writes
+them in batches through a Firestore `BulkWriter` with retries. Messages are only
+acked once their documents are written; document ids are the bridge's
+`reading_id` attribute (the Pub/Sub message id for older publishers), so
+redelivered or republished readings overwrite rather than duplicate.
+
+    python ingest.py                     # run the writer
+    python ingest.py loadtest -n 5000    # throughput / lag against the emulators
+
+Set PUBSUB_EMULATOR_HOST and FIRESTORE_EMULATOR_HOST to run against the local
+emulators instead of the cloud project.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import pubsub_v1
+from google.cloud.firestore_v1.bulk_writer import BulkRetry, BulkWriterOptions
+
+import analytics
+import queries
+
+
+# --- CONFIG ---
+PROJECT_ID = queries.PROJECT_ID
+TOPIC_ID = "smartbin-readings"
+SUBSCRIPTION_ID = "smartbin-readings-ingest"
+
+MAX_OUTSTANDING_MESSAGES = 2000           # Streaming pull flow control
+MAX_OUTSTANDING_BYTES = 10 * 1024 * 1024
+BATCH_SIZE = 500                          # Messages per BulkWriter flush
+FLUSH_INTERVAL = 1.0                      # ...or after this many seconds
+MAX_WRITE_ATTEMPTS = 5
+
+GPS_MIN_INTERVAL = 30.0   # Unchanged GPS fixes are written at most this often
+GPS_MIN_MOVE_DEG = 1e-5   # ~1 m; smaller moves count as jitter
+BIN_TYPES = analytics.BIN_TYPES
+LAG_WINDOW = 10000
+
+
+# --- PAYLOAD SPLITTING ---
+def split_telemetry(payload, timestamp):
+    """Turn one ESP32 telemetry payload (JSON text or parsed) into its `bin_status` and `gps` documents."""
+    data = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+    device_id = str(data.get("device_id", "unknown"))
+    status = {
+        "device_id": device_id,
+        "distance_cm": data.get("waste_level_cm"),
+        "is_full": bool(data.get("is_full", False)),
+        "last_item": data.get("last_item"),
+        "timestamp": timestamp,
+    }
+    gps = {
+        "device_id": device_id,
+        "latitude": float(data.get("gps_lat", 0.0) or 0.0),
+        "longitude": float(data.get("gps_lng", 0.0) or 0.0),
+        "timestamp": timestamp,
+    }
+    return device_id, status, gps
+
+
+def document_id(message):
+    """The bridge's stable id for the reading, which survives a republish; else the message id."""
+    attributes = getattr(message, "attributes", None) or {}
+    return attributes.get("reading_id") or message.message_id
+
+
+def is_event(message):
+    """A Pi classification event (`AI Model/events.py`) rather than ESP32 telemetry."""
+    attributes = getattr(message, "attributes", None) or {}
+    return attributes.get("kind") == "events"
+
+
+def classification_event(data, timestamp):
+    """(document id, `events` document) for one Pi classification event.
+
+    The id comes from the device and the Pi's own event time, so an event the Pi
+    uploads again after a lost ack overwrites its earlier copy.
+    """
+    device_id = str(data.get("device_id", "unknown"))
+    ts = float(data["ts"])
+    return f"{device_id}-{int(ts * 1e6)}", dict(data, device_id=device_id, ts=ts, received=timestamp)
+
+
+def servo_event(data, device_id, timestamp):
+    """The `servo_actions` document for a disposal the firmware reported, if any.
+
+    Firmware with servo events sends `servo_item`, `servo_opened` and a
+    per-boot `servo_seq` on the telemetry message that follows each disposal.
+    """
+    item = str(data.get("servo_item") or "").strip().lower()
+    if item not in BIN_TYPES:
+        return None
+    return {
+        "device_id": device_id,
+        "bin_type": item,
+        "opened": bool(data.get("servo_opened", True)),
+        "seq": data.get("servo_seq"),
+        "timestamp": timestamp,
+    }
+
+
+def servo_action(status, previous_item):
+    """The `servo_actions` document implied by a change of `last_item`, if any.
+
+    Fallback for firmware without servo events, which only reports the most
+    recent item, so a new disposal is seen as `last_item` changing. The paper
+    lid stays shut while the paper bin is full.
+    """
+    item = (status.get("last_item") or "").strip().lower()
+    if item not in BIN_TYPES or item == previous_item:
+        return None
+    return {
+        "device_id": status["device_id"],
+        "bin_type": item,
+        "opened": not (item == "paper" and status["is_full"]),
+        "timestamp": status["timestamp"],
+    }
+
+
+class TelemetryWriter:
+    """Buffers pulled messages and writes them to Firestore in batches."""
+
+    def __init__(self, db, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Per-device state as of the last successful write; only touched while holding _flush_lock
+        self._last_item = {}
+        self._last_gps = {}
+
+        self.messages = 0
+        self.documents = 0
+        self.failed = 0
+        self.gps_coalesced = 0
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.started = time.monotonic()
+
+    # --- INTAKE ---
+    def __call__(self, message):
+        with self._lock:
+            self._buffer.append(message)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ingest-flush", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    # --- WRITING ---
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        with self._flush_lock:
+            return self._write(batch)
+
+    def _plan(self, batch):
+        """Documents to write for a batch, as (message, [(ref, doc), ...], state updates).
+
+        Per-device state is read here but only committed by `_write` once the
+        message's documents are written, so a nacked and redelivered message is
+        planned exactly as it was the first time.
+        """
+        batch.sort(key=lambda m: m.publish_time.timestamp())
+        planned = []
+        writes_by_id = {}
+        latest_gps = {}
+        latest_status = {}
+        batch_items = {}   # last_item per device as of the previous message in this batch
+        for message in batch:
+            try:
+                timestamp = message.publish_time.timestamp()
+                data = json.loads(message.data.decode("utf-8"))
+                if is_event(message):
+                    event_id, event = classification_event(data, timestamp)
+                else:
+                    device_id, status, gps = split_telemetry(data, timestamp)
+            except (ValueError, UnicodeDecodeError, AttributeError, KeyError, TypeError) as e:
+                print(f"Dropping malformed message {message.message_id}: {e}")
+                message.ack()
+                continue
+            if is_event(message):
+                planned.append((message, [(self.db.collection("events").document(event_id), event)], {}))
+                continue
+
+            doc_id = document_id(message)
+            writes = [(self.db.collection("bin_status").document(doc_id), status)]
+            item = (status.get("last_item") or "").strip().lower()
+            if "servo_seq" in data:
+                action = servo_event(data, device_id, timestamp)
+            elif device_id in batch_items or device_id in self._last_item:
+                action = servo_action(status, batch_items.get(device_id, self._last_item.get(device_id)))
+            else:
+                action = None  # Old firmware, first message seen: nothing to compare against
+            batch_items[device_id] = item
+            if action is not None:
+                writes.append((self.db.collection("servo_actions").document(doc_id), action))
+            updates = {"item": (device_id, item)}
+            planned.append((message, writes, updates))
+            writes_by_id[message.message_id] = (writes, updates)
+
+            if device_id in latest_gps:
+                self.gps_coalesced += 1
+            latest_gps[device_id] = (message, gps)
+            latest_status[device_id] = status
+
+        # Coalesce GPS: one document per device per batch, and none if it hasn't moved
+        for device_id, (message, gps) in latest_gps.items():
+            last = self._last_gps.get(device_id)
+            if last is not None:
+                moved = max(abs(gps["latitude"] - last["latitude"]), abs(gps["longitude"] - last["longitude"]))
+                if moved < GPS_MIN_MOVE_DEG and gps["timestamp"] - last["timestamp"] < GPS_MIN_INTERVAL:
+                    self.gps_coalesced += 1
+                    continue
+            writes, updates = writes_by_id[message.message_id]
+            writes.append((self.db.collection("gps").document(document_id(message)), gps))
+            updates["gps"] = (device_id, gps)
+
+        # The fleet map reads one `fleet` document per device with its latest position and reading
+        for device_id, (message, gps) in latest_gps.items():
+            status = latest_status[device_id]
+            fleet = {
+                "device_id": device_id,
+                "latitude": gps["latitude"],
+                "longitude": gps["longitude"],
+                "distance_cm": status["distance_cm"],
+                "is_full": status["is_full"],
+                "timestamp": status["timestamp"],
+            }
+            writes_by_id[message.message_id][0].append((self.db.collection("fleet").document(device_id), fleet))
+        return planned
+
+    def _write(self, batch):
+        planned = self._plan(batch)
+        if not planned:
+            return 0
+
+        # Only writes Firestore confirmed count: a batch RPC that raises never reports an error per document
+        written_paths = set()
+
+        def on_result(reference, _result, _writer):
+            written_paths.add(reference.path)
+
+        def on_error(failure, _writer):
+            return failure.attempts < MAX_WRITE_ATTEMPTS
+
+        writer = self.db.bulk_writer(options=BulkWriterOptions(retry=BulkRetry.exponential))
+        writer.on_write_result(on_result)
+        writer.on_write_error(on_error)
+        try:
+            for _, writes, _ in planned:
+                for ref, doc in writes:
+                    writer.set(ref, doc)
+            writer.close()  # Flushes and waits for every write, retries included
+        except Exception as e:
+            print(f"Bulk write failed: {e}")
+
+        done = time.time()
+        written = 0
+        lags = []
+        for message, writes, updates in planned:
+            if not all(ref.path in written_paths for ref, _ in writes):
+                self.failed += 1
+                message.nack()
+                continue
+            if "item" in updates:
+                device_id, item = updates["item"]
+                self._last_item[device_id] = item
+            if "gps" in updates:
+                device_id, gps = updates["gps"]
+                self._last_gps[device_id] = gps
+            message.ack()
+            written += len(writes)
+            lags.append(done - message.publish_time.timestamp())
+        with self._lock:
+            self.lags.extend(lags)
+        self.messages += len(planned)
+        self.documents += written
+        return written
+
+    # --- REPORTING ---
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._lock:  # The flush thread appends to the deque
+            lags = np.array(self.lags) if self.lags else np.zeros(1)
+        return {
+            "messages": self.messages,
+            "documents": self.documents,
+            "failed": self.failed,
+            "gps_coalesced": self.gps_coalesced,
+            "msg_per_s": self.messages / elapsed,
+            "lag_p50_s": float(np.percentile(lags, 50)),
+            "lag_p99_s": float(np.percentile(lags, 99)),
+        }
+
+
+def format_stats(stats):
+    return (f"{stats['messages']} msgs ({stats['msg_per_s']:.0f}/s) -> {stats['documents']} docs, "
+            f"{stats['failed']} failed, {stats['gps_coalesced']} GPS coalesced, "
+            f"lag p50 {stats['lag_p50_s'] * 1000:.0f} ms / p99 {stats['lag_p99_s'] * 1000:.0f} ms")
+
+
+def ensure_subscription(project_id, topic_id, subscription_id):
+    publisher = pubsub_v1.PublisherClient()
+    subscriber = pubsub_v1.SubscriberClient()
+    topic_path = publisher.topic_path(project_id, topic_id)
+    subscription_path = subscriber.subscription_path(project_id, subscription_id)
+    try:
+        publisher.create_topic(request={"name": topic_path})
+    except AlreadyExists:
+        pass
+    try:
+        subscriber.create_subscription(request={"name": subscription_path, "topic": topic_path,
+                                                "enable_message_ordering": True})
+    except AlreadyExists:
+        pass
+    return publisher, subscriber, topic_path, subscription_path
+
+
+def subscribe(subscriber, subscription_path, writer):
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=MAX_OUTSTANDING_MESSAGES,
+        max_bytes=MAX_OUTSTANDING_BYTES,
+    )
+    return subscriber.subscribe(subscription_path, callback=writer, flow_control=flow_control)
+
+
+# --- COMMANDS ---
+def run(args):
+    if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ and not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "smart-bin-project-483011-4eaae0f99610.json"
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(args.project, args.subscription)
+    writer = TelemetryWriter(queries.script_client()).start()
+    future = subscribe(subscriber, subscription_path, writer)
+    print(f"Listening on {subscription_path}")
+    try:
+        while True:
+            time.sleep(args.report_every)
+            print(format_stats(writer.stats()))
+    except KeyboardInterrupt:
+        future.cancel()
+        future.result()
+        writer.stop()
+        print(format_stats(writer.stats()))
+
+
+def loadtest(args):
+    if not (os.environ.get("PUBSUB_EMULATOR_HOST") and os.environ.get("FIRESTORE_EMULATOR_HOST")):
+        raise SystemExit("loadtest only runs against the emulators: set PUBSUB_EMULATOR_HOST and FIRESTORE_EMULATOR_HOST")
+
+    publisher, subscriber, topic_path, subscription_path = ensure_subscription(
+        args.project, args.topic, args.subscription)
+    writer = TelemetryWriter(queries.script_client()).start()
+    future = subscribe(subscriber, subscription_path, writer)
+
+    rng = np.random.default_rng(0)
+    started = time.monotonic()
+    publishes = []
+    for i in range(args.messages):
+        payload = {
+            "device_id": f"bin{i % args.devices:03d}",
+            "waste_level_cm": int(rng.integers(3, 30)),
+            "is_full": False,
+            "last_item": BIN_TYPES[int(rng.integers(0, len(BIN_TYPES)))],
+            "gps_lat": 3.1390 + rng.normal(0, 1e-4),
+            "gps_lng": 101.6869 + rng.normal(0, 1e-4),
+        }
+        publishes.append(publisher.publish(topic_path, json.dumps(payload).encode("utf-8")))
+    for p in publishes:
+        p.result()
+    published = time.monotonic() - started
+    print(f"Published {args.messages} messages in {published:.1f}s")
+
+    deadline = time.monotonic() + args.timeout
+    while writer.messages < args.messages and time.monotonic() < deadline:
+        time.sleep(0.5)
+    future.cancel()
+    future.result()
+    writer.stop()
+
+    stats = writer.stats()
+    print(format_stats(stats))
+    if stats["messages"] < args.messages:
+        raise SystemExit(f"Only {stats['messages']}/{args.messages} messages written before timeout")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write smartbin-readings into the dashboard's Firestore collections.")
+    parser.add_argument("--project", default=PROJECT_ID)
+    parser.add_argument("--topic", default=TOPIC_ID)
+    parser.add_argument("--subscription", default=SUBSCRIPTION_ID)
+    sub = parser.add_subparsers(dest="command")
+    run_cmd = sub.add_parser("run", help="Run the ingest writer (default)")
+    run_cmd.add_argument("--report-every", type=float, default=30.0)
+    load_cmd = sub.add_parser("loadtest", help="Measure write throughput and lag against the emulators")
+    load_cmd.add_argument("-n", "--messages", type=int, default=5000)
+    load_cmd.add_argument("--devices", type=int, default=50)
+    load_cmd.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.command == "loadtest":
+        loadtest(args)
+    else:
+        if args.command is None:
+            args.report_every = run_cmd.get_default("report_every")
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Wall-time instrumentation for the dashboard's timing panel."""
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+HISTORY_SIZE = 50
+
+
+class RunTimer:
+    """Times the named phases of one script run."""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class RunHistory:
+    """Process-wide record of run times, shared by all sessions."""
+
+    def __init__(self, size=HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._runs = deque(maxlen=size)
+        self.cold_start = None
+
+    def record(self, seconds):
+        with self._lock:
+            if self.cold_start is None:
+                self.cold_start = seconds
+            self._runs.append(seconds)
+
+    def summary(self):
+        with self._lock:
+            runs = list(self._runs)
+        if not runs:
+            return {'cold_start': self.cold_start, 'runs': 0, 'median': None, 'max': None}
+        return {
+            'cold_start': self.cold_start,
+            'runs': len(runs),
+            'median': statistics.median(runs),
+            'max': max(runs),
+        }
@@ -0,0 +1,159 @@
+"""Firestore queries behind the dashboard KPIs.
+
+Counts are answered with server-side aggregation queries and row fetches use
+`select()` projections, so the dashboard never downloads whole `servo_actions`
+documents just to count them. The filtered counts and log pages need the
+composite indexes in `firestore.indexes.json`; when aggregation is not available
+(older Firestore emulators, missing indexes) the same numbers are computed from
+a projected scan instead, and a warning says why.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from google.api_core.exceptions import GoogleAPICallError
+from google.cloud import firestore
+
+import analytics
+
+# --- CONFIG ---
+PROJECT_ID = "smart-bin-project-483011"
+FIREBASE_KEY_PATH = "smart-bin-project-483011-firebase-adminsdk-fbsvc-1a85500baa.json"
+BIN_TYPES = analytics.BIN_TYPES
+SERVO_LOG_FIELDS = ['timestamp', 'bin_type', 'opened']
+FLEET_FIELDS = ['device_id', 'latitude', 'longitude', 'distance_cm', 'timestamp']
+
+_pool = ThreadPoolExecutor(max_workers=len(BIN_TYPES) + 2, thread_name_prefix="firestore-agg")
+log = logging.getLogger(__name__)
+
+
+def emulator_host():
+    return os.environ.get("FIRESTORE_EMULATOR_HOST")
+
+
+def emulator_client(project_id=PROJECT_ID):
+    # The client picks up FIRESTORE_EMULATOR_HOST itself and skips credentials
+    return firestore.Client(project=project_id)
+
+
+def script_client(key_path=FIREBASE_KEY_PATH):
+    """Firestore client for command-line tools: the emulator if configured, else the service account."""
+    if emulator_host():
+        return emulator_client()
+    import firebase_admin
+    from firebase_admin import credentials, firestore as admin_firestore
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(key_path))
+    return admin_firestore.client()
+
+
+def _count(query):
+    result = query.count(alias="n").get()
+    return int(result[0][0].value)
+
+
+def _servo_window(db, start_ts):
+    return db.collection('servo_actions').where('timestamp', '>=', start_ts)
+
+
+# --- KPI COUNTS ---
+def fetch_servo_kpis(db, start_ts):
+    """Total, accepted and per-bin-type item counts since `start_ts`."""
+    base = _servo_window(db, start_ts)
+    try:
+        jobs = {
+            'total': _pool.submit(_count, base),
+            'accepted': _pool.submit(_count, base.where('opened', '==', True)),
+        }
+        for bin_type in BIN_TYPES:
+            jobs[bin_type] = _pool.submit(_count, base.where('bin_type', 'in', analytics.SPELLINGS_OF[bin_type]))
+        counts = {key: job.result() for key, job in jobs.items()}
+        by_type = {t: counts[t] for t in BIN_TYPES if counts[t]}
+        total, accepted = counts['total'], counts['accepted']
+    except (GoogleAPICallError, AttributeError, NotImplementedError) as e:
+        # Fallback: scan only the two fields the counts need
+        log.warning("servo KPI aggregation failed, scanning instead (missing index? see "
+                    "firestore.indexes.json): %s", e)
+        docs = base.select(['timestamp', 'bin_type', 'opened']).stream()
+        return analytics.servo_kpis(pd.DataFrame([doc.to_dict() for doc in docs]))
+
+    return {
+        'total': total,
+        'accepted': accepted,
+        'rejected': total - accepted,
+        'by_type': by_type,
+    }
+
+
+# --- PROJECTED ROW FETCHES ---
+def fetch_servo_timestamps(db, start_ts):
+    """Timestamps of every servo action since `start_ts`, for the hourly chart."""
+    docs = _servo_window(db, start_ts).order_by('timestamp').select(['timestamp']).stream()
+    return np.fromiter((doc.get('timestamp') for doc in docs), dtype=float)
+
+
+def fetch_servo_log_page(db, start_ts, page_size=15, bin_type=None, opened=None, cursor=None):
+    """One page of the activity log, newest first, projected to the displayed columns.
+
+    The bin type / accepted filters are applied by Firestore (this needs the
+    bin_type/opened + timestamp desc indexes in firestore.indexes.json). Pass the
+    returned cursor back in to get the next (older) page; it is None on the last page.
+    """
+    query = _servo_window(db, start_ts)
+    if bin_type is not None:
+        # Every spelling the KPIs count, so the filtered log shows the same documents
+        query = query.where('bin_type', 'in', analytics.SPELLINGS_OF[bin_type])
+    if opened is not None:
+        query = query.where('opened', '==', opened)
+    query = query.order_by('timestamp', direction=firestore.Query.DESCENDING).select(SERVO_LOG_FIELDS)
+    if cursor is not None:
+        query = query.start_after(cursor)
+
+    # One extra document tells us whether an older page exists
+    snapshots = list(query.limit(page_size + 1).stream())
+    next_cursor = snapshots[page_size - 1] if len(snapshots) > page_size else None
+    data = [doc.to_dict() for doc in snapshots[:page_size]]
+    rows = pd.DataFrame(data, columns=SERVO_LOG_FIELDS) if data else pd.DataFrame(columns=SERVO_LOG_FIELDS)
+    return rows, next_cursor
+
+
+# --- STATUS QUERIES ---
+def fetch_latest(db, collection):
+    """Most recent document of `collection`, or None."""
+    docs = db.collection(collection).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1).stream()
+    for doc in docs:
+        return doc.to_dict()
+    return None
+
+
+def fetch_fleet(db):
+    """Latest position and reading of every bin (one `fleet` document per device, kept by ingest.py)."""
+    docs = db.collection('fleet').select(FLEET_FIELDS).stream()
+    data = [doc.to_dict() for doc in docs]
+    return pd.DataFrame(data, columns=FLEET_FIELDS) if data else pd.DataFrame(columns=FLEET_FIELDS)
+
+
+def fetch_recent_commands(db, limit=20):
+    """Newest downlink commands with their acks (see commands.py)."""
+    docs = db.collection('commands').order_by('issued_at', direction=firestore.Query.DESCENDING).limit(limit).stream()
+    return [doc.to_dict() for doc in docs]
+
+
+def fetch_active_alerts(db, limit=200):
+    """(engine status, active alert documents) as written by alerts.py; status is None if never run.
+
+    The status holds the engine's `heartbeat` and the `full_cm` / `full_soon_hours`
+    it evaluates with.
+    """
+    status = db.collection('engine_status').document('alerts').get()
+    status = (status.to_dict() or {}) if status.exists else None
+    docs = db.collection('alerts').where('state', '==', 'active').limit(limit).stream()
+    return status, [doc.to_dict() for doc in docs]
+
+
+def fetch_bin_history(db, start_ts):
+    docs = db.collection('bin_status').where('timestamp', '>=', start_ts).order_by('timestamp').stream()
+    data = [doc.to_dict() for doc in docs]
+    return pd.DataFrame(data) if data else pd.DataFrame()
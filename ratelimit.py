@@ -0,0 +1,202 @@
+"""Per-device and global token-bucket admission control for the bridge.
+
+Each device gets a bucket of `burst` tokens refilled at `rate` per second; every
+forwarded message takes one token from its device's bucket and one from a
+global bucket. Bucket state lives in flat numpy arrays indexed by a slot per
+device id, so a check is a dict lookup plus a few scalar updates regardless of
+fleet size. What happens to a message that finds an empty bucket depends on
+the overflow policy:
+
+- `drop`     – discard it;
+- `sample`   – forward one in every `sample_every` throttled messages, as long
+               as the global bucket has a token for it;
+- `coalesce` – keep only the device's latest throttled message and forward it
+               once the buckets have a token again (`release()`), so a flooding
+               bin still shows its current state.
+
+Readings that report a disposal (`servo_item`, see `carries_servo_event`) are
+forwarded under every policy: the firmware sends each disposal exactly once,
+so holding one back or dropping it would lose a `servo_actions` row. They
+still take their tokens, overdrawing the buckets if need be.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+# --- CONFIG ---
+DEVICE_RATE = 1.0          # Sustained messages/s per device (firmware sends every ~10 s)
+DEVICE_BURST = 20          # Messages a device may send back-to-back
+GLOBAL_RATE = 2000.0       # Sustained messages/s for the whole bridge
+GLOBAL_BURST = 4000
+SAMPLE_EVERY = 10
+POLICIES = ("drop", "sample", "coalesce")
+INITIAL_SLOTS = 1024
+RELEASE_INTERVAL = 0.25    # Seconds between coalesced-message flushes
+
+
+def carries_servo_event(payload):
+    """True if a reading reports a disposal; a substring check, so no JSON parsing."""
+    return '"servo_item"' in payload
+
+
+class RateLimiter:
+    """Token buckets for every device plus one global bucket."""
+
+    def __init__(self, rate=DEVICE_RATE, burst=DEVICE_BURST, global_rate=GLOBAL_RATE,
+                 global_burst=GLOBAL_BURST, policy="drop", sample_every=SAMPLE_EVERY):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.global_rate = float(global_rate)
+        self.global_burst = float(global_burst)
+        self.policy = policy
+        self.sample_every = sample_every
+
+        self._lock = threading.Lock()
+        self._slots = {}            # device id -> index into the arrays below
+        self._ids = []
+        self._tokens = np.zeros(INITIAL_SLOTS)
+        self._refilled = np.zeros(INITIAL_SLOTS)
+        self._allowed = np.zeros(INITIAL_SLOTS, dtype=np.int64)
+        self._throttled = np.zeros(INITIAL_SLOTS, dtype=np.int64)
+        self._reported = np.zeros(INITIAL_SLOTS, dtype=np.int64)
+        self._pending = {}          # slot -> latest throttled (topic, payload), coalesce only
+
+        self._global_tokens = self.global_burst
+        self._global_refilled = float("-inf")   # Starts full; set on the first message
+        self.global_throttled = 0
+        self.coalesced = 0
+        self.kept = 0               # Over the limit but forwarded for their servo event
+
+    # --- STATE ---
+    def _slot(self, device_id, now):
+        slot = self._slots.get(device_id)
+        if slot is None:
+            slot = len(self._ids)
+            if slot == len(self._tokens):
+                self._grow()
+            self._slots[device_id] = slot
+            self._ids.append(device_id)
+            self._tokens[slot] = self.burst
+            self._refilled[slot] = now
+        return slot
+
+    def _grow(self):
+        size = 2 * len(self._tokens)
+        for name in ("_tokens", "_refilled", "_allowed", "_throttled", "_reported"):
+            old = getattr(self, name)
+            new = np.zeros(size, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _refill(self, slot, now):
+        # `now` is read before taking the lock, so another thread may already be ahead
+        elapsed = now - self._refilled[slot]
+        if elapsed > 0:
+            self._tokens[slot] = min(self._tokens[slot] + elapsed * self.rate, self.burst)
+            self._refilled[slot] = now
+        elapsed = now - self._global_refilled
+        if elapsed > 0:
+            self._global_tokens = min(self._global_tokens + elapsed * self.global_rate, self.global_burst)
+            self._global_refilled = now
+
+    # --- ADMISSION ---
+    def admit(self, device_id, topic, payload, now=None):
+        """True to forward this message now; False if it was dropped or held back."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._slot(device_id, now)
+            self._refill(slot, now)
+            admitted = self._tokens[slot] >= 1 and self._global_tokens >= 1
+            if not admitted and carries_servo_event(payload):
+                self.kept += 1
+                admitted = True
+            if admitted:
+                self._tokens[slot] -= 1
+                self._global_tokens -= 1
+                self._allowed[slot] += 1
+                if self.policy == "coalesce":
+                    # Anything held back is older than this message
+                    self._pending.pop(slot, None)
+                return True
+
+            if self._global_tokens < 1:
+                self.global_throttled += 1
+            self._throttled[slot] += 1
+            if self.policy == "sample":
+                # Only the device bucket is overdrawn by a sample; the global limit still holds
+                if self._throttled[slot] % self.sample_every != 1 % self.sample_every or self._global_tokens < 1:
+                    return False
+                self._global_tokens -= 1
+                return True
+            if self.policy == "coalesce":
+                if slot in self._pending:
+                    self.coalesced += 1
+                self._pending[slot] = (topic, payload)
+            return False
+
+    def release(self, now=None):
+        """Held-back latest messages whose device (and the bridge) have a token again."""
+        if not self._pending:
+            return []
+        now = time.monotonic() if now is None else now
+        released = []
+        with self._lock:
+            for slot in list(self._pending):
+                self._refill(slot, now)
+                if self._tokens[slot] < 1 or self._global_tokens < 1:
+                    continue
+                self._tokens[slot] -= 1
+                self._global_tokens -= 1
+                self._allowed[slot] += 1
+                released.append(self._pending.pop(slot))
+        return released
+
+    def release_every(self, interval, forward):
+        """Forward coalesced messages from a daemon thread as tokens come back."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                for topic, payload in self.release():
+                    forward(topic, payload)
+        thread = threading.Thread(target=loop, name="ratelimit-release", daemon=True)
+        thread.start()
+        return thread
+
+    # --- REPORTING ---
+    def throttled_devices(self, top=10):
+        """(device_id, throttled since the last call) for the worst offenders."""
+        with self._lock:
+            n = len(self._ids)
+            delta = self._throttled[:n] - self._reported[:n]
+            self._reported[:n] = self._throttled[:n]
+            worst = np.flatnonzero(delta)
+            worst = worst[np.argsort(-delta[worst], kind='stable')][:top]
+            return [(self._ids[i], int(delta[i])) for i in worst]
+
+    def stats(self):
+        with self._lock:
+            n = len(self._ids)
+            return {
+                "devices": n,
+                "allowed": int(self._allowed[:n].sum()),
+                "throttled": int(self._throttled[:n].sum()),
+                "global_throttled": self.global_throttled,
+                "pending": len(self._pending),
+                "coalesced": self.coalesced,
+                "kept": self.kept,
+                "state_bytes": sum(a.nbytes for a in (self._tokens, self._refilled, self._allowed,
+                                                      self._throttled, self._reported)),
+            }
+
+
+def format_stats(stats, throttled):
+    line = (f"rate limit: {stats['allowed']} allowed, {stats['throttled']} throttled "
+            f"({stats['global_throttled']} by the global limit), {stats['pending']} held, "
+            f"{stats['kept']} servo events let through, {stats['devices']} devices")
+    if throttled:
+        line += "\n  throttled: " + ", ".join(f"{device} ({count})" for device, count in throttled)
+    return line
@@ -0,0 +1,182 @@
+"""Fleet simulator: N virtual ESP32 bins publishing telemetry to an MQTT broker.
+
+Each bin follows a fill curve with an hour-of-day rhythm, gets emptied when it
+reaches the top, drops items into its compartments (reported as `last_item` plus a servo event,
+like the real firmware does) and reports a jittery GPS fix.
+Payloads match `sendTelemetry()` in `IoT_Code.ino` and go to
+`smartbin/<id>/data`, plus a `sim_sent` wall-clock stamp that the benchmark uses
+to measure latency (the bridge forwards it untouched). Bins also answer downlink
+commands (`commands.py`) on `smartbin/<id>/cmd` and `smartbin/all/cmd` with acks
+on `smartbin/<id>/ack`, like the firmware does.
+
+    python simulator.py --bins 200 --interval 10 --duration 300
+"""
+import argparse
+import heapq
+import json
+import math
+import time
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+
+# --- SIMULATION CONFIG ---
+BIN_HEIGHT_CM = 20
+FULL_DISTANCE_CM = 10         # DISTANCE_THRESHOLD_CM in the firmware
+BASE_LAT, BASE_LNG = 3.1390, 101.6869
+FLEET_SPREAD_DEG = 0.08       # Bins are scattered over roughly 18 km around KL
+GPS_JITTER_DEG = 2e-5
+ITEMS = ("paper", "glass", "aluminium")
+MAX_CLIENTS = 16              # Bins share this many MQTT connections
+
+
+class SimulatedBin:
+    def __init__(self, device_id, rng, speed=1.0):
+        self.device_id = device_id
+        self.rng = rng
+        self.speed = speed
+        self.lat = BASE_LAT + rng.uniform(-FLEET_SPREAD_DEG, FLEET_SPREAD_DEG)
+        self.lng = BASE_LNG + rng.uniform(-FLEET_SPREAD_DEG, FLEET_SPREAD_DEG)
+        self.fill_cm = rng.uniform(0, BIN_HEIGHT_CM - FULL_DISTANCE_CM)
+        self.rate_cm_per_hour = rng.uniform(0.05, 0.6)
+        self.items_per_hour = rng.uniform(2, 20)
+        self.peak_hour = rng.uniform(8, 20)
+        self.last_item = "None"
+        self.servo_seq = 0
+        self.boot_id = int(rng.integers(1, 2**31))
+        self.seq = 0
+        self.full_distance_cm = FULL_DISTANCE_CM
+        self.last_t = time.time()
+
+    def _activity(self, t):
+        # Busier around the bin's peak hour, quiet overnight
+        hour = (t / 3600.0) % 24
+        return 0.3 + 1.4 * math.exp(-((hour - self.peak_hour) ** 2) / 18.0)
+
+    def step(self, now):
+        hours = (now - self.last_t) / 3600.0 * self.speed
+        self.last_t = now
+        activity = self._activity(now)
+        self.fill_cm += self.rate_cm_per_hour * activity * hours
+        if self.fill_cm >= BIN_HEIGHT_CM - 2:
+            self.fill_cm = self.rng.uniform(0, 1)  # Collected
+        dropped = self.rng.random() < 1 - math.exp(-self.items_per_hour * activity * hours)
+        if dropped:
+            self.last_item = ITEMS[self.rng.integers(0, len(ITEMS))]
+            self.servo_seq += 1
+
+        distance = max(2, int(round(BIN_HEIGHT_CM - self.fill_cm + self.rng.normal(0, 0.4))))
+        self.seq += 1
+        payload = {
+            "device_id": self.device_id,
+            "boot_id": self.boot_id,
+            "seq": self.seq,
+            "waste_level_cm": distance,
+            "is_full": distance < self.full_distance_cm,
+            "last_item": self.last_item,
+            "gps_lat": self.lat + self.rng.normal(0, GPS_JITTER_DEG),
+            "gps_lng": self.lng + self.rng.normal(0, GPS_JITTER_DEG),
+            "servo_seq": self.servo_seq,
+            "sim_sent": time.time(),
+        }
+        if dropped:
+            payload["servo_item"] = self.last_item
+            payload["servo_opened"] = not (self.last_item == "paper" and payload["is_full"])
+        return payload
+
+
+    def handle(self, command):
+        """Ack for a downlink command, mirroring `processCommand()` in the firmware."""
+        ack = {"id": command.get("id"), "device_id": self.device_id, "ok": True}
+        cmd, args = command.get("cmd"), command.get("args") or {}
+        if cmd == "set_threshold":
+            value = int(args.get("distance_cm", 0))
+            if 2 <= value <= 100:
+                self.full_distance_cm = value
+            else:
+                ack.update(ok=False, error="out of range")
+        elif cmd == "open_lid" and args.get("bin") not in ITEMS:
+            ack.update(ok=False, error="unknown bin")
+        elif cmd not in ("ping", "send_telemetry", "set_threshold", "open_lid"):
+            ack.update(ok=False, error="unknown command")
+        ack["threshold_cm"] = self.full_distance_cm
+        return ack
+
+
+def answer_commands(clients, fleet):
+    """Each client acks commands for the bins that publish through it."""
+    for i, client in enumerate(clients):
+        bins = {b.device_id: b for b in fleet[i::len(clients)]}
+
+        def on_message(c, userdata, msg, bins=bins):
+            try:
+                command = json.loads(msg.payload)
+            except ValueError:
+                return
+            target = msg.topic.split("/")[1]
+            for b in (bins.values() if target == "all" else [bins[target]] if target in bins else []):
+                c.publish(f"smartbin/{b.device_id}/ack", json.dumps(b.handle(command)), qos=1)
+
+        client.on_message = on_message
+        client.subscribe("smartbin/+/cmd", qos=1)
+
+
+def connect_clients(count, host, port):
+    clients = []
+    for i in range(count):
+        client = mqtt.Client()
+        client.connect(host, port, 60)
+        client.loop_start()
+        clients.append(client)
+    return clients
+
+
+def run(bins=10, interval=10.0, duration=60.0, host="localhost", port=1883, speed=1.0, seed=0, qos=0):
+    """Publish telemetry for `bins` devices, each every ~`interval` seconds. Returns messages sent."""
+    rng = np.random.default_rng(seed)
+    fleet = [SimulatedBin(f"bin{i:04d}", rng, speed) for i in range(bins)]
+    clients = connect_clients(min(bins, MAX_CLIENTS), host, port)
+    answer_commands(clients, fleet)
+
+    # Stagger first reports so the fleet doesn't publish in lockstep
+    start = time.time()
+    schedule = [(start + rng.uniform(0, interval), i) for i in range(bins)]
+    heapq.heapify(schedule)
+    sent = 0
+    try:
+        while schedule:
+            due, i = heapq.heappop(schedule)
+            if due - start > duration:
+                break
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            b = fleet[i]
+            payload = json.dumps(b.step(time.time()))
+            clients[i % len(clients)].publish(f"smartbin/{b.device_id}/data", payload, qos=qos)
+            sent += 1
+            heapq.heappush(schedule, (due + interval * rng.uniform(0.8, 1.2), i))
+    finally:
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of smart bins publishing over MQTT.")
+    parser.add_argument("--bins", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between reports per bin")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated hours per real hour for fill curves")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sent = run(args.bins, args.interval, args.duration, args.host, args.port, args.speed, args.seed)
+    print(f"Published {sent} messages from {args.bins} bins")
+
+
+if __name__ == "__main__":
+    main()
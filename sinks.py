@@ -0,0 +1,388 @@
+"""Pluggable destinations for the readings `bridge.py` receives over MQTT.
+
+Every sink sits behind its own `SinkRunner`: a bounded queue per worker thread,
+each worker handing the sink batches of readings. Readings are partitioned by
+device, so one device's readings are always written by the same worker, in
+order. The MQTT callback only enqueues, so a slow or failing sink fills (and
+then drops from) its own queues without delaying the others. A `Route`
+restricts a sink to some devices and/or MQTT topic patterns.
+
+- `PubSubSink` – the `smartbin-readings` topic that `ingest.py` consumes;
+- `FileSink` – a local time-series file, one JSON line per reading, per UTC day;
+- `EventFileSink` – the same for the Pis' classification events, in their own files;
+- `MqttSink` – a second broker, e.g. a site-local or backup one.
+"""
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+
+# --- CONFIG ---
+QUEUE_SIZE = 10000         # Readings buffered per sink before new ones are dropped
+BATCH_SIZE = 100           # Readings per write...
+BATCH_INTERVAL = 0.0       # ...or whatever arrived within this many seconds (0: what's queued)
+POLL_INTERVAL = 0.5        # Idle workers check for shutdown this often
+MAX_WRITE_ATTEMPTS = 3
+RETRY_DELAY = 0.5          # Doubled after each failed attempt
+PUBLISH_TIMEOUT = 30.0
+THROUGHPUT_WINDOW = 60.0   # Seconds of history behind the msg/s figure
+
+
+class Reading:
+    __slots__ = ("topic", "device_id", "payload", "received")
+
+    def __init__(self, topic, payload, received=None):
+        self.topic = topic
+        self.device_id = device_from_topic(topic)
+        self.payload = payload
+        self.received = time.time() if received is None else received
+
+    @property
+    def reading_id(self):
+        """Stable across retries and redeliveries, unlike the id a destination assigns on each write.
+
+        Telemetry is numbered by the firmware (`boot_id`, `seq`) and Pi events carry
+        the time they happened (`ts`). Payloads with neither (older firmware) fall back
+        to the receive time, which only this bridge's own retries reuse.
+        """
+        if '"seq"' in self.payload or '"ts"' in self.payload:
+            try:
+                data = json.loads(self.payload)
+                if "boot_id" in data and "seq" in data:
+                    return f"{self.device_id}-{int(data['boot_id'])}-{int(data['seq'])}"
+                if isinstance(data.get("ts"), (int, float)):
+                    return f"{self.device_id}-{int(data['ts'] * 1e6)}"
+            except (ValueError, TypeError, AttributeError):
+                pass
+        return f"{self.device_id}-{int(self.received * 1e6)}"
+
+
+def device_from_topic(topic):
+    """`smartbin/<id>/data` -> `<id>`."""
+    parts = topic.split("/")
+    return parts[1] if len(parts) >= 3 else None
+
+
+class Route:
+    """Which readings a sink accepts; `None` for either criterion means "any"."""
+
+    def __init__(self, devices=None, topics=None):
+        self.devices = frozenset(devices) if devices is not None else None
+        self.topics = tuple(topics) if topics is not None else None
+
+    def matches(self, reading):
+        if self.devices is not None and reading.device_id not in self.devices:
+            return False
+        if self.topics is not None and not any(mqtt.topic_matches_sub(t, reading.topic) for t in self.topics):
+            return False
+        return True
+
+
+# --- SINKS ---
+class PartialWriteError(Exception):
+    """Part of a batch failed; only `failed` needs to be written again."""
+
+    def __init__(self, failed, cause):
+        super().__init__(f"{len(failed)} readings failed: {cause}")
+        self.failed = failed
+
+
+class Sink:
+    """A destination for batches of readings; `write()` raises to report a failed batch."""
+
+    name = "sink"
+
+    def write(self, readings):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PubSubSink(Sink):
+    """Publishes each reading with a `reading_id` attribute, which ingest uses as its
+    document id, so a reading published twice (e.g. after a timeout) is still one
+    document, and a `kind` attribute (the last MQTT topic level: `data`, `events`)
+    so ingest can tell telemetry from Pi classification events. With `ordered`, the
+    device id is the ordering key (the publisher must have message ordering enabled)."""
+
+    name = "pubsub"
+
+    def __init__(self, publisher, topic_path, ordered=False):
+        self.publisher = publisher
+        self.topic_path = topic_path
+        self.ordered = ordered
+
+    def write(self, readings):
+        # The client batches publishes itself; wait so failures count against this batch
+        futures = []
+        for r in readings:
+            kwargs = {"reading_id": r.reading_id, "kind": r.topic.rsplit("/", 1)[-1]}
+            if self.ordered and r.device_id:
+                kwargs["ordering_key"] = r.device_id
+            futures.append((r, self.publisher.publish(self.topic_path, r.payload.encode("utf-8"), **kwargs)))
+        failed, error = [], None
+        for r, future in futures:
+            if future is None:
+                continue
+            try:
+                future.result(timeout=PUBLISH_TIMEOUT)
+            except Exception as e:
+                failed.append(r)
+                error = e
+        if failed:
+            if self.ordered:
+                # A failed publish pauses its ordering key until resumed
+                for device_id in {r.device_id for r in failed if r.device_id}:
+                    self.publisher.resume_publish(self.topic_path, device_id)
+            raise PartialWriteError(failed, error)
+
+
+class FileSink(Sink):
+    """Appends readings to `<directory>/readings-YYYY-MM-DD.jsonl`."""
+
+    name = "file"
+    prefix = "readings"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, ts):
+        day = datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc).date()
+        return os.path.join(self.directory, f"{self.prefix}-{day.isoformat()}.jsonl")
+
+    def timestamp(self, reading, data):
+        """The time whose UTC day picks the file."""
+        return reading.received
+
+    def write(self, readings):
+        lines = {}
+        for r in readings:
+            try:
+                data = json.loads(r.payload)
+            except ValueError:
+                data = r.payload
+            record = {"received": round(r.received, 3), "topic": r.topic, "data": data}
+            lines.setdefault(self.path_for(self.timestamp(r, data)), []).append(json.dumps(record) + "\n")
+        with self._lock:
+            for path, chunk in lines.items():
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(chunk)
+
+
+class EventFileSink(FileSink):
+    """Appends Pi classification events to `<directory>/events-YYYY-MM-DD.jsonl`.
+
+    Events can reach the bridge days late (the Pi uploads its backlog after an
+    outage), so they are filed by the day they happened, not the day they arrived.
+    """
+
+    name = "events"
+    prefix = "events"
+
+    def timestamp(self, reading, data):
+        ts = data.get("ts") if isinstance(data, dict) else None
+        return ts if isinstance(ts, (int, float)) else reading.received
+
+
+class MqttSink(Sink):
+    """Republishes readings on the same topic (optionally prefixed) to another broker."""
+
+    name = "mqtt"
+
+    def __init__(self, host, port=1883, topic_prefix="", qos=0):
+        self.topic_prefix = topic_prefix
+        self.qos = qos
+        self.client = mqtt.Client()
+        self.client.connect_async(host, port, 60)
+        self.client.loop_start()
+
+    def write(self, readings):
+        for r in readings:
+            info = self.client.publish(self.topic_prefix + r.topic, r.payload, qos=self.qos)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                raise RuntimeError(f"publish failed: {mqtt.error_string(info.rc)}")
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+# --- RUNNERS ---
+class SinkRunner:
+    """Bounded queues + worker pool in front of one sink, partitioned by device."""
+
+    def __init__(self, sink, route=None, workers=1, queue_size=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL, name=None):
+        self.sink = sink
+        self.name = name or sink.name
+        self.route = route
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+
+        self._queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self._recent = deque()  # (finished_at, count) per delivered batch
+        self.started = time.monotonic()
+
+    # --- INTAKE ---
+    def offer(self, reading):
+        """Queue `reading` if the route accepts it; never blocks the caller."""
+        if self.route is not None and not self.route.matches(reading):
+            return False
+        partition = hash(reading.device_id) % len(self._queues) if len(self._queues) > 1 else 0
+        try:
+            self._queues[partition].put_nowait(reading)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(self._queues[i],), name=f"sink-{self.name}-{i}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Drain what is queued, then stop the workers and close the sink."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.sink.close()
+
+    # --- WRITING ---
+    def _next_batch(self, q):
+        try:
+            batch = [q.get(timeout=POLL_INTERVAL)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, q):
+        while True:
+            batch = self._next_batch(q)
+            if not batch:
+                if self._stop.is_set():
+                    return
+                continue
+            self._deliver(batch)
+
+    def _deliver(self, batch):
+        delay = RETRY_DELAY
+        pending = batch
+        for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+            try:
+                self.sink.write(pending)
+                pending = []
+                break
+            except PartialWriteError as e:
+                pending, error = e.failed, e  # Retry only what failed
+            except Exception as e:
+                error = e
+            if attempt == MAX_WRITE_ATTEMPTS or self._stop.is_set():
+                print(f"Sink {self.name}: dropping {len(pending)} readings after {attempt} attempts: {error}")
+                with self._lock:
+                    self.failed += len(pending)
+                break
+            time.sleep(delay)
+            delay *= 2
+        delivered = len(batch) - len(pending)
+        if not delivered:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.delivered += delivered
+            self.batches += 1
+            self._recent.append((now, delivered))
+            while self._recent and self._recent[0][0] < now - THROUGHPUT_WINDOW:
+                self._recent.popleft()
+
+    # --- REPORTING ---
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            window = min(THROUGHPUT_WINDOW, max(now - self.started, 1e-9))
+            recent = sum(n for t, n in self._recent if t >= now - THROUGHPUT_WINDOW)
+            return {
+                "sink": self.name,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "queued": sum(q.qsize() for q in self._queues),
+                "batches": self.batches,
+                "msg_per_s": recent / window,
+            }
+
+
+class FanOut:
+    """Hands every reading to each runner whose route accepts it."""
+
+    def __init__(self, runners):
+        self.runners = list(runners)
+        self.received = 0
+        self._lock = threading.Lock()   # Called from the MQTT thread and the coalesce-release thread
+
+    def __call__(self, topic, payload):
+        with self._lock:
+            self.received += 1
+        reading = Reading(topic, payload)
+        for runner in self.runners:
+            runner.offer(reading)
+
+    def start(self):
+        for runner in self.runners:
+            runner.start()
+        return self
+
+    def stop(self, timeout=None):
+        for runner in self.runners:
+            runner.stop(timeout)
+
+    def stats(self):
+        return [runner.stats() for runner in self.runners]
+
+    def report_every(self, interval, printer=print):
+        """Print per-sink stats from a daemon thread every `interval` seconds."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                printer(format_stats(self.received, self.stats()))
+        thread = threading.Thread(target=loop, name="sink-report", daemon=True)
+        thread.start()
+        return thread
+
+
+def format_stats(received, stats):
+    lines = [f"{received} readings received"]
+    for s in stats:
+        lines.append(f"  {s['sink']:>8}: {s['delivered']} delivered ({s['msg_per_s']:.1f}/s), "
+                     f"{s['queued']} queued, {s['dropped']} dropped, {s['failed']} failed, "
+                     f"{s['batches']} batches")
+    return "\n".join(lines)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the repo root and in "AI Model/", not in an installed package
+sys.path[:0] = [ROOT, os.path.join(ROOT, "AI Model")]
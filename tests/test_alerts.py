@@ -0,0 +1,86 @@
+import pytest
+
+from alerts import AlertEngine
+
+T0 = 1.7e9
+
+
+def rules(events, state="active"):
+    return [e["rule"] for e in events if e["state"] == state]
+
+
+@pytest.fixture
+def engine():
+    return AlertEngine(full_cm=10, warning_cm=15, hysteresis_cm=2, stale_after=300, full_soon_hours=6)
+
+
+def test_full_clears_only_past_the_hysteresis_band(engine):
+    assert rules(engine.observe("bin01", 9, T0)) == ["full"]
+    assert engine.observe("bin01", 11, T0 + 10) == []       # Within 2 cm: still full
+    assert engine.observe("bin01", 12, T0 + 20) == []
+    events = engine.observe("bin01", 13, T0 + 30)
+    assert rules(events, "cleared") == ["full"]
+    assert rules(events) == ["warning"]
+
+
+def test_warning_band(engine):
+    assert rules(engine.observe("bin01", 14, T0)) == ["warning"]
+    assert engine.observe("bin01", 16, T0 + 10) == []
+    assert rules(engine.observe("bin01", 18, T0 + 20), "cleared") == ["warning"]
+
+
+def test_alert_ids_are_stable_from_raise_to_clear(engine):
+    raised = engine.observe("bin01", 9, T0)[0]
+    cleared = [e for e in engine.observe("bin01", 25, T0 + 10) if e["rule"] == "full"][0]
+    assert cleared["id"] == raised["id"]
+    assert engine.active_count() == 0
+
+
+def test_out_of_order_readings_are_ignored(engine):
+    engine.observe("bin01", 20, T0 + 10)
+    assert engine.observe("bin01", 5, T0) == []
+    assert engine.out_of_order == 1
+
+
+def test_offline_raised_by_tick_and_cleared_by_data(engine):
+    engine.observe("bin01", 20, T0)
+    assert engine.tick(now=T0 + 100) == []
+    assert rules(engine.tick(now=T0 + 301)) == ["offline"]
+    assert engine.tick(now=T0 + 400) == []                  # Raised once
+    assert rules(engine.observe("bin01", 20, T0 + 500), "cleared") == ["offline"]
+
+
+def test_full_soon_from_fill_rate(engine):
+    # 0.5 cm every 5 minutes: 6 cm/h once the average settles
+    events = []
+    for i in range(40):
+        events += engine.observe("bin01", 40 - i * 0.5, T0 + i * 300)
+    assert "full_soon" in rules(events)
+    soon = next(e for e in events if e["rule"] == "full_soon")
+    assert soon["value"] <= 6
+
+
+def test_full_soon_clears_above_the_wider_limit(engine):
+    engine.observe("bin01", 40, T0)
+    state = engine.devices["bin01"]
+    state.rate = 4.0                                      # 30 cm to go: 7.5 h
+    assert "full_soon" not in rules(engine._evaluate(state, 40, T0 + 1))
+    state.rate = 6.0                                      # 5 h
+    assert rules(engine._evaluate(state, 40, T0 + 2)) == ["full_soon"]
+    state.rate = 4.0                                      # 7.5 h: under the 9 h clear limit
+    assert engine._evaluate(state, 40, T0 + 3) == []
+    state.rate = 3.0                                      # 10 h
+    assert rules(engine._evaluate(state, 40, T0 + 4), "cleared") == ["full_soon"]
+
+
+def test_restore_keeps_alerts_active(engine):
+    engine.restore([{"device_id": "bin01", "rule": "full", "raised_at": T0}])
+    assert engine.observe("bin01", 11, T0 + 10) == []
+    cleared = engine.observe("bin01", 30, T0 + 20)
+    assert cleared[0]["id"] == f"bin01-full-{int(T0 * 1000)}"
+
+
+def test_missing_distance_only_refreshes_the_timestamp(engine):
+    engine.observe("bin01", None, T0)
+    assert engine.devices["bin01"].distance is None
+    assert engine.tick(now=T0 + 100) == []
@@ -0,0 +1,81 @@
+"""Benchmarks for the pure transforms in analytics.py on large synthetic data.
+
+    python -m pytest tests/test_analytics_bench.py --benchmark-compare=0001 --benchmark-compare-fail=min:50%
+    python -m pytest tests/test_analytics_bench.py --benchmark-save=baseline   # new baseline
+
+The baseline lives in `.benchmarks/`. `--benchmark-compare-fail` fails the run
+if any transform got slower than that baseline by more than the threshold, so
+it can gate changes as the fleet grows. BENCH_ROWS / BENCH_BINS change the data
+size (default 1M rows, 5000 bins); compare only runs of the same size.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+
+ROWS = int(os.environ.get("BENCH_ROWS", 1_000_000))
+BINS = int(os.environ.get("BENCH_BINS", 5000))
+
+
+def synthetic_history(rows, bins, rng):
+    ts = np.sort(rng.uniform(0, 365 * 86400, rows)) + 1.7e9
+    return pd.DataFrame({
+        'timestamp': ts,
+        'device_id': pd.Categorical.from_codes(rng.integers(0, bins, rows), [f"bin{i:04d}" for i in range(bins)]),
+        'distance_cm': rng.integers(2, 30, rows).astype(float),
+    })
+
+
+def synthetic_actions(rows, rng):
+    return pd.DataFrame({
+        'timestamp': rng.uniform(0, 365 * 86400, rows) + 1.7e9,
+        'bin_type': np.array(["Paper", "aluminium", "glass", None], dtype=object)[rng.integers(0, 4, rows)],
+        'opened': rng.random(rows) < 0.8,
+    })
+
+
+def synthetic_bins(bins, rng):
+    return pd.DataFrame({
+        'name': [f"bin{i:04d}" for i in range(bins)],
+        'distance_cm': rng.integers(2, 30, bins).astype(float),
+        'height_cm': np.full(bins, 30.0),
+        'hours_to_full': rng.exponential(24, bins),
+        'fill_pct_at_horizon': rng.uniform(0, 100, bins),
+    })
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    history = synthetic_history(ROWS, BINS, rng)
+    actions = synthetic_actions(ROWS, rng)
+    fleet = synthetic_bins(BINS, rng)
+    return {
+        'history': history,
+        'actions': actions,
+        'typed_actions': analytics.typed_servo_actions(actions),
+        'fleet': fleet,
+        'overview': analytics.bin_overview(fleet, 10, 15, 6),
+    }
+
+
+CASES = {
+    "typed_history": lambda d: analytics.typed_history(d['history']),
+    "typed_servo_actions": lambda d: analytics.typed_servo_actions(d['actions']),
+    "servo_kpis": lambda d: analytics.servo_kpis(d['typed_actions']),
+    "hourly_activity": lambda d: analytics.hourly_activity(d['actions']['timestamp'].to_numpy()),
+    "activity_log[15]": lambda d: analytics.activity_log(d['actions'], limit=15),
+    "status": lambda d: analytics.status(d['history']['distance_cm'].to_numpy(), 10, 15),
+    "fill_pct": lambda d: analytics.fill_pct(d['history']['distance_cm'].to_numpy(), 30.0),
+    "bin_overview": lambda d: analytics.bin_overview(d['fleet'], 10, 15, 6),
+    "route_plan": lambda d: analytics.route_plan(d['overview']),
+}
+
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_transform(benchmark, data, case):
+    benchmark.group = f"analytics ({ROWS:,} rows, {BINS:,} bins)"
+    benchmark(CASES[case], data)
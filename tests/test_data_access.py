@@ -0,0 +1,99 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import data_access
+from data_access import DataCache
+
+
+def test_hit_after_miss():
+    cache = DataCache()
+    calls = []
+    load = lambda: calls.append(1) or "value"
+    assert cache.get_or_load("k", load, ttl=60) == "value"
+    assert cache.get_or_load("k", load, ttl=60) == "value"
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_expired_entry_is_reloaded():
+    cache = DataCache()
+    values = iter([1, 2])
+    assert cache.get_or_load("k", lambda: next(values), ttl=0) == 1
+    assert cache.get_or_load("k", lambda: next(values), ttl=0) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache = DataCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_load("k", slow_load, 60)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", slow_load, 60)))
+                 for _ in range(4)]
+    for t in followers:
+        t.start()
+    while cache.stats()['coalesced'] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_load_errors_reach_the_caller_and_are_not_cached():
+    cache = DataCache()
+
+    def fail():
+        raise RuntimeError("firestore down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("k", fail, ttl=60)
+    assert cache.get_or_load("k", lambda: "ok", ttl=60) == "ok"
+
+
+def test_least_recently_used_is_evicted_over_budget():
+    cache = DataCache(max_bytes=2500)
+    block = lambda: np.zeros(1000, dtype=np.uint8)
+    cache.get_or_load("a", block, 60)
+    cache.get_or_load("b", block, 60)
+    cache.get_or_load("a", block, 60)    # "a" is now the most recently used
+    cache.get_or_load("c", block, 60)
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] <= 2500
+    misses = cache.stats()['misses']
+    cache.get_or_load("a", block, 60)
+    assert cache.stats()['misses'] == misses
+    cache.get_or_load("b", block, 60)
+    assert cache.stats()['misses'] == misses + 1
+
+
+def test_oversized_values_are_not_cached():
+    cache = DataCache(max_bytes=100)
+    cache.get_or_load("big", lambda: np.zeros(1000, dtype=np.uint8), 60)
+    assert cache.stats()['entries'] == 0
+
+
+def test_invalidate():
+    cache = DataCache()
+    cache.get_or_load("k", lambda: 1, 60)
+    assert cache.invalidate("k")
+    assert not cache.invalidate("k")
+    assert cache.get_or_load("k", lambda: 2, 60) == 2
+
+
+def test_window_starts_share_a_bucket():
+    assert data_access.bucket(1000) == data_access.bucket(1019) == 960.0
+    assert data_access.bucket(1020) == 1020.0
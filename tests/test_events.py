@@ -0,0 +1,117 @@
+import json
+import sys
+import types
+import zlib
+
+import pytest
+
+# Thumbnails are off in these tests, so OpenCV is never called; the Pi image has it
+sys.modules.setdefault("cv2", types.ModuleType("cv2"))
+from events import QUEUE_SIZE, EventLog  # noqa: E402
+
+
+class FakeInfo:
+    def __init__(self, published):
+        self.published = published
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self.published
+
+
+class FakeClient:
+    def __init__(self, published=True, connected=True):
+        self.published = published
+        self.connected = connected
+        self.payloads = []
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=0):
+        self.payloads.append(payload)
+        return FakeInfo(self.published)
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = EventLog("bin01", "localhost", path=str(tmp_path / "events.db"), max_events=5,
+                   thumbnail_size=0, batch_events=3, batch_bytes=10_000)
+    log._client = FakeClient()
+    return log
+
+
+def store(log, db, count, start=0):
+    log._store(db, [({"ts": 1000.0 + i, "outcome": "accepted", "n": i}, None) for i in range(start, start + count)])
+
+
+def batch(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+def test_ring_keeps_the_newest_events(log):
+    db = log._open()
+    store(log, db, 8)
+    kept = [json.loads(body)["n"] for body, in db.execute("SELECT body FROM events ORDER BY id")]
+    assert kept == [3, 4, 5, 6, 7]
+
+
+def test_pending_counts_what_is_not_uploaded(log):
+    db = log._open()
+    store(log, db, 2)
+    uploaded_id, count, size, oldest = log._pending(db)
+    assert (uploaded_id, count, oldest) == (0, 2, 1000.0)
+    assert size == sum(len(body) for body, in db.execute("SELECT body FROM events"))
+
+
+def test_upload_advances_the_cursor_one_batch_at_a_time(log):
+    db = log._open()
+    store(log, db, 4)
+    assert log._upload(db, 0)
+    assert [e["n"] for e in batch(log._client.payloads[0])] == [0, 1, 2]
+    uploaded_id, count, _, _ = log._pending(db)
+    assert count == 1
+    assert log._upload(db, uploaded_id)
+    assert log._pending(db)[1] == 0
+    assert (log.uploaded, log.batches) == (4, 2)
+
+
+def test_unacked_batch_is_sent_again(log):
+    db = log._open()
+    store(log, db, 2)
+    log._client = FakeClient(published=False)
+    assert not log._upload(db, 0)
+    assert log._pending(db)[:2] == (0, 2)
+    log._client = FakeClient(connected=False)
+    assert not log._upload(db, 0)
+    assert log._client.payloads == []
+
+
+def test_batch_is_capped_by_bytes_but_sends_at_least_one(log):
+    db = log._open()
+    store(log, db, 3)
+    log.batch_bytes = 1
+    assert log._upload(db, 0)
+    assert len(batch(log._client.payloads[0])) == 1
+
+
+def test_uploads_resume_after_overwrite(log):
+    db = log._open()
+    store(log, db, 3)
+    log._upload(db, 0)
+    store(log, db, 6, start=3)     # Overwrites uploaded and pending events alike
+    uploaded_id, count, _, _ = log._pending(db)
+    assert count == 5
+    log._upload(db, uploaded_id)
+    assert [e["n"] for e in batch(log._client.payloads[-1])] == [4, 5, 6]
+
+
+def test_record_drops_when_the_queue_is_full(log):
+    for _ in range(QUEUE_SIZE):
+        log.record({"outcome": "accepted"})
+    log.record({"outcome": "accepted"})
+    assert log.dropped == 1
+    event, frame = log._queue.get_nowait()
+    assert event["device_id"] == "bin01" and "ts" in event and frame is None
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fleet_map
+
+
+def random_points(n, rng, lat=(42.0, 42.2), lon=(-71.2, -71.0)):
+    return rng.uniform(*lat, n), rng.uniform(*lon, n)
+
+
+def test_truncated_key_is_the_parent_cell():
+    lat, lon = random_points(1000, np.random.default_rng(0))
+    keys = fleet_map.geokey(lat, lon)
+    for level in (0, 5, 13, 25):
+        assert np.array_equal(fleet_map.truncate(keys, level), fleet_map.interleave(*fleet_map.cell_xy(lat, lon, level)))
+
+
+@pytest.mark.parametrize("level", [4, 10, 16, 22])
+def test_covering_ranges_contain_every_point_in_the_box(level):
+    rng = np.random.default_rng(level)
+    bbox = (42.05, -71.15, 42.12, -71.04)
+    lat, lon = random_points(5000, rng)
+    inside = (lat >= bbox[0]) & (lat <= bbox[2]) & (lon >= bbox[1]) & (lon <= bbox[3])
+    keys = fleet_map.truncate(fleet_map.geokey(lat[inside], lon[inside]), level)
+
+    lo, hi = fleet_map._covering_ranges(bbox, level)
+    assert len(lo) <= fleet_map.MAX_QUERY_CELLS
+    assert np.all(lo[1:] >= hi[:-1])                 # Sorted, non-overlapping
+    covered = (keys[:, None] >= lo) & (keys[:, None] < hi)
+    assert covered.any(axis=1).all()
+
+
+def test_covering_a_single_cell():
+    lo, hi = fleet_map._covering_ranges((42.1, -71.1, 42.1, -71.1), fleet_map.MAX_LEVEL)
+    assert len(lo) == 1 and int(hi[0] - lo[0]) == 1
+    assert lo[0] == fleet_map.geokey(42.1, -71.1)
+
+
+def fleet(n, rng):
+    lat, lon = random_points(n, rng)
+    return pd.DataFrame({
+        'device_id': [f"bin{i:04d}" for i in range(n)],
+        'latitude': lat,
+        'longitude': lon,
+        'status': pd.Categorical(rng.choice(["ok", "warning", "full"], n)),
+        'fill_pct': rng.uniform(0, 100, n),
+    })
+
+
+@pytest.mark.parametrize("zoom", [10, 13, 18])
+def test_query_matches_a_scan(zoom):
+    rng = np.random.default_rng(zoom)
+    index = fleet_map.FleetIndex(fleet(3000, rng))
+    bbox = (42.06, -71.13, 42.09, -71.08)
+    found = index.query(bbox, zoom)
+    clusters = index.clusters(fleet_map.zoom_level(zoom))
+    expected = clusters[clusters['latitude'].between(bbox[0], bbox[2])
+                        & clusters['longitude'].between(bbox[1], bbox[3])]
+    assert sorted(found['key']) == sorted(expected['key'])
+
+
+def test_clusters_count_every_bin_once():
+    rng = np.random.default_rng(1)
+    index = fleet_map.FleetIndex(fleet(2000, rng))
+    for level in (0, 8, 16, fleet_map.MAX_LEVEL):
+        clusters = index.clusters(level)
+        assert clusters['count'].sum() == 2000
+        assert clusters['key'].is_monotonic_increasing
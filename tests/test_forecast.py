@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecast import FillForecaster
+
+T0 = 1.7e9
+HEIGHT = 30.0
+
+
+def readings(hours, distance, device_id="bin01"):
+    return pd.DataFrame({
+        'timestamp': T0 + np.asarray(hours, dtype=float) * 3600,
+        'distance_cm': distance,
+        'device_id': device_id,
+    })
+
+
+def steady_fill(hours=10.0, rate=1.0, device_id="bin01"):
+    """A bin filling at `rate` cm/h from empty, read every 10 minutes."""
+    t = np.arange(0, hours + 1e-9, 1 / 6)
+    return readings(t, HEIGHT - rate * t, device_id)
+
+
+def test_steady_fill_rate_and_hours_to_full():
+    forecaster = FillForecaster(HEIGHT)
+    forecaster.update(steady_fill())
+    row = forecaster.predict(10, horizon_hours=5, now=T0 + 10 * 3600).loc["bin01"]
+    assert row['fill_cm'] == pytest.approx(10, abs=1e-6)
+    assert row['rate_cm_per_hour'] == pytest.approx(1, rel=1e-6)
+    # 20 cm of fill to go at 1 cm/h
+    assert row['hours_to_full'] == pytest.approx(10, rel=1e-6)
+    assert row['fill_pct_at_horizon'] == pytest.approx(15 / HEIGHT * 100, rel=1e-6)
+
+
+def test_already_full_and_not_filling():
+    forecaster = FillForecaster(HEIGHT)
+    forecaster.update(pd.concat([readings([0, 1, 2], [5, 5, 5], "full"),
+                                 readings([0, 1, 2], [20, 20, 20], "idle")]))
+    df = forecaster.predict(10, now=T0 + 2 * 3600)
+    assert df.loc["full", 'hours_to_full'] == 0
+    assert np.isinf(df.loc["idle", 'hours_to_full'])
+    assert pd.isna(df.loc["idle", 'full_at'])
+
+
+def test_emptying_starts_a_new_cycle():
+    forecaster = FillForecaster(HEIGHT)
+    forecaster.update(steady_fill(rate=2.0))
+    # Collected at hour 11, then filling at 1 cm/h again
+    t = np.arange(11, 21 + 1e-9, 1 / 6)
+    forecaster.update(readings(t, HEIGHT - (t - 11)))
+    row = forecaster.predict(10, now=T0 + 21 * 3600).loc["bin01"]
+    assert row['rate_cm_per_hour'] == pytest.approx(1, rel=1e-3)
+
+
+def test_update_only_folds_in_newer_rows():
+    forecaster = FillForecaster(HEIGHT)
+    history = steady_fill()
+    assert forecaster.update(history) == len(history)
+    assert forecaster.update(history) == 0
+    assert forecaster.newest() == pytest.approx(history['timestamp'].max())
+    assert forecaster.update(readings([11], [HEIGHT - 11])) == 1
+
+
+def test_newest_before_any_reading():
+    forecaster = FillForecaster(HEIGHT)
+    assert forecaster.newest() is None
+    assert forecaster.update(readings([0], [np.nan])) == 0
+    assert forecaster.predict(10).empty
+
+
+def test_bins_are_independent():
+    forecaster = FillForecaster(HEIGHT, bin_heights={"tall": 60.0})
+    forecaster.update(pd.concat([steady_fill(rate=1.0, device_id="slow"),
+                                 steady_fill(rate=2.0, device_id="fast")]))
+    forecaster.update(readings(np.arange(0, 10.01, 1 / 6), 60.0 - np.arange(0, 10.01, 1 / 6), "tall"))
+    df = forecaster.predict(10, now=T0 + 10 * 3600)
+    assert df.loc["slow", 'hours_to_full'] == pytest.approx(10, rel=1e-6)
+    assert df.loc["fast", 'hours_to_full'] == pytest.approx(0, abs=1e-6)
+    assert df.loc["tall", 'hours_to_full'] == pytest.approx(40, rel=1e-6)
@@ -0,0 +1,88 @@
+import pytest
+
+from ratelimit import RateLimiter, carries_servo_event
+
+READING = '{"device_id":"bin01","waste_level_cm":12}'
+DISPOSAL = '{"device_id":"bin01","waste_level_cm":12,"servo_item":"glass","servo_seq":3}'
+
+
+def flood(limiter, count, now=0.0, device_id="bin01", payload=READING):
+    return [limiter.admit(device_id, f"smartbin/{device_id}/data", payload, now=now) for _ in range(count)]
+
+
+def test_burst_then_drop():
+    limiter = RateLimiter(rate=1, burst=3)
+    assert flood(limiter, 5) == [True, True, True, False, False]
+    assert limiter.stats()['throttled'] == 2
+
+
+def test_bucket_refills_at_rate():
+    limiter = RateLimiter(rate=2, burst=2)
+    flood(limiter, 2)
+    assert flood(limiter, 2, now=0.5) == [True, False]
+    assert flood(limiter, 3, now=10.0) == [True, True, False]
+
+
+def test_devices_have_separate_buckets():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert flood(limiter, 2, device_id="a") == [True, False]
+    assert flood(limiter, 1, device_id="b") == [True]
+    assert limiter.throttled_devices() == [("a", 1)]
+    assert limiter.throttled_devices() == []   # Only what changed since the last report
+
+
+def test_global_bucket_limits_the_fleet():
+    limiter = RateLimiter(rate=1, burst=10, global_rate=1, global_burst=3)
+    admitted = [limiter.admit(f"bin{i}", "t", READING, now=0.0) for i in range(5)]
+    assert admitted == [True, True, True, False, False]
+    assert limiter.stats()['global_throttled'] == 2
+
+
+def test_sample_forwards_one_in_n():
+    limiter = RateLimiter(rate=0.001, burst=1, policy="sample", sample_every=3)
+    assert flood(limiter, 7) == [True, True, False, False, True, False, False]
+
+
+def test_coalesce_keeps_only_the_latest():
+    limiter = RateLimiter(rate=1, burst=1, policy="coalesce")
+    flood(limiter, 1)
+    for n in range(3):
+        assert not limiter.admit("bin01", "t", f"reading {n}", now=0.0)
+    assert limiter.release(now=0.5) == []
+    assert limiter.release(now=1.0) == [("t", "reading 2")]
+    assert limiter.stats()['coalesced'] == 2
+    assert limiter.stats()['pending'] == 0
+
+
+def test_admitted_message_supersedes_held_one():
+    limiter = RateLimiter(rate=1, burst=1, policy="coalesce")
+    flood(limiter, 2)
+    assert limiter.admit("bin01", "t", "newer", now=1.0)
+    assert limiter.release(now=5.0) == []
+
+
+@pytest.mark.parametrize("policy", ["drop", "sample", "coalesce"])
+def test_servo_events_are_never_held_back(policy):
+    limiter = RateLimiter(rate=0.001, burst=1, global_rate=0.001, global_burst=1, policy=policy)
+    flood(limiter, 1)
+    assert flood(limiter, 5, payload=DISPOSAL) == [True] * 5
+    assert limiter.stats()['kept'] == 5
+    assert limiter.stats()['pending'] == 0
+
+
+def test_carries_servo_event():
+    assert carries_servo_event(DISPOSAL)
+    assert not carries_servo_event(READING)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        RateLimiter(policy="queue")
+
+
+def test_state_grows_past_initial_slots():
+    limiter = RateLimiter(rate=1, burst=1)
+    for i in range(3000):
+        assert limiter.admit(f"bin{i}", "t", READING, now=0.0)
+    assert limiter.stats()['devices'] == 3000
+    assert not limiter.admit("bin0", "t", READING, now=0.0)
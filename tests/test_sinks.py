@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+import sinks
+from sinks import FanOut, PartialWriteError, Reading, Sink, SinkRunner
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(sinks, "RETRY_DELAY", 0.0)
+
+
+class FlakySink(Sink):
+    """Fails the readings listed in `failures`, one entry per write call."""
+
+    name = "flaky"
+
+    def __init__(self, failures=(), error=None):
+        self.failures = list(failures)
+        self.error = error
+        self.writes = []
+
+    def write(self, readings):
+        self.writes.append([r.payload for r in readings])
+        if self.error is not None:
+            raise self.error
+        failing = set(self.failures.pop(0)) if self.failures else set()
+        failed = [r for r in readings if r.payload in failing]
+        if failed:
+            raise PartialWriteError(failed, "quota")
+
+
+def batch(*payloads):
+    return [Reading("smartbin/bin01/data", p) for p in payloads]
+
+
+def test_partial_failure_retries_only_the_failed_readings():
+    sink = FlakySink(failures=[{"b", "c"}, {"c"}])
+    runner = SinkRunner(sink)
+    runner._deliver(batch("a", "b", "c"))
+    assert sink.writes == [["a", "b", "c"], ["b", "c"], ["c"]]
+    assert runner.stats()['delivered'] == 3
+    assert runner.stats()['failed'] == 0
+
+
+def test_gives_up_after_max_attempts():
+    sink = FlakySink(error=ConnectionError("unreachable"))
+    runner = SinkRunner(sink)
+    runner._deliver(batch("a", "b"))
+    assert len(sink.writes) == sinks.MAX_WRITE_ATTEMPTS
+    assert runner.stats()['failed'] == 2
+    assert runner.stats()['delivered'] == 0
+
+
+def test_partly_delivered_batch_counts_both():
+    sink = FlakySink(failures=[{"b"}] * sinks.MAX_WRITE_ATTEMPTS)
+    runner = SinkRunner(sink)
+    runner._deliver(batch("a", "b"))
+    assert (runner.stats()['delivered'], runner.stats()['failed']) == (1, 1)
+
+
+def test_no_retry_once_stopping():
+    sink = FlakySink(error=ConnectionError("unreachable"))
+    runner = SinkRunner(sink)
+    runner._stop.set()
+    runner._deliver(batch("a"))
+    assert len(sink.writes) == 1
+
+
+def test_full_queue_drops_instead_of_blocking():
+    runner = SinkRunner(FlakySink(), queue_size=2)
+    assert [runner.offer(r) for r in batch("a", "b", "c")] == [True, True, False]
+    assert runner.stats()['dropped'] == 1
+
+
+def test_workers_deliver_and_stop_drains():
+    sink = FlakySink()
+    runner = SinkRunner(sink, workers=2).start()
+    fanout = FanOut([runner])
+    for i in range(50):
+        fanout(f"smartbin/bin{i % 5}/data", str(i))
+    runner.stop(timeout=5)
+    assert sorted(int(p) for w in sink.writes for p in w) == list(range(50))
+
+
+def test_fanout_counts_from_several_threads():
+    fanout = FanOut([])
+    threads = [threading.Thread(target=lambda: [fanout("smartbin/bin01/data", "{}") for _ in range(2000)])
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fanout.received == 8000
+
+
+def test_reading_id_survives_redelivery():
+    payload = '{"device_id":"bin01","boot_id":7,"seq":42}'
+    first = Reading("smartbin/bin01/data", payload, received=1.0)
+    again = Reading("smartbin/bin01/data", payload, received=99.0)
+    assert first.reading_id == again.reading_id == "bin01-7-42"
+
+
+def test_reading_id_falls_back_to_receive_time():
+    assert Reading("smartbin/bin01/data", '{"waste_level_cm":3}', received=2.5).reading_id == "bin01-2500000"
+    assert Reading("smartbin/pi01/events", '{"ts":3.25}', received=9.0).reading_id == "pi01-3250000"